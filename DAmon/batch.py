@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+
+from loguru import logger
+
+BATCH_FORMATS = ['openai', 'anthropic']
+MANIFEST_SUFFIX = ".manifest.jsonl"
+# Anthropic requires an output limit on every request
+ANTHROPIC_MAX_TOKENS = 8192
+# Chunk metadata kept in the manifest so that results can be exported without re-parsing
+CHUNK_METADATA_FIELDS = ["chunk_index", "page_number", "slide_index", "row_start", "row_end"]
+
+
+def default_manifest_path(requests_path: str) -> str:
+    """Returns the manifest path that belongs to a batch requests file."""
+    base, _ = os.path.splitext(requests_path)
+    return f"{base}{MANIFEST_SUFFIX}"
+
+
+def make_custom_id(file_path: str, chunk: dict, model_name: str, prompt: str) -> str:
+    """
+    Returns a stable request ID for a chunk: the same file, chunk, model and prompt always
+    give the same ID, so a batch can be re-submitted and its results ingested in any order.
+    """
+    key = json.dumps([os.path.abspath(file_path), chunk["chunk_index"], model_name,
+                      hashlib.sha256(prompt.encode('utf-8')).hexdigest()])
+    return f"damon-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}"
+
+
+def provider_model(model_name: str) -> str:
+    """Strips the litellm provider prefix (e.g. "openai/gpt-4o-mini" -> "gpt-4o-mini")."""
+    return model_name.split("/", 1)[1] if "/" in model_name else model_name
+
+
+def batch_request(custom_id: str, model_name: str, prompt: str, batch_format: str = "openai") -> dict:
+    """Returns one line of a provider batch file for prompt."""
+    messages = [{"role": "user", "content": prompt}]
+    if batch_format == "openai":
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": provider_model(model_name), "messages": messages, "response_format": {"type": "json_object"}},
+        }
+    if batch_format == "anthropic":
+        return {
+            "custom_id": custom_id,
+            "params": {"model": provider_model(model_name), "max_tokens": ANTHROPIC_MAX_TOKENS, "messages": messages},
+        }
+    raise ValueError(f"Unsupported batch format: {batch_format}")
+
+
+class BatchRequestWriter:
+    """
+    Writes provider batch requests to a JSONL file and, next to it, a manifest that maps
+    every custom ID back to its file and chunk.
+    """
+
+    def __init__(self, path: str, model_name: str, batch_format: str = "openai", manifest_path: str = None):
+        if batch_format not in BATCH_FORMATS:
+            raise ValueError(f"Unsupported batch format: {batch_format}")
+        self.path = path
+        self.manifest_path = manifest_path or default_manifest_path(path)
+        self.model_name = model_name
+        self.batch_format = batch_format
+        self.requests_written = 0
+        self._seen = set()
+        output_dir = os.path.dirname(path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        self._requests = open(path, 'w', encoding='utf-8')
+        self._manifest = open(self.manifest_path, 'w', encoding='utf-8')
+
+    def add(self, file_path: str, chunk: dict, prompt: str, num_qa_pairs: int = None):
+        """Adds the request for one chunk; num_qa_pairs is the file's limit, applied on ingest."""
+        custom_id = make_custom_id(file_path, chunk, self.model_name, prompt)
+        if custom_id in self._seen:
+            return
+        self._seen.add(custom_id)
+        self._requests.write(json.dumps(batch_request(custom_id, self.model_name, prompt, self.batch_format), ensure_ascii=False) + "\n")
+        entry = {"custom_id": custom_id, "file_path": file_path, "model": self.model_name, "num_qa_pairs": num_qa_pairs}
+        entry.update({field: chunk[field] for field in CHUNK_METADATA_FIELDS if field in chunk})
+        self._manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.requests_written += 1
+
+    def close(self):
+        self._requests.close()
+        self._manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_manifest(path: str) -> list[dict]:
+    """Reads a batch manifest, in request order."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_batch_result(record: dict) -> dict:
+    """
+    Normalises one line of an OpenAI or Anthropic batch results file to
+    {"custom_id", "content", "prompt_tokens", "completion_tokens", "error"}.
+    """
+    result = {"custom_id": record.get("custom_id"), "content": None, "prompt_tokens": 0, "completion_tokens": 0, "error": None}
+    if "response" in record or ("error" in record and "result" not in record):
+        # OpenAI: {"response": {"status_code": 200, "body": <chat completion>}, "error": null}
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            result["error"] = record.get("error") or (response.get("body") or {}).get("error") or f"HTTP {response.get('status_code')}"
+            return result
+        body = response.get("body") or {}
+        choices = body.get("choices") or []
+        result["content"] = (choices[0].get("message") or {}).get("content") if choices else None
+        usage = body.get("usage") or {}
+        result["prompt_tokens"] = usage.get("prompt_tokens", 0) or 0
+        result["completion_tokens"] = usage.get("completion_tokens", 0) or 0
+    elif "result" in record:
+        # Anthropic: {"result": {"type": "succeeded", "message": {"content": [{"type": "text", "text": ...}]}}}
+        outcome = record["result"] or {}
+        if outcome.get("type") != "succeeded":
+            result["error"] = outcome.get("error") or outcome.get("type")
+            return result
+        message = outcome.get("message") or {}
+        result["content"] = "".join(block.get("text", "") for block in message.get("content") or [] if block.get("type") == "text")
+        usage = message.get("usage") or {}
+        result["prompt_tokens"] = usage.get("input_tokens", 0) or 0
+        result["completion_tokens"] = usage.get("output_tokens", 0) or 0
+    else:
+        result["error"] = "Unrecognised batch result format"
+    return result
+
+
+def read_batch_results(path: str) -> dict:
+    """Reads a batch results file into a dict of custom ID -> normalised result."""
+    results = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                result = parse_batch_result(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable line {line_number} of {path}")
+                continue
+            results[result["custom_id"]] = result
+    return results
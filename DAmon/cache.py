@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "damon", "llm_responses.sqlite")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of validated LLM extraction results.
+
+    Entries are evicted when they are older than max_age seconds, and the least recently
+    used entries are dropped once there are more than max_entries. With refresh=True,
+    lookups always miss but new results are still stored, which rebuilds stale entries.
+    With read_only=True, an existing cache is opened for lookups only: nothing is evicted,
+    stored or marked as used.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = None, max_age: float = None, refresh: bool = False,
+                 read_only: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.refresh = refresh
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if read_only:
+            # Without a write-ahead log nobody is writing, and the database is opened as immutable:
+            # a read-only open of a WAL database would otherwise create its -wal and -shm files
+            immutable = "" if os.path.exists(f"{path}-wal") else "&immutable=1"
+            uri = f"{pathlib.Path(path).resolve().as_uri()}?mode=ro{immutable}"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, created_at REAL, accessed_at REAL, value TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, num_qa_pairs: int, text: str) -> str:
+        """Builds the cache key from the model, the rendered prompt, num_qa and the source text."""
+        return _sha256(json.dumps([model_name, _sha256(prompt), num_qa_pairs, _sha256(text)]))
+
+    def get(self, key: str):
+        """Returns the cached Q&A pairs for key, or None on a miss."""
+        if self.refresh:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age is not None and row[1] + self.max_age < now:
+                if not self.read_only:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            if not self.read_only:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, model_name: str, qa_pairs: list[dict]):
+        """
+        Stores the Q&A pairs for key. Empty results (e.g. every pair failed validation) are
+        not stored, so the chunk is extracted again on the next run.
+        """
+        if not qa_pairs or self.read_only:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, created_at, accessed_at, value) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, now, now, json.dumps(qa_pairs, ensure_ascii=False)),
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """Drops expired entries and, above max_entries, the least recently used ones."""
+        with self._lock:
+            removed = 0
+            if self.max_age is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)
+                ).rowcount
+            if self.max_entries is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+        if removed:
+            logger.debug(f"Evicted {removed} entries from LLM response cache {self.path}")
+
+    def close(self):
+        """Evicts over-limit entries and closes the database."""
+        if not self.read_only:
+            self.evict()
+        with self._lock:
+            self._conn.close()
+        logger.info(f"LLM response cache: {self.hits} hits, {self.misses} misses ({self.path})")
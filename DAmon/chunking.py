@@ -0,0 +1,75 @@
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate: roughly one token per CJK character
+    and one token per four other characters.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii) // 4 + 1
+
+
+def _split_oversized(segment: dict, max_tokens: int, count_tokens) -> list[dict]:
+    """Splits a single segment that is larger than max_tokens into roughly even pieces."""
+    text = segment["text"]
+    tokens = count_tokens(text)
+    piece_chars = max(1, int(len(text) * max_tokens / tokens))
+    pieces = []
+    for start in range(0, len(text), piece_chars):
+        piece = dict(segment)
+        piece["text"] = text[start:start + piece_chars]
+        pieces.append(piece)
+    return pieces
+
+
+def chunk_segments(segments, max_tokens: int, overlap_tokens: int = 0, count_tokens=estimate_tokens):
+    """
+    Groups parser segments (pages, slides, paragraphs or rows) into chunks of at most
+    max_tokens estimated tokens, yielding chunk dicts lazily.
+
+    Each segment is a dict with a "text" key and optional "page_number"/"slide_index".
+    A chunk carries the page/slide of its first new (non-overlap) segment. With
+    overlap_tokens > 0, trailing segments of the previous chunk that fit in the overlap
+    budget are repeated at the start of the next chunk.
+    """
+    current = []  # list of (segment, tokens, is_overlap)
+    current_tokens = 0
+    chunk_index = 0
+
+    def _emit():
+        first_new = next(seg for seg, _, is_overlap in current if not is_overlap)
+        return {
+            "text": "\n".join(seg["text"] for seg, _, _ in current),
+            "page_number": first_new.get("page_number"),
+            "slide_index": first_new.get("slide_index"),
+            "chunk_index": chunk_index,
+        }
+
+    def _overlap_tail():
+        tail, tail_tokens = [], 0
+        for seg, tokens, _ in reversed(current):
+            if tail_tokens + tokens > overlap_tokens:
+                break
+            tail.insert(0, (seg, tokens, True))
+            tail_tokens += tokens
+        return tail, tail_tokens
+
+    for segment in segments:
+        if not segment["text"].strip():
+            continue
+        tokens = count_tokens(segment["text"])
+        pieces = [segment] if tokens <= max_tokens else _split_oversized(segment, max_tokens, count_tokens)
+        for piece in pieces:
+            piece_tokens = tokens if piece is segment else count_tokens(piece["text"])
+            has_new = any(not is_overlap for _, _, is_overlap in current)
+            if has_new and current_tokens + piece_tokens > max_tokens:
+                yield _emit()
+                chunk_index += 1
+                current, current_tokens = _overlap_tail() if overlap_tokens else ([], 0)
+                # Drop overlap that would leave no room for the new segment
+                while current and current_tokens + piece_tokens > max_tokens:
+                    _, dropped_tokens, _ = current.pop(0)
+                    current_tokens -= dropped_tokens
+            current.append((piece, piece_tokens, False))
+            current_tokens += piece_tokens
+
+    if any(not is_overlap for _, _, is_overlap in current):
+        yield _emit()
@@ -3,7 +3,8 @@ from loguru import logger
 import os
 from dotenv import load_dotenv
 
-from .core import process_documents
+from .cache import DEFAULT_CACHE_PATH
+from .journal import default_journal_path
 from . import __version__
 
 # Load environment variables from .env file
@@ -23,21 +24,127 @@ def cli():
     pass
 
 
+# Options shared by the commands that extract Q&A (process, watch and serve)
+MODEL_OPTIONS = [
+    click.option('--model', 'model_names', multiple=True, type=str,
+                 help='The litellm model name to use for Q&A extraction (e.g., "gpt-4", "claude-3-opus-20240229"). Repeat to spread requests over several models, optionally weighted as "model=weight".'),
+    click.option('--fallback-model', 'fallback_models', multiple=True, type=str,
+                 help='Model used only while every --model deployment is throttled or down. Can be repeated.'),
+    click.option('--model-pool', 'model_pool_path', type=click.Path(exists=True, dir_okay=False), default=None,
+                 help='JSON file describing a pool of deployments (model, weight, fallback, rpm, tpm, litellm_params) to route requests over.'),
+]
+OUTPUT_OPTIONS = [
+    click.option('--output', 'output_path', required=True, type=click.Path(),
+                 help='Path to the output file or directory.'),
+    click.option('--export', 'export_format', type=click.Choice(['jsonl', 'csv', 'parquet']), default='jsonl',
+                 help='Output dataset format.'),
+]
+LLM_OPTIONS = [
+    click.option('--num-qa', 'num_qa_pairs', type=int, default=None,
+                 help='Number of Q&A pairs to extract. LLM will be prompted to extract this many, and output will be truncated if more are returned.'),
+    click.option('--concurrency', 'concurrency', type=click.IntRange(min=1), default=1,
+                 help='Maximum number of LLM requests in flight at once. Output keeps the input order.'),
+    click.option('--rpm', 'requests_per_minute', type=click.IntRange(min=1), default=None,
+                 help='Limit LLM requests per minute (across all concurrent workers).'),
+    click.option('--tpm', 'tokens_per_minute', type=click.IntRange(min=1), default=None,
+                 help='Limit estimated prompt tokens per minute (across all concurrent workers).'),
+    click.option('--stream', 'stream', is_flag=True,
+                 help='Stream LLM responses, parse the Q&A pairs as they are generated and stop each generation once the requested --num-qa pairs have arrived.'),
+    click.option('--chunk-tokens', 'chunk_tokens', type=click.IntRange(min=1), default=None,
+                 help='Split documents by page, slide, paragraph or row into chunks of at most this many estimated tokens. Default: one chunk per document.'),
+    click.option('--chunk-overlap', 'chunk_overlap', type=click.IntRange(min=0), default=0,
+                 help='Estimated tokens of trailing context repeated at the start of the next chunk.'),
+    click.option('--cache-path', 'cache_path', type=click.Path(dir_okay=False), default=DEFAULT_CACHE_PATH, show_default=True,
+                 envvar='DAMON_CACHE_PATH', help='SQLite file used to cache LLM responses between runs.'),
+    click.option('--no-cache', 'no_cache', is_flag=True, help='Bypass the LLM response cache entirely.'),
+    click.option('--refresh-cache', 'refresh_cache', is_flag=True,
+                 help='Ignore cached LLM responses but store the new ones.'),
+    click.option('--cache-max-entries', 'cache_max_entries', type=click.IntRange(min=1), default=100000, show_default=True,
+                 help='Maximum number of cached responses; the least recently used are evicted.'),
+    click.option('--cache-max-age', 'cache_max_age_days', type=click.FloatRange(min=0), default=30, show_default=True,
+                 help='Maximum age of cached responses, in days.'),
+]
+RUN_OPTIONS = [
+    click.option('--parse-workers', 'parse_workers', type=click.IntRange(min=0), default=1,
+                 help='Number of processes that parse documents ahead of the LLM stage. 0 uses all CPU cores. Default: parse in the main process.'),
+    click.option('--metrics-json', 'metrics_path', type=click.Path(dir_okay=False), default=None,
+                 help='Write a JSON run summary (per-stage timings, per-file stats, tokens, retries, estimated cost) to this path.'),
+    click.option('--metrics-prom', 'prometheus_path', type=click.Path(dir_okay=False), default=None,
+                 help='Write run metrics in the Prometheus textfile-collector format to this path.'),
+    click.option('--csv-batch-tokens', 'csv_batch_tokens', type=click.IntRange(min=1), default=None,
+                 help='Read CSV files lazily in batches of rows of at most this many estimated tokens, each with the header row, and extract every batch separately. Keeps memory flat on very large CSV exports.'),
+    click.option('--pack-tokens', 'pack_tokens', type=click.IntRange(min=1), default=None,
+                 help='Pack consecutive small documents or chunks, up to this many estimated tokens of text, into one LLM request and split the answer back per file. Saves the prompt overhead on corpora of small files.'),
+]
+EXTRACTION_OPTIONS = MODEL_OPTIONS + OUTPUT_OPTIONS + LLM_OPTIONS + RUN_OPTIONS
+
+
+def extraction_options(f):
+    """Applies EXTRACTION_OPTIONS to a command."""
+    for option in reversed(EXTRACTION_OPTIONS):
+        f = option(f)
+    return f
+
+
+def serving_options(f):
+    """Applies the model and LLM options, which configure a long-lived Pipeline, to a command."""
+    for option in reversed(MODEL_OPTIONS + LLM_OPTIONS):
+        f = option(f)
+    return f
+
+
+def extraction_settings(model_names, fallback_models, model_pool_path, no_cache, cache_path, cache_max_age_days,
+                        parse_workers=1, **options) -> dict:
+    """Turns the values of EXTRACTION_OPTIONS into keyword arguments for process_documents."""
+    from .router import ModelRouter
+
+    if not model_names and not model_pool_path:
+        raise click.UsageError("Either --model or --model-pool is required.")
+    router = None
+    if model_pool_path:
+        router = ModelRouter.from_file(model_pool_path)
+    elif len(model_names) > 1 or fallback_models or "=" in model_names[0]:
+        router = ModelRouter.from_specs(model_names, fallback_models)
+    options.update(
+        litellm_model_name=router.name if router is not None else model_names[0],
+        router=router,
+        cache_path=None if no_cache else cache_path,
+        cache_max_age=cache_max_age_days * 86400,
+        parse_workers=parse_workers or os.cpu_count(),
+    )
+    return options
+
+
 @cli.command()
 @click.option('--input', 'input_path', required=True, type=click.Path(exists=True),
               help='Path to a single file or a directory to scan.')
 @click.option('--format', 'input_format', type=click.Choice(['auto', 'csv', 'pdf', 'doc', 'ppt']), default='auto',
               help='Specify input file format. "auto" attempts to detect.')
-@click.option('--model', 'litellm_model_name', required=True, type=str,
-              help='The litellm model name to use for Q&A extraction (e.g., "gpt-4", "claude-3-opus-20240229").')
-@click.option('--output', 'output_path', required=True, type=click.Path(),
-              help='Path to the output file or directory.')
-@click.option('--export', 'export_format', type=click.Choice(['jsonl', 'csv', 'parquet']), default='jsonl',
-              help='Output dataset format.')
-@click.option('--num-qa', 'num_qa_pairs', type=int, default=None,
-              help='Number of Q&A pairs to extract. LLM will be prompted to extract this many, and output will be truncated if more are returned.')
+@extraction_options
+@click.option('--journal', 'journal_path', type=click.Path(dir_okay=False), default=None,
+              help='Append each completed file and its Q&A rows to this progress journal. Defaults to <output>.journal.jsonl when --resume or --incremental is used.')
+@click.option('--resume', is_flag=True,
+              help='Skip files already completed in the journal and re-export their journaled rows, continuing an interrupted run.')
+@click.option('--incremental', is_flag=True,
+              help='Skip files already completed in the journal and export only new or changed files.')
+@click.option('--dedup-chunks', 'dedup_chunks', is_flag=True,
+              help='Do not send chunks that are near-duplicates of an earlier chunk (e.g. revisions of the same manual) to the LLM.')
+@click.option('--dedup-qa', 'dedup_qa', is_flag=True,
+              help='Drop near-duplicate Q&A rows before export.')
+@click.option('--dedup-threshold', 'dedup_threshold', type=click.FloatRange(min=0, max=1), default=0.85, show_default=True,
+              help='Estimated Jaccard similarity at which two texts count as near-duplicates.')
+@click.option('--batch-submit', 'batch_submit_path', type=click.Path(dir_okay=False), default=None,
+              help='Do not call the LLM; write every prompt to this JSONL file for a provider batch job, plus a manifest (<file>.manifest.jsonl) for `damon ingest-batch`.')
+@click.option('--batch-format', 'batch_format', type=click.Choice(['openai', 'anthropic']), default='openai', show_default=True,
+              help='Request format of the --batch-submit file.')
+@click.option('--dry-run', 'dry_run', is_flag=True,
+              help='Parse and chunk the documents and count the prompt tokens locally, then report per-file tokens, context-window overflows, estimated cost and ETA. Nothing is sent to the LLM or written.')
+@click.option('--plan-json', 'plan_path', type=click.Path(dir_okay=False), default=None,
+              help='With --dry-run, write the full plan (per-file tokens, overflows, cost, ETA) to this path as JSON.')
+@click.option('--seconds-per-request', 'seconds_per_request', type=click.FloatRange(min=0), default=None,
+              help='With --dry-run, average LLM request latency assumed for the ETA. Default: derived from the expected completion length.')
 @click.option('--verbose', is_flag=True, help='Enable verbose logging for this command.')
-def process(input_path, input_format, litellm_model_name, output_path, export_format, num_qa_pairs, verbose):
+def process(input_path, input_format, journal_path, resume, incremental, dry_run, plan_path, seconds_per_request, verbose, **options):
     """
     Process documents to extract Q&A content.
     """
@@ -52,37 +159,197 @@ def process(input_path, input_format, litellm_model_name, output_path, export_fo
         logger.add(lambda msg: click.echo(msg, err=True), level="INFO", format="{time} | {level} | {message}")
         logger.enable("DataArragimon")
 
-    # Load the prompt template after logger is configured
-    from .core import load_prompt_template
+    # Load the prompt template after logger is configured. The core module (and its LLM
+    # dependencies) is only imported by the commands that need it.
+    from .core import load_prompt_template, process_documents
     load_prompt_template()
+    settings = extraction_settings(**options)
+
+    if (resume or incremental) and journal_path is None:
+        journal_path = default_journal_path(settings["output_path"])
+    if settings["batch_submit_path"] and settings["router"] is not None:
+        raise click.UsageError("--batch-submit needs a single --model; batch jobs cannot be routed over a model pool.")
+    if dry_run and settings["batch_submit_path"]:
+        raise click.UsageError("--dry-run and --batch-submit cannot be combined; a dry run writes no files.")
+
+    plan = None
+    if dry_run:
+        from .planning import RunPlan
+        router = settings["router"]
+        models = [(d.model, d.weight) for d in router.primary] if router is not None else [(settings["litellm_model_name"], 1.0)]
+        plan = RunPlan(models, settings["concurrency"], settings["requests_per_minute"], settings["tokens_per_minute"],
+                       seconds_per_request)
 
     logger.info(f"Starting document processing for: {input_path}")
-    logger.info(f"Using model: {litellm_model_name}")
-    logger.info(f"Exporting to: {output_path} in {export_format} format")
+    logger.info(f"Using model: {settings['litellm_model_name']}")
+    if dry_run:
+        logger.info("Dry run: nothing will be sent to the LLM or exported.")
+    elif settings["batch_submit_path"]:
+        logger.info(f"Writing batch requests to: {settings['batch_submit_path']} in {settings['batch_format']} format")
+    else:
+        logger.info(f"Exporting to: {settings['output_path']} in {settings['export_format']} format")
 
     try:
         process_documents(
             input_path=input_path,
             input_format=input_format,
-            litellm_model_name=litellm_model_name,
-            output_path=output_path,
-            export_format=export_format,
-            num_qa_pairs=num_qa_pairs
+            journal_path=journal_path,
+            resume=resume,
+            incremental=incremental,
+            plan=plan,
+            **settings
         )
+        if plan is not None:
+            plan.log_summary()
+            if plan_path:
+                plan.write_json(plan_path)
         logger.info("Document processing completed successfully.")
     except Exception as e:
         logger.error(f"An error occurred during processing: {e}")
         exit(1)
 
+@cli.command()
+@click.option('--input', 'input_path', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Directory to watch for new or changed documents.')
+@click.option('--format', 'input_format', type=click.Choice(['auto', 'csv', 'pdf', 'doc', 'ppt']), default='auto',
+              help='Specify input file format. "auto" attempts to detect.')
+@extraction_options
+@click.option('--index', 'index_path', type=click.Path(dir_okay=False), default=None,
+              help='Persisted index of processed files (path, size, mtime) and of failed ones. Defaults to <output>.index.jsonl.')
+@click.option('--interval', 'interval', type=click.FloatRange(min=0.1), default=2.0, show_default=True,
+              help='Seconds between polls of the input directory.')
+@click.option('--settle', 'settle_seconds', type=click.FloatRange(min=0), default=2.0, show_default=True,
+              help='Seconds a file must stay unchanged before it is processed, so partially copied files are skipped.')
+@click.option('--full-scan-interval', 'full_scan_interval', type=click.FloatRange(min=0), default=60.0, show_default=True,
+              help='Seconds between full rescans, which pick up files modified in place.')
+@click.option('--rotate-rows', 'rotate_rows', type=click.IntRange(min=1), default=None,
+              help='Start a new output file after this many rows.')
+@click.option('--rotate-seconds', 'rotate_seconds', type=click.FloatRange(min=1), default=3600, show_default=True,
+              help='Start a new output file this many seconds after the current one received its first row.')
+@click.option('--max-attempts', 'max_attempts', type=click.IntRange(min=1), default=3, show_default=True,
+              help='Failed attempts after which a file is left alone until it changes.')
+@click.option('--retry-backoff', 'retry_backoff', type=click.FloatRange(min=0), default=300.0, show_default=True,
+              help='Seconds before a failed file is retried; doubles with each failed attempt.')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging for this command.')
+def watch(input_path, input_format, index_path, interval, settle_seconds, full_scan_interval, rotate_rows, rotate_seconds,
+          max_attempts, retry_backoff, verbose, **options):
+    """
+    Watch a directory and extract Q&A content from new or changed documents as they arrive.
+    """
+    if verbose:
+        logger.remove()
+        logger.add("file.log", rotation="10 MB", level="DEBUG")
+        logger.enable("DAmon")
+        logger.debug("Verbose logging enabled for watch command.")
+    else:
+        # Ensure default logger is active if not verbose
+        logger.remove()
+        logger.add(lambda msg: click.echo(msg, err=True), level="INFO", format="{time} | {level} | {message}")
+        logger.enable("DAmon")
+
+    from .core import load_prompt_template
+    from .watch import watch_directory
+    load_prompt_template()
+    settings = extraction_settings(**options)
+    logger.info(f"Using model: {settings['litellm_model_name']}")
+
+    try:
+        watch_directory(input_path, input_format, index_path=index_path, interval=interval, settle_seconds=settle_seconds,
+                        full_scan_interval=full_scan_interval, rotate_rows=rotate_rows, rotate_seconds=rotate_seconds,
+                        max_attempts=max_attempts, retry_backoff=retry_backoff, **settings)
+    except Exception as e:
+        logger.error(f"An error occurred while watching {input_path}: {e}")
+        exit(1)
+
+@cli.command()
+@click.option('--results', 'results_path', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Results file downloaded from the provider batch job (OpenAI or Anthropic JSONL).')
+@click.option('--manifest', 'manifest_path', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Manifest written next to the requests by `damon process --batch-submit`.')
+@click.option('--output', 'output_path', required=True, type=click.Path(),
+              help='Path to the output file or directory.')
+@click.option('--export', 'export_format', type=click.Choice(['jsonl', 'csv', 'parquet']), default='jsonl',
+              help='Output dataset format.')
+@click.option('--metrics-json', 'metrics_path', type=click.Path(dir_okay=False), default=None,
+              help='Write a JSON run summary (per-file stats, tokens, errors) to this path.')
+@click.option('--metrics-prom', 'prometheus_path', type=click.Path(dir_okay=False), default=None,
+              help='Write run metrics in the Prometheus textfile-collector format to this path.')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging for this command.')
+def ingest_batch(results_path, manifest_path, output_path, export_format, metrics_path, prometheus_path, verbose):
+    """
+    Export the results of a provider batch job submitted with `damon process --batch-submit`.
+    """
+    if verbose:
+        logger.remove()
+        logger.add("file.log", rotation="10 MB", level="DEBUG")
+        logger.enable("DAmon")
+        logger.debug("Verbose logging enabled for ingest-batch command.")
+    else:
+        # Ensure default logger is active if not verbose
+        logger.remove()
+        logger.add(lambda msg: click.echo(msg, err=True), level="INFO", format="{time} | {level} | {message}")
+        logger.enable("DAmon")
+
+    from .core import ingest_batch_results
+    logger.info(f"Ingesting batch results {results_path} (manifest: {manifest_path})")
+    try:
+        ingest_batch_results(results_path, manifest_path, output_path, export_format, metrics_path, prometheus_path)
+    except Exception as e:
+        logger.error(f"An error occurred while ingesting batch results: {e}")
+        exit(1)
+
+@cli.command()
+@serving_options
+@click.option('--host', 'host', type=str, default='127.0.0.1', show_default=True,
+              help='Address to listen on.')
+@click.option('--port', 'port', type=click.IntRange(min=0, max=65535), default=8000, show_default=True,
+              help='Port to listen on.')
+@click.option('--root', 'root', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Directory whose files and subdirectories may be requested by path. Without it, documents can only be uploaded.')
+@click.option('--max-upload-size', 'max_upload_size', type=str, default='100MB', show_default=True,
+              help='Largest request body accepted (e.g. "100MB").')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging for this command.')
+def serve(host, port, root, max_upload_size, verbose, **options):
+    """
+    Serve Q&A extraction over HTTP, streaming rows back as newline-delimited JSON.
+    """
+    if verbose:
+        logger.remove()
+        logger.add("file.log", rotation="10 MB", level="DEBUG")
+        logger.enable("DAmon")
+        logger.debug("Verbose logging enabled for serve command.")
+    else:
+        # Ensure default logger is active if not verbose
+        logger.remove()
+        logger.add(lambda msg: click.echo(msg, err=True), level="INFO", format="{time} | {level} | {message}")
+        logger.enable("DAmon")
+
+    from .pipeline import Pipeline
+    from .publish import parse_size
+    from .server import serve as serve_pipeline
+    settings = extraction_settings(**options)
+    settings.pop("parse_workers")
+
+    try:
+        pipeline = Pipeline(**settings)
+        serve_pipeline(pipeline, host, port, root, parse_size(max_upload_size))
+    except Exception as e:
+        logger.error(f"An error occurred while serving: {e}")
+        exit(1)
+
 @cli.command()
 @click.option('--input-file', 'input_file_path', required=True, type=click.Path(exists=True),
-              help='Path to the data file to push (CSV, JSONL, or Parquet).')
+              help='Path to the data file to push (CSV, JSONL, or Parquet), or a directory of run outputs to push as one dataset.')
 @click.option('--repo-id', 'repo_id', required=True, type=str,
               help='The Hugging Face Hub repository ID (e.g., "your-username/your-dataset").')
 @click.option('--split', 'split_name', type=click.Choice(['train', 'validation', 'test']), default='train',
               help='The name of the dataset split (e.g., "train", "validation", "test"). Defaults to "train".')
+@click.option('--max-shard-size', 'max_shard_size', type=str, default='500MB', show_default=True,
+              help='Maximum size of each uploaded Parquet shard (e.g. "500MB", "1GB").')
+@click.option('--local-hub', 'local_hub', type=click.Path(file_okay=False), default=None, envvar='DAMON_LOCAL_HUB',
+              help='Write the dataset to <DIR>/<repo-id>/data instead of uploading it, as a stand-in for the Hub.')
 @click.option('--verbose', is_flag=True, help='Enable verbose logging for this command.')
-def push_to_hf(input_file_path, repo_id, split_name, verbose):
+def push_to_hf(input_file_path, repo_id, split_name, max_shard_size, local_hub, verbose):
     """
     Push extracted data to a Hugging Face Datasets repository, specifying a split.
     """
@@ -99,32 +366,9 @@ def push_to_hf(input_file_path, repo_id, split_name, verbose):
 
     logger.info(f"Attempting to push {input_file_path} as split '{split_name}' to Hugging Face Hub repository: {repo_id}")
     try:
-        from .core import push_to_hub
-        from datasets import Dataset, DatasetDict
-        import pandas as pd
-        import os
-
-        file_ext = os.path.splitext(input_file_path)[1].lower()
-        df = None
-        if file_ext == '.jsonl':
-            df = pd.read_json(input_file_path, lines=True)
-        elif file_ext == '.csv':
-            df = pd.read_csv(input_file_path)
-        elif file_ext == '.parquet':
-            df = pd.read_parquet(input_file_path)
-        else:
-            logger.error(f"Unsupported file format for pushing to Hugging Face Hub: {file_ext}")
-            exit(1)
-        
-        if df is not None:
-            dataset = Dataset.from_pandas(df)
-            dataset_dict = DatasetDict({split_name: dataset})
-            push_to_hub(dataset_dict, repo_id)
-        else:
-            logger.error("Failed to load data into DataFrame.")
-            exit(1)
-
-        logger.info("Data push to Hugging Face Hub completed successfully.")
+        from .publish import push_files_to_hub
+        shards = push_files_to_hub(input_file_path, repo_id, split_name, max_shard_size, local_hub)
+        logger.info(f"Data push to Hugging Face Hub completed successfully ({len(shards)} shard(s)).")
     except Exception as e:
         logger.error(f"An error occurred during data push to Hugging Face Hub: {e}")
         exit(1)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding-window limiter for requests and tokens per minute.
+    Either limit may be None to leave that dimension unbounded.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None, window: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()  # (monotonic timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._events and self._events[0][0] + self.window <= now:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and len(self._events) >= self.requests_per_minute:
+            wait = self._events[0][0] + self.window - now
+        if self.tokens_per_minute and self._events and self._tokens_in_window + tokens > self.tokens_per_minute:
+            # Wait until enough of the oldest requests leave the window. A single request larger
+            # than the whole budget is let through once the window is empty.
+            freed = 0
+            for timestamp, event_tokens in self._events:
+                freed += event_tokens
+                if self._tokens_in_window - freed + tokens <= self.tokens_per_minute:
+                    break
+            wait = max(wait, timestamp + self.window - now)
+        return wait
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """
+        Takes a slot for one request of `tokens` estimated tokens if one is free now and returns 0.
+        Otherwise takes nothing and returns the number of seconds until a slot should be free.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            wait = self._wait_time(now, tokens)
+            if wait <= 0:
+                self._events.append((now, tokens))
+                self._tokens_in_window += tokens
+                return 0.0
+            return wait
+
+    def acquire(self, tokens: int = 0):
+        """Blocks until one request of `tokens` estimated tokens fits in the current window."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def usage(self) -> float:
+        """Returns the used fraction (0-1) of the tighter of the two budgets in the current window."""
+        with self._lock:
+            self._expire(time.monotonic())
+            fractions = [0.0]
+            if self.requests_per_minute:
+                fractions.append(len(self._events) / self.requests_per_minute)
+            if self.tokens_per_minute:
+                fractions.append(self._tokens_in_window / self.tokens_per_minute)
+            return min(1.0, max(fractions))
+
+
+def map_ordered(fn, items, concurrency: int = 1, max_pending: int = None, processes: bool = False):
+    """
+    Applies `fn` to every item on a thread pool and yields the results in input order.
+    At most `max_pending` items (default: twice the concurrency) are in flight at once,
+    so `items` may be a lazy iterable and a slow consumer applies backpressure.
+    With processes=True a process pool is used instead, for CPU-bound work; `fn` and the
+    items must then be picklable.
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    max_pending = max_pending or concurrency * 2
+    pending = deque()
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+    else:
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="damon")
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -1,20 +1,37 @@
 import os
 import csv
+import hashlib
 from loguru import logger
-from PyPDF2 import PdfReader
-from docx import Document
-from pptx import Presentation
-from litellm import completion
-import pandas as pd
-import json
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+import functools
+import itertools
+import math
+from tenacity import retry, stop_after_attempt, retry_if_exception
 import time
 from datetime import datetime
 
+from .batch import BatchRequestWriter, read_batch_results, read_manifest
+from .cache import ResponseCache
+from .chunking import chunk_segments, estimate_tokens
+from .concurrency import RateLimiter, map_ordered
+from .dedup import DEFAULT_THRESHOLD, DUPLICATE_FIELDS, DUPLICATES_SUFFIX, PROVENANCE_FIELDS, NearDuplicateIndex, duplicate_record, qa_text
+from .exporters import JsonlWriter, StreamingWriter, open_writer
+from .journal import ProgressJournal
+from .metrics import FileMetrics, RunMetrics
+from .planning import RunPlan, expected_completion_tokens
+from .packing import pack_tasks, packing_instructions, render_packed_text, split_packed_response
+from .responses import IncompleteStreamError, InvalidResponseError, QAStream, parse_qa_json, validate_qa_pairs
+from .retry import MAX_ATTEMPTS, CircuitBreaker, is_retryable, is_saturation, retry_after_seconds, wait_adaptive
+from .router import ModelRouter
+
+# Heavy third-party modules (litellm, PyPDF2, python-docx, python-pptx) are imported
+# where they are first used, so that `damon --help` and short-lived commands start quickly.
+
 # --- Configuration ---
 # Define the expected schema for extracted Q&A
 QA_SCHEMA = ["question", "thought", "answer", "model"]
 METADATA_FIELDS = ["filename", "page_number", "slide_index", "timestamp"]
+# Data rows (1-based, header excluded) covered by a CSV row batch
+ROW_RANGE_FIELDS = ["row_start", "row_end"]
 
 # Prompt template for LLM extraction
 # This is a basic template. It can be made more sophisticated.
@@ -65,71 +82,114 @@ PROMPT_TEMPLATE_DEFAULT = """
 
 DAMON_PROMPT_FILE = "DAMON_PROMPT.md"
 
-def load_prompt_template():
-    global PROMPT_TEMPLATE
-    full_prompt_file_path = os.path.join(os.getcwd(), DAMON_PROMPT_FILE)
+def read_prompt_template(directory: str = None) -> str:
+    """Returns the prompt template from DAMON_PROMPT.md in directory (default: the working directory), or the default one."""
+    full_prompt_file_path = os.path.join(directory or os.getcwd(), DAMON_PROMPT_FILE)
     logger.info(f"Checking for custom PROMPT_TEMPLATE at: {full_prompt_file_path}")
 
     if os.path.exists(full_prompt_file_path):
         logger.info(f"Using custom PROMPT_TEMPLATE from {DAMON_PROMPT_FILE}")
         with open(full_prompt_file_path, 'r', encoding='utf-8') as f:
-            PROMPT_TEMPLATE = f.read()
-    else:
-        logger.info("Using default PROMPT_TEMPLATE.")
-        PROMPT_TEMPLATE = PROMPT_TEMPLATE_DEFAULT
+            return f.read()
+    logger.info("Using default PROMPT_TEMPLATE.")
+    return PROMPT_TEMPLATE_DEFAULT
+
+def load_prompt_template():
+    """Loads the prompt template of the working directory into PROMPT_TEMPLATE, which the module-level functions use."""
+    global PROMPT_TEMPLATE
+    PROMPT_TEMPLATE = read_prompt_template()
 
 # Initialize PROMPT_TEMPLATE with a default value before it's potentially overwritten by load_prompt_template
 PROMPT_TEMPLATE = PROMPT_TEMPLATE_DEFAULT
 
 # --- File Parsers ---
-def parse_csv(file_path: str) -> str:
-    """Parses a CSV file and returns its content as a single string."""
+# Segment parsers return the document as a list of segments (rows, pages, paragraphs or slides).
+# Each segment is a dict with a "text" key and, where the format has them, "page_number" or "slide_index".
+def parse_csv_segments(file_path: str) -> list[dict]:
+    """Parses a CSV file and returns one segment per row."""
     content = []
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             reader = csv.reader(f)
             for row in reader:
-                content.append(','.join(row))
+                content.append({"text": ','.join(row)})
         logger.debug(f"Parsed CSV: {file_path}")
-        return "\n".join(content)
+        return content
     except Exception as e:
         logger.error(f"Error parsing CSV file {file_path}: {e}")
         raise
 
-def parse_pdf(file_path: str) -> str:
-    """Parses a PDF file and returns its content as a single string."""
+def iter_csv_row_batches(file_path: str, max_tokens: int, count_tokens=estimate_tokens):
+    """
+    Reads a CSV file lazily and yields chunks of consecutive rows of at most max_tokens
+    estimated tokens, each starting with the header row, so that memory use does not
+    depend on the size of the file. Each chunk records the data rows it covers in
+    "row_start"/"row_end". A single row larger than the budget becomes a chunk of its own.
+    """
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header_text = ','.join(header)
+        budget = max(1, max_tokens - count_tokens(header_text))
+        lines, tokens, row_start, chunk_index = [], 0, None, 0
+        row_number = 0
+        for row_number, row in enumerate(reader, start=1):
+            line = ','.join(row)
+            if not line.strip():
+                continue
+            line_tokens = count_tokens(line)
+            if lines and tokens + line_tokens > budget:
+                yield {"text": "\n".join([header_text] + lines), "page_number": None, "slide_index": None,
+                       "chunk_index": chunk_index, "row_start": row_start, "row_end": row_number - 1}
+                lines, tokens, row_start = [], 0, None
+                chunk_index += 1
+            if row_start is None:
+                row_start = row_number
+            lines.append(line)
+            tokens += line_tokens
+        if lines:
+            yield {"text": "\n".join([header_text] + lines), "page_number": None, "slide_index": None,
+                   "chunk_index": chunk_index, "row_start": row_start, "row_end": row_number}
+
+def parse_pdf_segments(file_path: str) -> list[dict]:
+    """Parses a PDF file and returns one segment per page with text."""
     content = []
     try:
+        from PyPDF2 import PdfReader
         with open(file_path, 'rb') as f:
             reader = PdfReader(f)
             for i, page in enumerate(reader.pages):
                 text = page.extract_text()
                 if text:
-                    content.append(f"--- Page {i+1} ---\n{text}")
+                    content.append({"text": f"--- Page {i+1} ---\n{text}", "page_number": i + 1})
         logger.debug(f"Parsed PDF: {file_path}")
-        return "\n".join(content)
+        return content
     except Exception as e:
         logger.error(f"Error parsing PDF file {file_path}: {e}")
         raise
 
-def parse_docx(file_path: str) -> str:
-    """Parses a DOCX file and returns its content as a single string."""
+def parse_docx_segments(file_path: str) -> list[dict]:
+    """Parses a DOCX file and returns one segment per non-empty paragraph."""
     content = []
     try:
+        from docx import Document
         document = Document(file_path)
         for para in document.paragraphs:
             if para.text:
-                content.append(para.text)
+                content.append({"text": para.text})
         logger.debug(f"Parsed DOCX: {file_path}")
-        return "\n".join(content)
+        return content
     except Exception as e:
         logger.error(f"Error parsing DOCX file {file_path}: {e}")
         raise
 
-def parse_pptx(file_path: str) -> str:
-    """Parses a PPTX file and returns its content as a single string."""
+def parse_pptx_segments(file_path: str) -> list[dict]:
+    """Parses a PPTX file and returns one segment per slide with text."""
     content = []
     try:
+        from pptx import Presentation
         presentation = Presentation(file_path)
         for i, slide in enumerate(presentation.slides):
             slide_text = []
@@ -139,13 +199,29 @@ def parse_pptx(file_path: str) -> str:
                         slide_text.append(shape.text)
             if slide_text:
                 slide_content = '\n'.join(slide_text)
-                content.append(f"--- Slide {i+1} ---\n{slide_content}")
+                content.append({"text": f"--- Slide {i+1} ---\n{slide_content}", "slide_index": i + 1})
         logger.debug(f"Parsed PPTX: {file_path}")
-        return "\n".join(content)
+        return content
     except Exception as e:
         logger.error(f"Error parsing PPTX file {file_path}: {e}")
         raise
 
+def parse_csv(file_path: str) -> str:
+    """Parses a CSV file and returns its content as a single string."""
+    return "\n".join(segment["text"] for segment in parse_csv_segments(file_path))
+
+def parse_pdf(file_path: str) -> str:
+    """Parses a PDF file and returns its content as a single string."""
+    return "\n".join(segment["text"] for segment in parse_pdf_segments(file_path))
+
+def parse_docx(file_path: str) -> str:
+    """Parses a DOCX file and returns its content as a single string."""
+    return "\n".join(segment["text"] for segment in parse_docx_segments(file_path))
+
+def parse_pptx(file_path: str) -> str:
+    """Parses a PPTX file and returns its content as a single string."""
+    return "\n".join(segment["text"] for segment in parse_pptx_segments(file_path))
+
 # Map file extensions to parser functions
 PARSERS = {
     'csv': parse_csv,
@@ -156,52 +232,201 @@ PARSERS = {
     'pptx': parse_pptx,
 }
 
+SEGMENT_PARSERS = {
+    'csv': parse_csv_segments,
+    'pdf': parse_pdf_segments,
+    'doc': parse_docx_segments,
+    'docx': parse_docx_segments,
+    'ppt': parse_pptx_segments,
+    'pptx': parse_pptx_segments,
+}
+
 def get_file_parser(file_extension: str):
     """Returns the appropriate parser function for a given file extension."""
     return PARSERS.get(file_extension.lower())
 
-# --- Litellm Integration ---
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2), retry=retry_if_exception_type(Exception))
-def call_litellm_api(model_name: str, text_content: str, current_filename_without_ext: str, num_qa_pairs: int = None) -> list[dict]:
+def get_segment_parser(file_extension: str):
+    """Returns the appropriate segment parser function for a given file extension."""
+    return SEGMENT_PARSERS.get(file_extension.lower())
+
+def load_document_chunks(file_path: str, chunk_tokens: int = None, chunk_overlap: int = 0) -> list[dict]:
     """
-    Calls the litellm API to extract Q&A content from the given text.
-    Includes retry mechanism.
+    Parses a file into the chunks that are sent to the LLM.
+    Without chunk_tokens the whole document is a single chunk with no page/slide metadata.
     """
-    
+    file_ext = os.path.basename(file_path).split('.')[-1].lower()
+    segment_parser = get_segment_parser(file_ext)
+    if not segment_parser:
+        return []
+
+    segments = segment_parser(file_path)
+    if chunk_tokens:
+        return list(chunk_segments(segments, chunk_tokens, chunk_overlap))
+
+    text = "\n".join(segment["text"] for segment in segments)
+    if not text.strip():
+        return []
+    return [{"text": text, "page_number": None, "slide_index": None, "chunk_index": 0}]
+
+# --- Litellm Integration ---
+def completion(*args, **kwargs):
+    """Thin wrapper around litellm.completion that defers importing litellm until the first call."""
+    from litellm import completion as litellm_completion
+    return litellm_completion(*args, **kwargs)
+
+def render_prompt(text_content: str, current_filename_without_ext: str, num_qa_pairs: int = None,
+                  prompt_template: str = None) -> str:
+    """Renders prompt_template (default: PROMPT_TEMPLATE) for the given text."""
     num_qa_str = f"{num_qa_pairs}個" if num_qa_pairs is not None else ""
+    template = prompt_template if prompt_template is not None else PROMPT_TEMPLATE
+    return template.format(extracted_text=text_content, num_qa_str=num_qa_str, current_filename_without_ext=current_filename_without_ext)
+
+def response_usage(response, model_name: str) -> tuple:
+    """Returns (prompt_tokens, completion_tokens, estimated cost) of a litellm response, where available."""
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cost = None
+    try:
+        from litellm import completion_cost
+        cost = completion_cost(completion_response=response, model=model_name)
+    except Exception:
+        # Unknown models and custom deployments have no price information
+        pass
+    return prompt_tokens, completion_tokens, cost
+
+def stream_response(chunks: list, messages: list):
+    """Rebuilds a litellm response, with its usage, from streamed chunks, for metrics and cost."""
+    if not chunks:
+        return None
+    try:
+        from litellm import stream_chunk_builder
+        return stream_chunk_builder(chunks, messages=messages)
+    except Exception as e:
+        logger.debug(f"Could not rebuild the streamed response: {e}")
+        return None
+
+def _record_retry(retry_state):
+    metrics = retry_state.kwargs.get("metrics")
+    if metrics is not None:
+        metrics.record_retry(retry_state.args[0] if retry_state.args else retry_state.kwargs.get("model_name"))
+
+def request_qa_pairs(model_name: str, prompt: str, rate_limiter: RateLimiter = None, metrics: FileMetrics = None,
+                     circuit_breaker: CircuitBreaker = None, label: str = None, completion_kwargs: dict = None,
+                     stream: bool = False, max_pairs: int = None) -> tuple:
+    """
+    Sends a single extraction request, without retries, and returns the validated Q&A pairs
+    together with the raw litellm response. label names the deployment in the "model" column
+    and in metrics (defaults to model_name); completion_kwargs are passed on to litellm.
+    With stream, the answer is parsed as it is generated and the generation is cancelled
+    once max_pairs valid pairs have arrived; the response is rebuilt from the chunks. A
+    stream that breaks off after some pairs raises IncompleteStreamError with those pairs.
+    """
+    label = label or model_name
     messages = [
-        {"role": "user", "content": PROMPT_TEMPLATE.format(extracted_text=text_content, num_qa_str=num_qa_str, current_filename_without_ext=current_filename_without_ext)}
+        {"role": "user", "content": prompt}
     ]
-    logger.debug(f"Calling litellm with model: {model_name}")
+    if circuit_breaker is not None:
+        circuit_breaker.wait()
+    if rate_limiter is not None:
+        rate_limiter.acquire(estimate_tokens(prompt))
+    logger.debug(f"Calling litellm with model: {label}")
+    response_content = None
+    sent_at = time.monotonic()
     try:
-        response = completion(model=model_name, messages=messages, response_format={"type": "json_object"})
+        start = time.perf_counter()
+        if stream:
+            qa_stream = QAStream(completion(model=model_name, messages=messages, response_format={"type": "json_object"},
+                                            stream=True, **(completion_kwargs or {})), label, max_pairs)
+            try:
+                qa_pairs = list(qa_stream)
+            finally:
+                response_content = qa_stream.content
+            response = stream_response(qa_stream.chunks, messages)
+            if metrics is not None:
+                metrics.record_llm_call(label, time.perf_counter() - start, *response_usage(response, model_name))
+            if qa_stream.broken:
+                raise IncompleteStreamError(f"Stream from {label} broke off after {len(qa_pairs)} Q&A pairs", qa_pairs)
+            if circuit_breaker is not None:
+                circuit_breaker.record_success()
+            if qa_stream.stopped_early:
+                logger.debug(f"Stopped the generation of {label} after {len(qa_pairs)} Q&A pairs.")
+            return qa_pairs, response
+        response = completion(model=model_name, messages=messages, response_format={"type": "json_object"}, **(completion_kwargs or {}))
+        if metrics is not None:
+            metrics.record_llm_call(label, time.perf_counter() - start, *response_usage(response, model_name))
+        if circuit_breaker is not None:
+            circuit_breaker.record_success()
         # litellm's response structure might vary, typically content is in choices[0].message.content
         response_content = response.choices[0].message.content
         logger.debug(f"Litellm raw response: {response_content}")
-        qa_pairs = json.loads(response_content)
+        qa_pairs = parse_qa_json(response_content)
 
         # Add model name to each QA pair and validate schema
-        validated_qa_pairs = []
-        for qa in qa_pairs:
-            if all(key in qa for key in ["question", "thought", "answer"]):
-                qa["model"] = model_name
-                validated_qa_pairs.append(qa)
-            else:
-                logger.warning(f"Skipping malformed QA pair from LLM: {qa}")
-        return validated_qa_pairs
-    except json.JSONDecodeError as e:
-        logger.error(f"Litellm response was not valid JSON: {response_content[:500]}... Error: {e}")
-        raise ValueError("Invalid JSON response from LLM") from e
+        return validate_qa_pairs(qa_pairs, label), response
+    except IncompleteStreamError:
+        raise
+    except InvalidResponseError:
+        logger.error(f"Litellm response was not valid JSON: {(response_content or '')[:500]}...")
+        if metrics is not None:
+            metrics.record_llm_error(label)
+        raise
     except Exception as e:
-        logger.error(f"Error calling litellm API with model {model_name}: {e}")
+        logger.error(f"Error calling litellm API with model {label}: {e}")
+        if metrics is not None:
+            metrics.record_llm_error(label)
+        if circuit_breaker is not None and is_saturation(e):
+            circuit_breaker.trip(retry_after_seconds(e), sent_at=sent_at)
         raise
 
-# --- Data Processing and Export ---
-def process_documents(input_path: str, input_format: str, litellm_model_name: str, output_path: str, export_format: str, num_qa_pairs: int = None):
+@retry(stop=stop_after_attempt(MAX_ATTEMPTS), wait=wait_adaptive, retry=retry_if_exception(is_retryable),
+       before_sleep=_record_retry, reraise=True)
+def request_with_retries(model_name: str, prompt: str, rate_limiter: RateLimiter = None, metrics: FileMetrics = None,
+                         circuit_breaker: CircuitBreaker = None, stream: bool = False, max_pairs: int = None) -> list[dict]:
+    """Sends a rendered prompt, retrying transient failures, and returns the validated Q&A pairs."""
+    qa_pairs, _ = request_qa_pairs(model_name, prompt, rate_limiter, metrics, circuit_breaker, stream=stream, max_pairs=max_pairs)
+    return qa_pairs
+
+def call_litellm_api(model_name: str, text_content: str, current_filename_without_ext: str, num_qa_pairs: int = None,
+                     rate_limiter: RateLimiter = None, metrics: FileMetrics = None,
+                     circuit_breaker: CircuitBreaker = None, prompt_template: str = None, stream: bool = False) -> list[dict]:
     """
-    Main function to process documents, extract Q&A, and export results.
+    Calls the litellm API to extract Q&A content from the given text.
+    Transient failures are retried with exponential backoff and jitter (or the provider's
+    Retry-After); authentication, bad-request and not-found errors are not retried.
+    Malformed JSON is repaired locally before a paid re-generation is attempted.
+    If a rate_limiter is given, every attempt waits for a slot first. If a circuit_breaker
+    is given, throttling trips it so that all workers pause together.
+    If a metrics recorder is given, latency, token usage, cost, retries and errors are recorded.
+    With stream, the response is streamed and stops once num_qa_pairs valid pairs arrived.
     """
-    all_extracted_data = []
+    prompt = render_prompt(text_content, current_filename_without_ext, num_qa_pairs, prompt_template)
+    return request_with_retries(model_name, prompt, rate_limiter=rate_limiter, metrics=metrics, circuit_breaker=circuit_breaker,
+                                stream=stream, max_pairs=num_qa_pairs)
+
+def route_prompt(router: ModelRouter, prompt: str, rate_limiter: RateLimiter = None, metrics: FileMetrics = None,
+                 stream: bool = False, max_pairs: int = None) -> list[dict]:
+    """Sends a rendered prompt through the router's deployment pool and returns the validated Q&A pairs."""
+
+    def _attempt(deployment):
+        return request_qa_pairs(deployment.model, prompt, rate_limiter, metrics, label=deployment.name,
+                                completion_kwargs=deployment.litellm_params, stream=stream, max_pairs=max_pairs)
+
+    return router.run(_attempt, tokens=estimate_tokens(prompt), metrics=metrics)
+
+def call_with_router(router: ModelRouter, text_content: str, current_filename_without_ext: str, num_qa_pairs: int = None,
+                     rate_limiter: RateLimiter = None, metrics: FileMetrics = None, prompt_template: str = None,
+                     stream: bool = False) -> list[dict]:
+    """
+    Extracts Q&A content through a pool of deployments. The router picks a deployment for
+    every attempt and fails over to another one when a deployment is throttled or down.
+    """
+    prompt = render_prompt(text_content, current_filename_without_ext, num_qa_pairs, prompt_template)
+    return route_prompt(router, prompt, rate_limiter, metrics, stream, num_qa_pairs)
+
+# --- Data Processing and Export ---
+def discover_files(input_path: str, input_format: str) -> list[str]:
+    """Returns the supported files found at input_path (a single file or a directory)."""
     files_to_process = []
 
     if os.path.isfile(input_path):
@@ -215,127 +440,703 @@ def process_documents(input_path: str, input_format: str, litellm_model_name: st
                         files_to_process.append(os.path.join(root, file))
                     else:
                         logger.warning(f"Skipping unsupported file type: {file} in auto mode.")
-                elif file_ext == input_format: # Specific format requested
-                     if get_file_parser(file_ext):
-                        files_to_process.append(os.path.join(root, file))
-                     else:
-                        logger.warning(f"Skipping file {file} as its extension '{file_ext}' does not match requested format '{input_format}'.")
     else:
         logger.error(f"Input path is neither a file nor a directory: {input_path}")
-        return
 
-    if not files_to_process:
-        logger.warning("No supported files found to process.")
-        return
+    return files_to_process
 
-    for file_path in files_to_process:
-        logger.info(f"Processing file: {file_path}")
-        file_name = os.path.basename(file_path)
-        file_ext = file_name.split('.')[-1].lower()
+def extract_chunk(file_path: str, chunk: dict, litellm_model_name: str, num_qa_pairs: int = None, rate_limiter: RateLimiter = None,
+                  cache: ResponseCache = None, metrics: FileMetrics = None, circuit_breaker: CircuitBreaker = None,
+                  router: ModelRouter = None, prompt_template: str = None, stream: bool = False) -> list[dict]:
+    """
+    Extracts the Q&A pairs of a single chunk and attaches file and page/slide metadata.
+    If a cache is given, results are looked up there first and stored after a successful call.
+    If a router is given, the request goes through its deployment pool and litellm_model_name
+    only labels the pool in the cache. prompt_template defaults to PROMPT_TEMPLATE. With
+    stream, responses are streamed and cut off at num_qa_pairs pairs. A stream that breaks
+    off raises IncompleteStreamError with the pairs received so far, which are not cached.
+    """
+    file_name = os.path.basename(file_path)
+    file_name_without_ext = os.path.splitext(file_name)[0]
+    qa_pairs = None
+    if cache is not None:
+        cache_key = chunk_cache_key(file_path, chunk, litellm_model_name, num_qa_pairs, prompt_template)
+        qa_pairs = cache.get(cache_key)
+        if qa_pairs is not None:
+            logger.debug(f"Cache hit for {file_name} (chunk {chunk['chunk_index']})")
+            if metrics is not None:
+                metrics.record_cache_hit()
+    if qa_pairs is None:
+        try:
+            if router is not None:
+                qa_pairs = call_with_router(router, chunk["text"], file_name_without_ext, num_qa_pairs,
+                                            rate_limiter=rate_limiter, metrics=metrics, prompt_template=prompt_template,
+                                            stream=stream)
+            else:
+                qa_pairs = call_litellm_api(litellm_model_name, chunk["text"], file_name_without_ext, num_qa_pairs,
+                                            rate_limiter=rate_limiter, metrics=metrics, circuit_breaker=circuit_breaker,
+                                            prompt_template=prompt_template, stream=stream)
+        except IncompleteStreamError as e:
+            attach_metadata(e.qa_pairs, file_path, chunk)
+            raise
+        if cache is not None:
+            cache.set(cache_key, litellm_model_name, qa_pairs)
 
-        parser = get_file_parser(file_ext)
-        if not parser:
-            logger.warning(f"No parser available for file type: {file_ext}. Skipping {file_name}")
-            continue
+    return attach_metadata(qa_pairs, file_path, chunk)
 
-        try:
-            extracted_text = parser(file_path)
-            if not extracted_text.strip():
-                logger.warning(f"No text extracted from {file_name}. Skipping LLM call.")
+def attach_metadata(qa_pairs: list[dict], file_path: str, chunk: dict) -> list[dict]:
+    """Adds the file name, timestamp and page/slide of the chunk to each Q&A pair."""
+    file_name = os.path.basename(file_path)
+    for qa in qa_pairs:
+        # Add metadata
+        qa["filename"] = file_name
+        qa["timestamp"] = time.time() # Unix timestamp
+        qa["page_number"] = chunk.get("page_number")
+        qa["slide_index"] = chunk.get("slide_index")
+        if "row_start" in chunk:
+            qa["row_start"] = chunk["row_start"]
+            qa["row_end"] = chunk["row_end"]
+    return qa_pairs
+
+def chunk_cache_key(file_path: str, chunk: dict, litellm_model_name: str, num_qa_pairs: int = None,
+                    prompt_template: str = None) -> str:
+    """Returns the response cache key of a chunk, as if it were extracted on its own."""
+    file_name_without_ext = os.path.splitext(os.path.basename(file_path))[0]
+    prompt = render_prompt(chunk["text"], file_name_without_ext, num_qa_pairs, prompt_template)
+    return ResponseCache.make_key(litellm_model_name, prompt, num_qa_pairs, chunk["text"])
+
+def parse_file(file_path: str, chunk_tokens: int = None, chunk_overlap: int = 0) -> dict:
+    """
+    Parses and chunks a single file. This is the CPU-bound stage of the pipeline and runs in
+    worker processes when parse workers are enabled, so errors are returned, not raised.
+    """
+    logger.info(f"Processing file: {file_path}")
+    document = {"file_path": file_path, "chunks": [], "error": None, "parse_seconds": 0.0, "chars": 0}
+    start = time.perf_counter()
+    try:
+        document["chunks"] = load_document_chunks(file_path, chunk_tokens, chunk_overlap)
+        document["chars"] = sum(len(chunk["text"]) for chunk in document["chunks"])
+        if not document["chunks"]:
+            logger.warning(f"No text extracted from {os.path.basename(file_path)}. Skipping LLM call.")
+    except Exception as e:
+        logger.error(f"Failed to process {os.path.basename(file_path)}: {e}")
+        document["error"] = str(e)
+    document["parse_seconds"] = time.perf_counter() - start
+    return document
+
+def spread_num_qa(num_qa_pairs: int, parts: int) -> list[int]:
+    """
+    Splits num_qa_pairs over parts: each part gets the floor of the even share and the
+    remainder is spread evenly over the parts, starting with the first, so the shares add up
+    to num_qa_pairs. With fewer pairs than parts, some shares are 0.
+    """
+    def _assigned(i):
+        # Pairs assigned to the first i parts, rounded up
+        return -(-num_qa_pairs * i // parts)
+    return [_assigned(i + 1) - _assigned(i) for i in range(parts)]
+
+def iter_document_tasks(document: dict, num_qa_pairs: int = None):
+    """
+    Yields one extraction task per chunk of a parsed document. The requested number of Q&A
+    pairs is spread over the chunks and chunks whose share is 0 are not extracted. A document
+    without chunks to extract produces a single task without a chunk, so that every file ends
+    with exactly one task marked "is_last".
+    """
+    file_path = document["file_path"]
+    chunks = document["chunks"]
+    if num_qa_pairs is None:
+        shares = [None] * len(chunks)
+    else:
+        shares = spread_num_qa(num_qa_pairs, len(chunks)) if chunks else []
+    selected = [(chunk, share) for chunk, share in zip(chunks, shares) if share is None or share > 0]
+    if not selected:
+        task = {"file_path": file_path, "chunk": None, "num_qa_pairs": num_qa_pairs, "is_last": True}
+        if document["error"] is not None:
+            task["error"] = document["error"]
+        yield task
+        return
+
+    if len(chunks) > 1:
+        extracted = f"; {len(selected)} of them share the {num_qa_pairs} Q&A pairs" if len(selected) < len(chunks) else ""
+        logger.info(f"Split {os.path.basename(file_path)} into {len(chunks)} chunks{extracted}.")
+    for i, (chunk, share) in enumerate(selected):
+        yield {"file_path": file_path, "chunk": chunk, "num_qa_pairs": share, "is_last": i == len(selected) - 1}
+
+def iter_csv_batch_tasks(file_path: str, batch_tokens: int, num_qa_pairs: int = None):
+    """
+    Yields one extraction task per row batch of a CSV file, reading the file lazily.
+    The number of batches is only known at the end, so num_qa_pairs is spread over an
+    estimate based on the file size (see spread_num_qa). Batches whose share is 0 are not
+    extracted, the last batch gets what is left of the quota if the file has fewer batches
+    than estimated, and no more rows are read once the whole quota has been handed out.
+    """
+    shares = None
+    if num_qa_pairs is not None:
+        estimated_batches = max(1, math.ceil(os.path.getsize(file_path) / 4 / batch_tokens))
+        shares = spread_num_qa(num_qa_pairs, estimated_batches)
+    assigned = 0
+    last_chunk = None
+    # The latest batch to extract is held back until it is known whether it is the file's last
+    pending = None
+    batches = iter_csv_row_batches(file_path, batch_tokens)
+    try:
+        for index, chunk in enumerate(batches):
+            last_chunk = chunk
+            share = None if shares is None else (shares[index] if index < len(shares) else 0)
+            if share == 0:
                 continue
+            if pending is not None:
+                yield pending
+            pending = {"file_path": file_path, "chunk": chunk, "num_qa_pairs": share, "is_last": False}
+            if shares is not None:
+                assigned += share
+                if assigned >= num_qa_pairs:
+                    logger.info(f"Stopped reading {os.path.basename(file_path)} after row {chunk['row_end']}: "
+                                f"all {num_qa_pairs} Q&A pairs are assigned to the batches read so far.")
+                    break
+    except Exception as e:
+        logger.error(f"Failed to process {os.path.basename(file_path)}: {e}")
+        if pending is not None:
+            yield pending
+        yield {"file_path": file_path, "chunk": None, "num_qa_pairs": num_qa_pairs, "is_last": True, "error": str(e)}
+        return
+    finally:
+        batches.close()
+    if shares is not None and last_chunk is not None and assigned < num_qa_pairs:
+        # Fewer batches than estimated: the last one gets the rest of the quota
+        if pending is not None and pending["chunk"] is not last_chunk:
+            yield pending
+            pending = None
+        if pending is None:
+            pending = {"file_path": file_path, "chunk": last_chunk, "num_qa_pairs": 0, "is_last": False}
+        pending["num_qa_pairs"] += num_qa_pairs - assigned
+    if pending is None:
+        if last_chunk is None:
+            logger.warning(f"No text extracted from {os.path.basename(file_path)}. Skipping LLM call.")
+        pending = {"file_path": file_path, "chunk": None, "num_qa_pairs": num_qa_pairs}
+    pending["is_last"] = True
+    yield pending
 
-            file_name_without_ext = os.path.splitext(file_name)[0]
-            qa_pairs = call_litellm_api(litellm_model_name, extracted_text, file_name_without_ext, num_qa_pairs)
+def run_task(task: dict, litellm_model_name: str, rate_limiter: RateLimiter = None, cache: ResponseCache = None,
+             metrics: RunMetrics = None, circuit_breaker: CircuitBreaker = None, router: ModelRouter = None,
+             prompt_template: str = None, stream: bool = False) -> list[dict]:
+    """
+    Runs one extraction task. Errors are logged, recorded under the task's "error" key and
+    result in an empty list so that one bad file or chunk does not stop the run. The pairs of
+    a stream that broke off are returned, but the error is recorded all the same, so that
+    the file is not journaled as complete.
+    """
+    if task["chunk"] is None:
+        return []
+    try:
+        file_metrics = metrics.for_file(task["file_path"]) if metrics is not None else None
+        return extract_chunk(task["file_path"], task["chunk"], litellm_model_name, task["num_qa_pairs"], rate_limiter, cache,
+                             file_metrics, circuit_breaker, router, prompt_template, stream)
+    except IncompleteStreamError as e:
+        file_name = os.path.basename(task["file_path"])
+        logger.warning(f"Keeping {len(e.qa_pairs)} Q&A pairs of {file_name} (chunk {task['chunk']['chunk_index']}) "
+                       f"from an incomplete stream; they are not cached or journaled.")
+        task["error"] = str(e)
+        return e.qa_pairs
+    except Exception as e:
+        file_name = os.path.basename(task["file_path"])
+        logger.error(f"Failed to process {file_name} (chunk {task['chunk']['chunk_index']}): {e}")
+        task["error"] = str(e)
+        return []
 
-            if num_qa_pairs is not None and len(qa_pairs) > num_qa_pairs:
-                logger.warning(f"Truncating {len(qa_pairs)} Q&A pairs to {num_qa_pairs} as requested.")
-                qa_pairs = qa_pairs[:num_qa_pairs]
+def render_packed_prompt(tasks: list[dict], prompt_template: str = None) -> str:
+    """Renders the prompt that extracts the chunks of several tasks with one request."""
+    return render_prompt(render_packed_text(tasks), "<檔案名稱>", prompt_template=prompt_template) + packing_instructions(tasks)
 
-            for qa in qa_pairs:
-                # Add metadata
-                qa["filename"] = file_name
-                qa["timestamp"] = time.time() # Unix timestamp
-                # Placeholder for page_number/slide_index - requires parser modification
-                # For now, these will be None unless explicitly handled by parser
-                qa["page_number"] = None
-                qa["slide_index"] = None
-                all_extracted_data.append(qa)
+def run_packed_tasks(tasks: list[dict], litellm_model_name: str, rate_limiter: RateLimiter = None, cache: ResponseCache = None,
+                     metrics: RunMetrics = None, circuit_breaker: CircuitBreaker = None, router: ModelRouter = None,
+                     prompt_template: str = None, stream: bool = False) -> list[tuple]:
+    """
+    Extracts several small tasks with a single LLM request, one numbered section per task,
+    and returns (task, qa_pairs) for each task in order. Cached chunks are not sent again and
+    new results are cached per chunk. Tasks the model left without Q&A pairs, or all of them
+    if the packed request fails, fall back to one request per task.
+    """
+    results = {}
+    pending = []
+    for i, task in enumerate(tasks):
+        if cache is not None:
+            task["cache_key"] = chunk_cache_key(task["file_path"], task["chunk"], litellm_model_name, task["num_qa_pairs"],
+                                                prompt_template)
+            qa_pairs = cache.get(task["cache_key"])
+            if qa_pairs is not None:
+                if metrics is not None:
+                    metrics.record_cache_hit(task["file_path"])
+                results[i] = attach_metadata(qa_pairs, task["file_path"], task["chunk"])
+                continue
+        pending.append(i)
 
+    if len(pending) > 1:
+        packed = [tasks[i] for i in pending]
+        prompt = render_packed_prompt(packed, prompt_template)
+        logger.debug(f"Packing {len(packed)} chunks into one request.")
+        packed_metrics = None
+        if metrics is not None:
+            # The request's usage is attributed to the source files by the length of their text
+            total_chars = sum(len(task["chunk"]["text"]) for task in packed) or 1
+            file_shares = {}
+            for task in packed:
+                file_shares[task["file_path"]] = file_shares.get(task["file_path"], 0.0) + len(task["chunk"]["text"]) / total_chars
+            packed_metrics = metrics.for_files(file_shares)
+        try:
+            # The pairs of several sources share the response, so a packed stream is never cut off early
+            if router is not None:
+                qa_pairs = route_prompt(router, prompt, rate_limiter, packed_metrics, stream)
+            else:
+                qa_pairs = request_with_retries(litellm_model_name, prompt, rate_limiter=rate_limiter, metrics=packed_metrics,
+                                                circuit_breaker=circuit_breaker, stream=stream)
+            for i, source_pairs in zip(pending, split_packed_response(qa_pairs, len(packed))):
+                if source_pairs:
+                    if cache is not None:
+                        cache.set(tasks[i]["cache_key"], litellm_model_name, source_pairs)
+                    results[i] = attach_metadata(source_pairs, tasks[i]["file_path"], tasks[i]["chunk"])
         except Exception as e:
-            logger.error(f"Failed to process {file_name}: {e}")
-            continue
+            logger.warning(f"Packed request for {len(packed)} chunks failed ({e}); extracting them one by one.")
 
-    if not all_extracted_data:
-        logger.warning("No Q&A data was extracted from any documents.")
-        return
+    for i, task in enumerate(tasks):
+        if i not in results:
+            results[i] = run_task(task, litellm_model_name, rate_limiter, cache, metrics, circuit_breaker, router,
+                                  prompt_template, stream)
+        task.pop("cache_key", None)
+    return [(task, results[i]) for i, task in enumerate(tasks)]
 
-    # Ensure output directory exists if output_path is a directory
-    output_dir = os.path.dirname(output_path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def truncate_qa_pairs(qa_pairs: list[dict], num_qa_pairs: int = None) -> list[dict]:
+    """Truncates a file's Q&A pairs to num_qa_pairs, if given."""
+    if num_qa_pairs is not None and len(qa_pairs) > num_qa_pairs:
+        logger.warning(f"Truncating {len(qa_pairs)} Q&A pairs to {num_qa_pairs} as requested.")
+        return qa_pairs[:num_qa_pairs]
+    return qa_pairs
 
-    # Export data
-    df = pd.DataFrame(all_extracted_data)
-    
+def build_output_path(output_path: str, export_format: str) -> str:
+    """Returns the timestamped output file path for output_path and export_format."""
     # Generate timestamp
     timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # Split path into directory and filename
-    output_dir_from_path = os.path.dirname(output_path)
-    output_filename_from_path = os.path.basename(output_path)
-    
+
     # Split path into directory and filename
     output_dir_from_path = os.path.dirname(output_path)
     output_filename_from_path = os.path.basename(output_path)
-    
-    # Split filename into base and extension
-    base_filename, ext = os.path.splitext(output_filename_from_path)
-    
+
+    # Split filename into base and extension; the extension is replaced by the export format
+    base_filename, _ = os.path.splitext(output_filename_from_path)
+
     # Construct new filename with timestamp
     if base_filename: # If there's a base filename
-        # If the original extension is the same as the export format, remove it to avoid duplication
-        if ext and ext[1:].lower() == export_format.lower():
-             new_filename = f"{base_filename}_{timestamp_str}"
-        else:
-             new_filename = f"{base_filename}_{timestamp_str}"
+        new_filename = f"{base_filename}_{timestamp_str}"
     else: # If output_path was just a directory
         new_filename = f"output_{timestamp_str}"
-        
+
     # Reconstruct full path with new filename and correct extension
-    output_file_path = os.path.join(output_dir_from_path, f"{new_filename}.{export_format}")
-
-    if export_format == 'jsonl':
-        df.to_json(output_file_path, orient='records', lines=True, force_ascii=False)
-    elif export_format == 'csv':
-        df.to_csv(output_file_path, index=False, encoding='utf-8')
-    elif export_format == 'parquet':
-        df.to_parquet(output_file_path, index=False)
-    else:
-        logger.error(f"Unsupported export format: {export_format}")
-        return
+    return os.path.join(output_dir_from_path, f"{new_filename}.{export_format}")
 
-    logger.info(f"Successfully exported {len(all_extracted_data)} Q&A entries to {output_file_path}")
+def process_documents(input_path: str, input_format: str, litellm_model_name: str, output_path: str, export_format: str, num_qa_pairs: int = None,
+                      concurrency: int = 1, requests_per_minute: int = None, tokens_per_minute: int = None,
+                      chunk_tokens: int = None, chunk_overlap: int = 0,
+                      cache_path: str = None, refresh_cache: bool = False, cache_max_entries: int = None, cache_max_age: float = None,
+                      journal_path: str = None, resume: bool = False, incremental: bool = False,
+                      parse_workers: int = 1, metrics_path: str = None, prometheus_path: str = None,
+                      router: ModelRouter = None, dedup_chunks: bool = False, dedup_qa: bool = False,
+                      dedup_threshold: float = DEFAULT_THRESHOLD, pack_tokens: int = None,
+                      csv_batch_tokens: int = None, files: list[str] = None, writer: StreamingWriter = None,
+                      on_file_done=None, on_file_failed=None, chunk_dedup: NearDuplicateIndex = None,
+                      qa_dedup: NearDuplicateIndex = None,
+                      duplicates_writer: StreamingWriter = None, batch_submit_path: str = None, batch_format: str = "openai",
+                      plan: RunPlan = None, stream: bool = False, prompt_template: str = None) -> RunMetrics:
+    """
+    Main function to process documents, extract Q&A, and export results.
+    With chunk_tokens, each document is split into chunks of that many estimated tokens and
+    every chunk is extracted separately. With concurrency > 1, chunks are extracted on a
+    thread pool; results keep the input order and are streamed to the output as each
+    file completes. With cache_path, LLM results are cached in that SQLite file (max age
+    in seconds).
 
-from typing import Union
-from datasets import Dataset, DatasetDict
+    With journal_path, every completed file is appended to a progress journal. With resume,
+    files already in the journal are skipped and their journaled rows are exported again, so
+    the output is complete. With incremental, those files are skipped and only new or changed
+    files appear in the output.
 
-def push_to_hub(dataset_obj: Union[Dataset, DatasetDict], repo_id: str):
-    """
-    Pushes a Hugging Face Dataset or DatasetDict to Hugging Face Hub.
+    With parse_workers > 1, parsing runs on a process pool ahead of the LLM stage. At most
+    twice that many parsed documents wait for extraction, which bounds memory.
+
+    Returns the RunMetrics of the run (parse/LLM/export timings, tokens, retries and cost),
+    which are also written to metrics_path as JSON and to prometheus_path in the Prometheus
+    textfile format, if given.
+
+    With a router, requests are spread over its pool of deployments, with failover, and
+    litellm_model_name is only the label of the pool for the cache and journal.
+
+    With dedup_chunks, chunks whose text is a near-duplicate (MinHash similarity of at least
+    dedup_threshold) of an earlier chunk are not sent to the LLM. With dedup_qa, near-duplicate
+    Q&A rows are dropped before export. Every dropped chunk or row is listed, with the
+    provenance of the one that was kept, in <output>.duplicates.jsonl.
+
+    With pack_tokens, consecutive small chunks (up to that many estimated tokens of text in
+    total) share one LLM request, which saves the prompt overhead on corpora of small files.
+    The response is split back into rows per source chunk.
+
+    With csv_batch_tokens, CSV files are not parsed up front but read lazily in row batches
+    of that many estimated tokens, each with the header row. Every batch is extracted on its
+    own and its rows carry the data row range in row_start/row_end.
+
+    Long-running callers (see watch.py) can pass the files to process instead of discovering
+    them under input_path, an open writer that is left open afterwards, and on_file_done,
+    which is called with (file_path, rows) once a file's rows are exported without errors,
+    and on_file_failed, which is called with file_path when a file had errors.
+    They can also pass the near-duplicate indexes (chunk_dedup, qa_dedup) and the duplicates
+    report (duplicates_writer) to use, so that deduplication spans several calls.
+
+    With batch_submit_path, nothing is sent to the LLM: every prompt is written to that file
+    as a request line of the provider's batch API (batch_format "openai" or "anthropic"),
+    with a manifest next to it that maps the requests back to their files and chunks. The
+    provider's results file is then exported with ingest_batch_results.
+
+    With a plan (dry run), files are discovered, parsed and chunked as usual and every
+    prompt is rendered and recorded in the plan, but nothing is sent to the LLM and nothing
+    is written: the journal and the cache are only read. Cached and near-duplicate chunks
+    are counted as skipped. A plan cannot be combined with batch_submit_path.
+
+    With stream, LLM responses are streamed and parsed incrementally, and each generation is
+    cancelled as soon as the chunk's share of num_qa_pairs valid pairs has arrived, so no
+    completion tokens are paid for pairs that would be truncated.
+
+    prompt_template defaults to PROMPT_TEMPLATE; its hash is part of the journal settings, so
+    files completed with another template are not skipped on resume.
     """
-    logger.info(f"Attempting to push dataset to Hugging Face Hub repository: {repo_id}")
+    prompt_template = prompt_template if prompt_template is not None else PROMPT_TEMPLATE
+    metrics = RunMetrics()
+    if files is None and not (os.path.isfile(input_path) or os.path.isdir(input_path)):
+        logger.error(f"Input path is neither a file nor a directory: {input_path}")
+        return metrics
 
+    files_to_process = discover_files(input_path, input_format) if files is None else list(files)
+    if not files_to_process:
+        logger.warning("No supported files found to process.")
+        return metrics
+
+    if plan is not None and batch_submit_path:
+        raise ValueError("A dry run does not write batch requests; pass either plan or batch_submit_path.")
+
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    journal = None
+    if journal_path:
+        settings = {
+            "model": litellm_model_name,
+            "num_qa_pairs": num_qa_pairs,
+            "chunk_tokens": chunk_tokens,
+            "chunk_overlap": chunk_overlap,
+            "prompt_sha256": hashlib.sha256(prompt_template.encode('utf-8')).hexdigest(),
+        }
+        if csv_batch_tokens:
+            settings["csv_batch_tokens"] = csv_batch_tokens
+        if dedup_chunks or dedup_qa:
+            settings["dedup"] = {"chunks": dedup_chunks, "qa": dedup_qa, "threshold": dedup_threshold}
+        if plan is None:
+            journal = ProgressJournal(journal_path, settings, append=resume or incremental)
+        elif resume or incremental:
+            # A dry run only reads the journal, to leave out the files the run would skip
+            journal = ProgressJournal(journal_path, settings, read_only=True)
+
+    skip_files = set()
+    if journal is not None and (resume or incremental):
+        skip_files = {file_path for file_path in files_to_process if journal.is_done(file_path)}
+        if skip_files:
+            logger.info(f"Skipping {len(skip_files)} files already completed in journal {journal_path}.")
+
+    if chunk_dedup is None and dedup_chunks:
+        chunk_dedup = NearDuplicateIndex(dedup_threshold)
+    if qa_dedup is None and dedup_qa:
+        qa_dedup = NearDuplicateIndex(dedup_threshold)
+    owns_duplicates_writer = duplicates_writer is None
+
+    def _skip_duplicate_chunk(task):
+        chunk = task["chunk"]
+        provenance = {"filename": os.path.basename(task["file_path"]), "page_number": chunk.get("page_number"),
+                      "slide_index": chunk.get("slide_index"), "chunk_index": chunk["chunk_index"]}
+        match = chunk_dedup.match_or_add(chunk["text"], provenance)
+        if match is not None:
+            kept, similarity = match
+            logger.info(f"Skipping chunk {chunk['chunk_index']} of {provenance['filename']}: "
+                        f"near-duplicate of {kept['filename']} (similarity {similarity:.2f}).")
+            metrics.record_duplicate("chunk", task["file_path"])
+            if plan is not None:
+                plan.record_skipped_chunk(task["file_path"], "duplicate")
+            else:
+                duplicates_writer.write([duplicate_record("chunk", provenance, kept, similarity)])
+            task["chunk"] = None
+        return task
+
+    def _dedup_rows(file_path, rows):
+        if qa_dedup is None:
+            return rows
+        kept_rows = []
+        for row in rows:
+            match = qa_dedup.match_or_add(qa_text(row), {field: row.get(field) for field in PROVENANCE_FIELDS})
+            if match is None:
+                kept_rows.append(row)
+                continue
+            kept, similarity = match
+            metrics.record_duplicate("qa", file_path)
+            duplicates_writer.write([duplicate_record("qa", row, kept, similarity)])
+        return kept_rows
+
+    def _streams_rows(file_path):
+        return bool(csv_batch_tokens) and file_path.lower().endswith(".csv")
+
+    def _iter_csv_tasks(file_path):
+        # Row batches are read on demand, so the parse time is the time spent waiting for them
+        chars, chunks, seconds, failed = 0, 0, 0.0, False
+        tasks = iter_csv_batch_tasks(file_path, csv_batch_tokens, num_qa_pairs)
+        while True:
+            start = time.perf_counter()
+            task = next(tasks, None)
+            seconds += time.perf_counter() - start
+            if task is None:
+                break
+            if task["chunk"] is not None:
+                chars += len(task["chunk"]["text"])
+                chunks += 1
+            failed = failed or "error" in task
+            yield task
+        metrics.record_parse(file_path, seconds, chars, chunks, error=failed)
+
+    def _iter_tasks():
+        # Parse stage: runs ahead of extraction on a process pool when parse_workers > 1
+        parse = functools.partial(parse_file, chunk_tokens=chunk_tokens, chunk_overlap=chunk_overlap)
+        documents = map_ordered(parse, (f for f in files_to_process if f not in skip_files and not _streams_rows(f)),
+                                parse_workers, processes=True)
+        for file_path in files_to_process:
+            if file_path in skip_files:
+                yield {"file_path": file_path, "chunk": None, "num_qa_pairs": num_qa_pairs, "is_last": True, "journaled": True}
+                continue
+            if _streams_rows(file_path):
+                for task in _iter_csv_tasks(file_path):
+                    if chunk_dedup is not None and task["chunk"] is not None:
+                        task = _skip_duplicate_chunk(task)
+                    yield task
+                continue
+            document = next(documents)
+            metrics.record_parse(file_path, document["parse_seconds"], document["chars"], len(document["chunks"]),
+                                 error=document["error"] is not None)
+            for task in iter_document_tasks(document, num_qa_pairs):
+                if chunk_dedup is not None and task["chunk"] is not None:
+                    task = _skip_duplicate_chunk(task)
+                yield task
+
+    def _iter_batches():
+        if pack_tokens:
+            return pack_tasks(_iter_tasks(), pack_tokens)
+        return ([task] for task in _iter_tasks())
+
+    if plan is not None:
+        # Looked up without changing the cache: no eviction and no access-time updates
+        cache = None
+        if cache_path and not refresh_cache and os.path.exists(cache_path):
+            cache = ResponseCache(cache_path, cache_max_entries, cache_max_age, read_only=True)
+        try:
+            for batch in _iter_batches():
+                pending = []
+                for task in batch:
+                    if task.get("journaled"):
+                        continue
+                    plan.record_file(task["file_path"], task.get("error"))
+                    if task["chunk"] is None:
+                        continue
+                    if cache is not None and cache.get(chunk_cache_key(task["file_path"], task["chunk"], litellm_model_name,
+                                                                       task["num_qa_pairs"], prompt_template)) is not None:
+                        plan.record_skipped_chunk(task["file_path"], "cached")
+                        continue
+                    pending.append(task)
+                if len(pending) > 1:
+                    completion_tokens = sum(expected_completion_tokens(task["num_qa_pairs"]) for task in pending)
+                    plan.record_request([(task["file_path"], task["chunk"]) for task in pending],
+                                        render_packed_prompt(pending, prompt_template), completion_tokens)
+                elif pending:
+                    task = pending[0]
+                    file_name_without_ext = os.path.splitext(os.path.basename(task["file_path"]))[0]
+                    plan.record_request([(task["file_path"], task["chunk"])],
+                                        render_prompt(task["chunk"]["text"], file_name_without_ext, task["num_qa_pairs"],
+                                                      prompt_template),
+                                        expected_completion_tokens(task["num_qa_pairs"]))
+        finally:
+            if cache is not None:
+                cache.close()
+            if journal is not None:
+                journal.close()
+            metrics.finish()
+        return metrics
+
+    output_file_path = build_output_path(output_path, export_format)
+    if owns_duplicates_writer and (chunk_dedup is not None or qa_dedup is not None):
+        duplicates_writer = JsonlWriter(os.path.splitext(output_file_path)[0] + DUPLICATES_SUFFIX, DUPLICATE_FIELDS)
+
+    if batch_submit_path:
+        try:
+            with BatchRequestWriter(batch_submit_path, litellm_model_name, batch_format) as batch_writer:
+                for task in _iter_tasks():
+                    if task["chunk"] is None:
+                        continue
+                    file_name_without_ext = os.path.splitext(os.path.basename(task["file_path"]))[0]
+                    prompt = render_prompt(task["chunk"]["text"], file_name_without_ext, task["num_qa_pairs"], prompt_template)
+                    batch_writer.add(task["file_path"], task["chunk"], prompt, num_qa_pairs)
+        finally:
+            if duplicates_writer is not None and owns_duplicates_writer:
+                duplicates_writer.close()
+            if journal is not None:
+                journal.close()
+            metrics.finish()
+        logger.info(f"Wrote {batch_writer.requests_written} batch requests to {batch_writer.path} "
+                    f"(manifest: {batch_writer.manifest_path})")
+        return metrics
+
+    # Rows are streamed to the output as each file completes
+    owns_writer = writer is None
+    if owns_writer:
+        fields = QA_SCHEMA + METADATA_FIELDS + (ROW_RANGE_FIELDS if csv_batch_tokens else [])
+        writer = open_writer(output_file_path, export_format, fields)
+    rows_before = writer.rows_written
+
+    cache = None
+    if cache_path:
+        cache = ResponseCache(cache_path, cache_max_entries, cache_max_age, refresh=refresh_cache)
+
+    # Shared by all workers: one throttled request pauses everyone
+    circuit_breaker = CircuitBreaker()
+
+    def _run(batch):
+        if len(batch) > 1:
+            return run_packed_tasks(batch, litellm_model_name, rate_limiter, cache, metrics, circuit_breaker, router,
+                                    prompt_template, stream)
+        task = batch[0]
+        return [(task, run_task(task, litellm_model_name, rate_limiter, cache, metrics, circuit_breaker, router,
+                                prompt_template, stream))]
+
+    def _export(file_path, rows):
+        start = time.perf_counter()
+        writer.write(rows)
+        metrics.record_export(time.perf_counter() - start, len(rows), file_path)
+
+    if concurrency > 1:
+        logger.info(f"Extracting {len(files_to_process)} files with concurrency {concurrency}.")
+    # Tasks of one file are consecutive and results come back in order, so a file is
+    # complete when its "is_last" task returns.
+    file_qa_pairs = []
+    file_failed = False
     try:
-        from huggingface_hub import get_token
-        if get_token() is None:
-            logger.error("You are not logged in to Hugging Face. Please run `huggingface-cli login` in your terminal.")
-            return
+        for task, qa_pairs in itertools.chain.from_iterable(map_ordered(_run, _iter_batches(), concurrency)):
+            if task.get("journaled"):
+                if resume and not incremental:
+                    _export(task["file_path"], _dedup_rows(task["file_path"], journal.rows(task["file_path"])))
+                continue
+            # A chunk's surplus pairs would push the pairs of the file's later chunks out
+            file_qa_pairs.extend(truncate_qa_pairs(qa_pairs, task["num_qa_pairs"]))
+            file_failed = file_failed or "error" in task
+            if task["is_last"]:
+                file_qa_pairs = _dedup_rows(task["file_path"], truncate_qa_pairs(file_qa_pairs, num_qa_pairs))
+                _export(task["file_path"], file_qa_pairs)
+                if journal is not None:
+                    if file_failed:
+                        logger.warning(f"Not journaling {task['file_path']} because it had errors; it will be retried.")
+                    else:
+                        journal.record(task["file_path"], file_qa_pairs)
+                if on_file_done is not None and not file_failed:
+                    on_file_done(task["file_path"], file_qa_pairs)
+                if on_file_failed is not None and file_failed:
+                    on_file_failed(task["file_path"])
+                file_qa_pairs = []
+                file_failed = False
+    finally:
+        if owns_writer:
+            writer.close()
+        if duplicates_writer is not None and owns_duplicates_writer:
+            duplicates_writer.close()
+            if duplicates_writer.rows_written:
+                logger.info(f"Listed {duplicates_writer.rows_written} near-duplicates in {duplicates_writer.path}")
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        metrics.finish()
+        if metrics_path:
+            metrics.write_json(metrics_path)
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
 
-        dataset_obj.push_to_hub(repo_id)
-        logger.info(f"Successfully pushed dataset to {repo_id} on Hugging Face Hub.")
+    metrics.log_summary()
+    rows_exported = writer.rows_written - rows_before
+    if rows_exported == 0:
+        logger.warning("No Q&A data was extracted from any documents.")
+        return metrics
 
-    except ImportError:
-        logger.error("The 'datasets' or 'huggingface_hub' library is not installed. Please install them using 'pip install datasets hugginggingface_hub'.")
-    except Exception as e:
-        logger.error(f"An error occurred while pushing to Hugging Face Hub: {e}")
-        raise
\ No newline at end of file
+    logger.info(f"Successfully exported {rows_exported} Q&A entries to {', '.join(writer.files_since(rows_before))}")
+    return metrics
+
+def ingest_batch_result(entry: dict, result: dict, metrics: RunMetrics = None) -> list[dict]:
+    """
+    Validates the result of one batch request, given its manifest entry, and returns its Q&A
+    pairs with metadata attached. Missing, failed and malformed results are logged and give
+    an empty list.
+    """
+    file_path = entry["file_path"]
+    label = f"{os.path.basename(file_path)} (chunk {entry.get('chunk_index')})"
+    error = "no result in the batch results file" if result is None else result["error"]
+    if error is None:
+        if metrics is not None:
+            metrics.record_llm_call(entry["model"], 0.0, result["prompt_tokens"], result["completion_tokens"], file_path=file_path)
+        try:
+            qa_pairs = validate_qa_pairs(parse_qa_json(result["content"] or ""), entry["model"])
+            return attach_metadata(qa_pairs, file_path, entry)
+        except InvalidResponseError as e:
+            error = f"response was not valid JSON ({e})"
+    logger.error(f"Batch request for {label} failed: {error}")
+    if metrics is not None:
+        metrics.record_llm_error(entry["model"], file_path)
+    return []
+
+def ingest_batch_results(results_path: str, manifest_path: str, output_path: str, export_format: str,
+                         metrics_path: str = None, prometheus_path: str = None) -> RunMetrics:
+    """
+    Exports the results file of a provider batch job written by process_documents with
+    batch_submit_path. Results are matched to their files and chunks through the manifest,
+    validated like live responses and exported file by file in the order of the manifest,
+    truncated to the number of Q&A pairs requested per file.
+    """
+    metrics = RunMetrics()
+    manifest = read_manifest(manifest_path)
+    results = read_batch_results(results_path)
+    unknown = len(set(results) - {entry["custom_id"] for entry in manifest})
+    if unknown:
+        logger.warning(f"Ignoring {unknown} results whose custom IDs are not in {manifest_path}.")
+
+    output_file_path = build_output_path(output_path, export_format)
+    fields = QA_SCHEMA + METADATA_FIELDS + (ROW_RANGE_FIELDS if any("row_start" in entry for entry in manifest) else [])
+    writer = open_writer(output_file_path, export_format, fields)
+    try:
+        for file_path, entries in itertools.groupby(manifest, key=lambda entry: entry["file_path"]):
+            file_qa_pairs = []
+            for entry in entries:
+                file_qa_pairs.extend(ingest_batch_result(entry, results.get(entry["custom_id"]), metrics))
+            file_qa_pairs = truncate_qa_pairs(file_qa_pairs, entry["num_qa_pairs"])
+            start = time.perf_counter()
+            writer.write(file_qa_pairs)
+            metrics.record_export(time.perf_counter() - start, len(file_qa_pairs), file_path)
+    finally:
+        writer.close()
+        metrics.finish()
+        if metrics_path:
+            metrics.write_json(metrics_path)
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
+
+    metrics.log_summary()
+    if writer.rows_written == 0:
+        logger.warning("No Q&A data was found in the batch results.")
+        return metrics
+    logger.info(f"Successfully exported {writer.rows_written} Q&A entries to {output_file_path}")
+    return metrics
@@ -0,0 +1,110 @@
+import re
+import threading
+import zlib
+
+DEFAULT_THRESHOLD = 0.85
+DUPLICATES_SUFFIX = ".duplicates.jsonl"
+# Fields of the duplicates report written next to the output
+DUPLICATE_FIELDS = ["kind", "filename", "page_number", "slide_index", "chunk_index", "question",
+                    "kept_filename", "kept_page_number", "kept_slide_index", "similarity"]
+PROVENANCE_FIELDS = ["filename", "page_number", "slide_index", "chunk_index"]
+
+_PRIME = (1 << 31) - 1
+_WHITESPACE_RE = re.compile(r"\s+")
+_BLOCK = 4096
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """Returns the character n-grams of text after case and whitespace normalisation."""
+    normalised = _WHITESPACE_RE.sub(" ", text.lower()).strip()
+    if len(normalised) <= size:
+        return {normalised}
+    return {normalised[i:i + size] for i in range(len(normalised) - size + 1)}
+
+
+def qa_text(row: dict) -> str:
+    """The text of a Q&A row that is compared for near-duplicates."""
+    return f"{row.get('question') or ''}\n{row.get('answer') or ''}"
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of texts in an LSH index of bands x rows buckets.
+
+    Character shingles make the comparison work for CJK text as well as for space-separated
+    languages. Texts whose estimated Jaccard similarity to an indexed text reaches threshold
+    are reported as its near-duplicates; exact copies always match.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        # Imported here so that the CLI starts quickly
+        import numpy as np
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self._np = np
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.int64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def signature(self, text: str):
+        """Returns the MinHash signature of text."""
+        np = self._np
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles(text, self.shingle_size)), dtype=np.int64) % _PRIME
+        signature = np.full(len(self._a), _PRIME, dtype=np.int64)
+        for start in range(0, len(hashes), _BLOCK):
+            block = hashes[start:start + _BLOCK, None]
+            np.minimum(signature, ((block * self._a + self._b) % _PRIME).min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def match_or_add(self, text: str, entry):
+        """
+        Returns (entry, similarity) of the most similar indexed text if it is a near-duplicate
+        of text. Otherwise indexes text with entry (e.g. its provenance) and returns None.
+        """
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            candidates = set()
+            for bucket, key in zip(self._buckets, band_keys):
+                candidates.update(bucket.get(key, ()))
+            best, best_similarity = None, 0.0
+            for candidate in candidates:
+                similarity = float((self._signatures[candidate] == signature).mean())
+                if similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is not None and best_similarity >= self.threshold:
+                return self._entries[best], best_similarity
+
+            item = len(self._entries)
+            self._entries.append(entry)
+            self._signatures.append(signature)
+            for bucket, key in zip(self._buckets, band_keys):
+                bucket.setdefault(key, []).append(item)
+            return None
+
+
+def duplicate_record(kind: str, duplicate: dict, kept: dict, similarity: float) -> dict:
+    """Builds a row of the duplicates report from the provenance of the dropped and the kept item."""
+    record = {"kind": kind}
+    for field in PROVENANCE_FIELDS:
+        record[field] = duplicate.get(field)
+    record["question"] = duplicate.get("question")
+    for field in ("filename", "page_number", "slide_index"):
+        record[f"kept_{field}"] = kept.get(field)
+    record["similarity"] = round(similarity, 4)
+    return record
@@ -0,0 +1,231 @@
+import csv
+import json
+import os
+import time
+
+from loguru import logger
+
+EXPORT_FORMATS = ['jsonl', 'csv', 'parquet']
+
+
+class StreamingWriter:
+    """
+    Base class for exporters that append rows as they are produced.
+    The output file is only created when the first row arrives, so an empty run leaves no file behind.
+    """
+
+    def __init__(self, path: str, fields: list[str]):
+        self.path = path
+        self.fields = fields
+        self.rows_written = 0
+        self._opened = False
+
+    def _open(self):
+        output_dir = os.path.dirname(self.path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+    def _write(self, rows: list[dict]):
+        raise NotImplementedError
+
+    def write(self, rows: list[dict]):
+        """Appends rows to the output."""
+        if not rows:
+            return
+        if not self._opened:
+            self._open()
+            self._opened = True
+        self._write(rows)
+        self.rows_written += len(rows)
+
+    def files_since(self, rows_before: int) -> list[str]:
+        """Returns the paths of the files that hold the rows written after the first rows_before rows."""
+        return [self.path] if self.rows_written > rows_before else []
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonlWriter(StreamingWriter):
+    """Line-buffered JSON Lines writer; each row is visible to readers as soon as it is written."""
+
+    def _open(self):
+        super()._open()
+        self._file = open(self.path, 'w', encoding='utf-8', buffering=1)
+
+    def _write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self._opened:
+            self._file.close()
+
+
+class CsvWriter(StreamingWriter):
+    """Incremental CSV writer with a fixed header; fields outside the schema are dropped."""
+
+    def _open(self):
+        super()._open()
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        if self._opened:
+            self._file.close()
+
+
+class ParquetWriter(StreamingWriter):
+    """
+    Parquet writer that buffers rows and writes them out as row groups of row_group_size rows.
+    Columns listed in dictionary_fields (low-cardinality strings) are dictionary-encoded.
+    """
+
+    INTEGER_FIELDS = {"page_number", "slide_index", "row_start", "row_end"}
+    FLOAT_FIELDS = {"timestamp"}
+
+    def __init__(self, path: str, fields: list[str], row_group_size: int = 10000, dictionary_fields=("filename", "model")):
+        super().__init__(path, fields)
+        self.row_group_size = row_group_size
+        self.dictionary_fields = set(dictionary_fields)
+        self._buffer = []
+
+    def _schema(self):
+        import pyarrow as pa
+        columns = []
+        for field in self.fields:
+            if field in self.INTEGER_FIELDS:
+                columns.append(pa.field(field, pa.int64()))
+            elif field in self.FLOAT_FIELDS:
+                columns.append(pa.field(field, pa.float64()))
+            elif field in self.dictionary_fields:
+                columns.append(pa.field(field, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                columns.append(pa.field(field, pa.string()))
+        return pa.schema(columns)
+
+    def _open(self):
+        import pyarrow.parquet as pq
+        super()._open()
+        self._arrow_schema = self._schema()
+        self._writer = pq.ParquetWriter(self.path, self._arrow_schema, use_dictionary=sorted(self.dictionary_fields))
+
+    def _flush(self):
+        import pyarrow as pa
+        if self._buffer:
+            table = pa.Table.from_pylist(self._buffer, schema=self._arrow_schema)
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+            self._buffer = []
+
+    def _write(self, rows):
+        # LLMs occasionally return numbers or lists where text is expected; store those as text
+        # rather than failing the whole row group on a type mismatch.
+        for row in rows:
+            row = {field: row.get(field) for field in self.fields}
+            for field, value in row.items():
+                if value is not None and field not in self.INTEGER_FIELDS | self.FLOAT_FIELDS and not isinstance(value, str):
+                    row[field] = json.dumps(value, ensure_ascii=False)
+            self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def close(self):
+        if self._opened:
+            self._flush()
+            self._writer.close()
+
+
+class RollingWriter:
+    """
+    Writer for long-running processes that rolls over to a new output file after max_rows
+    rows or max_seconds since the current file received its first row. make_path() returns
+    the path of each new file. Each file is complete and readable once it is rolled over.
+    """
+
+    def __init__(self, make_path, export_format: str, fields: list[str], max_rows: int = None, max_seconds: float = None):
+        self.make_path = make_path
+        self.export_format = export_format
+        self.fields = fields
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows_written = 0
+        self.files_written = []
+        self._writer = None
+        self._opened_at = None
+        self._file_starts = []  # (path, number of rows written before its first row)
+
+    @property
+    def path(self):
+        """Path of the current output file, or None until the next file receives its first row."""
+        return self._writer.path if self._writer is not None else None
+
+    def _due(self) -> bool:
+        if self._writer is None or not self._writer.rows_written:
+            return False
+        if self.max_rows and self._writer.rows_written >= self.max_rows:
+            return True
+        return bool(self.max_seconds) and time.monotonic() - self._opened_at >= self.max_seconds
+
+    def roll_over(self):
+        """Closes the current output file, if it has rows; the next row starts a new file."""
+        if self._writer is not None and self._writer.rows_written:
+            self._writer.close()
+            self.files_written.append(self._writer.path)
+            logger.info(f"Closed output file {self._writer.path} with {self._writer.rows_written} rows")
+            self._writer = None
+
+    def maybe_roll_over(self):
+        """Rolls over if the current file is full or old enough."""
+        if self._due():
+            self.roll_over()
+
+    def write(self, rows: list[dict]):
+        """Appends rows, rolling over to a new file at the row limit."""
+        while rows:
+            self.maybe_roll_over()
+            if self._writer is None:
+                self._writer = open_writer(self.make_path(), self.export_format, self.fields)
+            if not self._writer.rows_written:
+                self._opened_at = time.monotonic()
+                self._file_starts.append((self._writer.path, self.rows_written))
+            room = len(rows)
+            if self.max_rows:
+                room = min(room, self.max_rows - self._writer.rows_written)
+            self._writer.write(rows[:room])
+            self.rows_written += room
+            rows = rows[room:]
+
+    def files_since(self, rows_before: int) -> list[str]:
+        """Returns the paths of the files that hold the rows written after the first rows_before rows."""
+        ends = [start for _, start in self._file_starts[1:]] + [self.rows_written]
+        return [path for (path, _), end in zip(self._file_starts, ends) if end > rows_before]
+
+    def close(self):
+        self.roll_over()
+
+
+WRITERS = {
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def open_writer(path: str, export_format: str, fields: list[str]) -> StreamingWriter:
+    """Returns the streaming writer for export_format."""
+    writer_cls = WRITERS.get(export_format)
+    if writer_cls is None:
+        logger.error(f"Unsupported export format: {export_format}")
+        raise ValueError(f"Unsupported export format: {export_format}")
+    return writer_cls(path, fields)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import time
+
+from loguru import logger
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+
+def default_journal_path(output_path: str) -> str:
+    """Returns the journal path that belongs to an output path (file or directory)."""
+    output_dir = os.path.dirname(output_path)
+    base_filename, _ = os.path.splitext(os.path.basename(output_path))
+    return os.path.join(output_dir, f"{base_filename or 'output'}{JOURNAL_SUFFIX}")
+
+
+def file_sha256(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ProgressJournal:
+    """
+    Append-only JSONL journal of completed files.
+
+    Each line records a file's path, size, mtime, content hash, the extraction settings
+    and the Q&A rows it produced. Lines are flushed and fsynced as each file completes, so a
+    crashed or interrupted run can be resumed. Only the location of each record is kept in
+    memory; rows are read back from disk when needed. With read_only=True, an existing
+    journal is loaded for lookups only and the file is never created or modified.
+    """
+
+    def __init__(self, path: str, settings: dict = None, append: bool = True, read_only: bool = False):
+        self.path = path
+        self.settings = settings or {}
+        self.read_only = read_only
+        self._index = {}  # abspath -> (size, mtime, sha256, byte offset of record)
+        self._file = None
+        if read_only:
+            if os.path.exists(path):
+                self._load()
+            return
+        journal_dir = os.path.dirname(path)
+        if journal_dir and not os.path.exists(journal_dir):
+            os.makedirs(journal_dir, exist_ok=True)
+        if append and os.path.exists(path):
+            self._load()
+        self._file = open(path, 'ab' if append else 'wb')
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash is ignored; the file is simply redone.
+                    logger.warning(f"Ignoring unreadable journal line at byte {offset} in {self.path}")
+                else:
+                    if record.get("settings") == self.settings:
+                        self._index[record["path"]] = (record["size"], record["mtime"], record["sha256"], offset)
+                offset += len(line)
+        # Make sure new records start on their own line after a torn write
+        if offset and not line.endswith(b'\n') and not self.read_only:
+            with open(self.path, 'ab') as f:
+                f.write(b'\n')
+        logger.info(f"Loaded {len(self._index)} completed files from journal {self.path}")
+
+    def __len__(self):
+        return len(self._index)
+
+    def is_done(self, file_path: str) -> bool:
+        """
+        Returns True if file_path was completed with the same settings and is unchanged.
+        Size and mtime are checked first; the content hash is only computed when the mtime differs.
+        """
+        entry = self._index.get(os.path.abspath(file_path))
+        if entry is None:
+            return False
+        size, mtime, sha256, _ = entry
+        stat = os.stat(file_path)
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime == mtime:
+            return True
+        return file_sha256(file_path) == sha256
+
+    def rows(self, file_path: str) -> list[dict]:
+        """Reads back the journaled Q&A rows of a completed file."""
+        offset = self._index[os.path.abspath(file_path)][3]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())["rows"]
+
+    def record(self, file_path: str, rows: list[dict]):
+        """Appends a completed file and its rows, and forces the record to disk."""
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        record = {
+            "path": abs_path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_sha256(file_path),
+            "completed_at": time.time(),
+            "settings": self.settings,
+            "rows": rows,
+        }
+        offset = self._file.tell()
+        self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._index[abs_path] = (record["size"], record["mtime"], record["sha256"], offset)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
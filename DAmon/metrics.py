@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": ordered[-1]}
+
+
+class RunMetrics:
+    """
+    Thread-safe collector of per-stage timings, token usage and cost for one run.
+    Recorders bound to a single file (see for_file) also aggregate the numbers per file;
+    recorders bound to several files (see for_files) split them by each file's share.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.finished_at = None
+        self.files = {}
+        self.models = {}
+        self.parse_latencies = []
+        self.llm_latencies = []
+        self.export_seconds = 0.0
+        self.rows_exported = 0
+        self.cache_hits = 0
+        self.duplicates = {"chunk": 0, "qa": 0}
+        self.duration = None
+
+    def _file(self, file_path: str) -> dict:
+        return self.files.setdefault(file_path, {
+            "parse_seconds": 0.0, "chars": 0, "chunks": 0, "rows": 0,
+            "llm_calls": 0, "llm_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "retries": 0, "errors": 0, "cache_hits": 0, "duplicates": 0, "cost": 0.0,
+        })
+
+    def _model(self, model_name: str) -> dict:
+        return self.models.setdefault(model_name, {
+            "llm_calls": 0, "llm_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "retries": 0, "errors": 0, "cost": 0.0,
+        })
+
+    def for_file(self, file_path: str) -> "FileMetrics":
+        """Returns a recorder that attributes LLM calls to file_path."""
+        return FileMetrics(self, file_path)
+
+    def for_files(self, file_shares: dict) -> "SharedMetrics":
+        """
+        Returns a recorder for requests that several files share (e.g. packed requests), which
+        attributes the latency, tokens and cost of each call to the files by their share.
+        """
+        return SharedMetrics(self, file_shares)
+
+    def record_parse(self, file_path: str, seconds: float, chars: int, chunks: int, error: bool = False):
+        with self._lock:
+            stats = self._file(file_path)
+            stats["parse_seconds"] += seconds
+            stats["chars"] += chars
+            stats["chunks"] += chunks
+            stats["errors"] += int(error)
+            self.parse_latencies.append(seconds)
+
+    def record_llm_call(self, model_name: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+                        cost: float = None, file_path: str = None, file_shares: dict = None):
+        """Records a call; file_shares maps the files that shared it to their share (default: all of it to file_path)."""
+        file_shares = file_shares or ({file_path: 1.0} if file_path else {})
+        with self._lock:
+            targets = [(self._model(model_name), 1.0)] + [(self._file(path), share) for path, share in file_shares.items()]
+            for stats, share in targets:
+                stats["llm_calls"] += 1
+                stats["llm_seconds"] += seconds * share
+                stats["prompt_tokens"] += round((prompt_tokens or 0) * share)
+                stats["completion_tokens"] += round((completion_tokens or 0) * share)
+                stats["cost"] += (cost or 0.0) * share
+            self.llm_latencies.append(seconds)
+
+    def record_retry(self, model_name: str, file_path: str = None, file_shares: dict = None):
+        with self._lock:
+            self._model(model_name)["retries"] += 1
+            for path in file_shares or ([file_path] if file_path else []):
+                self._file(path)["retries"] += 1
+
+    def record_llm_error(self, model_name: str, file_path: str = None, file_shares: dict = None):
+        with self._lock:
+            self._model(model_name)["errors"] += 1
+            for path in file_shares or ([file_path] if file_path else []):
+                self._file(path)["errors"] += 1
+
+    def record_cache_hit(self, file_path: str = None):
+        with self._lock:
+            self.cache_hits += 1
+            if file_path:
+                self._file(file_path)["cache_hits"] += 1
+
+    def record_duplicate(self, kind: str, file_path: str = None):
+        """Counts a near-duplicate chunk ("chunk") or Q&A row ("qa") that was dropped."""
+        with self._lock:
+            self.duplicates[kind] += 1
+            if file_path:
+                self._file(file_path)["duplicates"] += 1
+
+    def record_export(self, seconds: float, rows: int, file_path: str = None):
+        with self._lock:
+            self.export_seconds += seconds
+            self.rows_exported += rows
+            if file_path:
+                self._file(file_path)["rows"] += rows
+
+    def finish(self):
+        """Marks the end of the run."""
+        self.finished_at = time.time()
+        self.duration = time.perf_counter() - self._start
+
+    def summary(self) -> dict:
+        """Returns the run summary as a JSON-serializable dict."""
+        with self._lock:
+            duration = self.duration if self.duration is not None else time.perf_counter() - self._start
+            totals = {
+                "files": len(self.files),
+                "chars": sum(f["chars"] for f in self.files.values()),
+                "chunks": sum(f["chunks"] for f in self.files.values()),
+                "rows_exported": self.rows_exported,
+                "llm_calls": sum(m["llm_calls"] for m in self.models.values()),
+                "prompt_tokens": sum(m["prompt_tokens"] for m in self.models.values()),
+                "completion_tokens": sum(m["completion_tokens"] for m in self.models.values()),
+                "retries": sum(m["retries"] for m in self.models.values()),
+                "llm_errors": sum(m["errors"] for m in self.models.values()),
+                "cache_hits": self.cache_hits,
+                "duplicate_chunks": self.duplicates["chunk"],
+                "duplicate_qa_pairs": self.duplicates["qa"],
+                "estimated_cost": sum(m["cost"] for m in self.models.values()),
+            }
+            return {
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "duration_seconds": duration,
+                "totals": totals,
+                "stages": {
+                    "parse": {"total_seconds": sum(self.parse_latencies), **_percentiles(self.parse_latencies)},
+                    "llm": {"total_seconds": sum(self.llm_latencies), **_percentiles(self.llm_latencies)},
+                    "export": {"total_seconds": self.export_seconds},
+                },
+                "models": {name: dict(stats) for name, stats in self.models.items()},
+                "files": {path: dict(stats) for path, stats in self.files.items()},
+            }
+
+    def write_json(self, path: str):
+        """Writes the run summary to path as JSON."""
+        _atomic_write(path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+        logger.info(f"Wrote run metrics to {path}")
+
+    def write_prometheus(self, path: str):
+        """Writes the run totals in the Prometheus textfile-collector format."""
+        summary = self.summary()
+        totals = summary["totals"]
+        lines = []
+
+        def metric(name, help_text, metric_type, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+
+        metric("damon_last_run_timestamp_seconds", "Unix time the run finished.", "gauge", [({}, summary["finished_at"] or time.time())])
+        metric("damon_last_run_duration_seconds", "Wall time of the run.", "gauge", [({}, summary["duration_seconds"])])
+        metric("damon_last_run_files", "Files processed.", "gauge", [({}, totals["files"])])
+        metric("damon_last_run_chars_extracted", "Characters extracted by the parsers.", "gauge", [({}, totals["chars"])])
+        metric("damon_last_run_rows_exported", "Q&A rows exported.", "gauge", [({}, totals["rows_exported"])])
+        metric("damon_last_run_cache_hits", "LLM response cache hits.", "gauge", [({}, totals["cache_hits"])])
+        metric("damon_last_run_duplicates", "Near-duplicate chunks and Q&A rows dropped.", "gauge",
+               [({"kind": "chunk"}, totals["duplicate_chunks"]), ({"kind": "qa"}, totals["duplicate_qa_pairs"])])
+        metric("damon_last_run_stage_seconds", "Time spent per pipeline stage.", "gauge",
+               [({"stage": stage}, stats["total_seconds"]) for stage, stats in summary["stages"].items()])
+        latency = summary["stages"]["llm"]
+        metric("damon_last_run_llm_latency_seconds", "LLM request latency quantiles.", "gauge",
+               [({"quantile": q}, latency[key]) for q, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99"))
+                if latency[key] is not None])
+        for key, name, help_text in (
+            ("llm_calls", "damon_last_run_llm_requests", "Successful LLM requests."),
+            ("errors", "damon_last_run_llm_errors", "Failed LLM requests."),
+            ("retries", "damon_last_run_llm_retries", "LLM request retries."),
+            ("prompt_tokens", "damon_last_run_prompt_tokens", "Prompt tokens reported by the provider."),
+            ("completion_tokens", "damon_last_run_completion_tokens", "Completion tokens reported by the provider."),
+            ("cost", "damon_last_run_estimated_cost_usd", "Estimated cost in USD."),
+        ):
+            metric(name, help_text, "gauge", [({"model": model}, stats[key]) for model, stats in summary["models"].items()])
+
+        _atomic_write(path, "\n".join(lines) + "\n")
+        logger.info(f"Wrote Prometheus metrics to {path}")
+
+    def log_summary(self):
+        """Logs the run totals in one line."""
+        totals = self.summary()["totals"]
+        logger.info(
+            f"Run metrics: {totals['files']} files, {totals['llm_calls']} LLM calls "
+            f"({totals['retries']} retries, {totals['llm_errors']} errors, {totals['cache_hits']} cache hits), "
+            f"{totals['prompt_tokens']} prompt / {totals['completion_tokens']} completion tokens, "
+            f"estimated cost ${totals['estimated_cost']:.4f}"
+        )
+
+
+class FileMetrics:
+    """RunMetrics recorder bound to one file."""
+
+    def __init__(self, run: RunMetrics, file_path: str):
+        self.run = run
+        self.file_path = file_path
+
+    def record_llm_call(self, model_name: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = None):
+        self.run.record_llm_call(model_name, seconds, prompt_tokens, completion_tokens, cost, file_path=self.file_path)
+
+    def record_retry(self, model_name: str):
+        self.run.record_retry(model_name, file_path=self.file_path)
+
+    def record_llm_error(self, model_name: str):
+        self.run.record_llm_error(model_name, file_path=self.file_path)
+
+    def record_cache_hit(self):
+        self.run.record_cache_hit(file_path=self.file_path)
+
+
+class SharedMetrics:
+    """RunMetrics recorder bound to several files, which share each call by their share."""
+
+    def __init__(self, run: RunMetrics, file_shares: dict):
+        self.run = run
+        self.file_shares = file_shares
+
+    def record_llm_call(self, model_name: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = None):
+        self.run.record_llm_call(model_name, seconds, prompt_tokens, completion_tokens, cost, file_shares=self.file_shares)
+
+    def record_retry(self, model_name: str):
+        self.run.record_retry(model_name, file_shares=self.file_shares)
+
+    def record_llm_error(self, model_name: str):
+        self.run.record_llm_error(model_name, file_shares=self.file_shares)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _atomic_write(path: str, content: str):
+    # Write then rename, so that collectors never read a half-written file
+    output_dir = os.path.dirname(path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
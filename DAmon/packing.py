@@ -0,0 +1,81 @@
+import os
+import re
+
+from loguru import logger
+
+from .chunking import estimate_tokens
+
+MAX_PACKED_SOURCES = 16
+
+# Appended to the rendered prompt when several documents share one request
+PACKING_INSTRUCTIONS = """
+**多文件模式：**
+上方「文本」包含 {num_sources} 份文件，每份以 `=== [編號] 檔案名稱 ===` 開頭。請分別從每一份文件提取問答對{num_qa_note}，每個問答對只能依據單一文件的內容，不得混用不同文件的資訊。
+提及檔案名稱時，請使用該文件標題中的檔案名稱。
+每個問答對物件除了 'question', 'thought', 'answer' 之外，還必須包含 'source' 鍵，其值為該問答對所依據文件的編號（整數）。
+"""
+
+_SOURCE_RE = re.compile(r"\d+")
+
+
+def is_packable(task: dict, max_tokens: int) -> bool:
+    """True if the task has a chunk small enough to share a request with other chunks."""
+    chunk = task.get("chunk")
+    return chunk is not None and estimate_tokens(chunk["text"]) <= max_tokens // 2
+
+
+def pack_tasks(tasks, max_tokens: int, max_sources: int = MAX_PACKED_SOURCES):
+    """
+    Groups consecutive small tasks into batches of at most max_tokens estimated tokens of
+    text and max_sources tasks. Other tasks are yielded as batches of one, so the order of
+    the tasks is kept.
+    """
+    batch = []
+    batch_tokens = 0
+    for task in tasks:
+        if not is_packable(task, max_tokens):
+            if batch:
+                yield batch
+                batch, batch_tokens = [], 0
+            yield [task]
+            continue
+        tokens = estimate_tokens(task["chunk"]["text"])
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_sources):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(task)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def render_packed_text(tasks: list[dict]) -> str:
+    """Joins the chunks of tasks into one text with a numbered section per source."""
+    sections = []
+    for i, task in enumerate(tasks, start=1):
+        name = os.path.splitext(os.path.basename(task["file_path"]))[0]
+        header = f"=== [{i}] {name} ==="
+        if task.get("num_qa_pairs") is not None:
+            header = f"=== [{i}] {name}（請提取 {task['num_qa_pairs']} 個問答對）==="
+        sections.append(f"{header}\n{task['chunk']['text']}")
+    return "\n\n".join(sections)
+
+
+def packing_instructions(tasks: list[dict]) -> str:
+    """Returns the instructions appended to a packed prompt."""
+    num_qa_note = "，數量依各文件標題所示" if any(task.get("num_qa_pairs") is not None for task in tasks) else ""
+    return PACKING_INSTRUCTIONS.format(num_sources=len(tasks), num_qa_note=num_qa_note)
+
+
+def split_packed_response(qa_pairs: list[dict], num_sources: int) -> list[list[dict]]:
+    """Splits the Q&A pairs of a packed response by their "source" number."""
+    split = [[] for _ in range(num_sources)]
+    for qa in qa_pairs:
+        source = qa.pop("source", None)
+        match = _SOURCE_RE.search(str(source)) if source is not None else None
+        index = int(match.group()) - 1 if match else -1
+        if 0 <= index < num_sources:
+            split[index].append(qa)
+        else:
+            logger.warning(f"Dropping Q&A pair with unknown source {source!r} from packed response.")
+    return split
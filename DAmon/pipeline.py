@@ -0,0 +1,128 @@
+import itertools
+import os
+
+from loguru import logger
+
+from .cache import ResponseCache
+from .concurrency import RateLimiter, map_ordered
+from .core import (METADATA_FIELDS, QA_SCHEMA, build_output_path, discover_files, iter_document_tasks,
+                   parse_file, read_prompt_template, render_prompt, run_task, truncate_qa_pairs)
+from .exporters import open_writer
+from .metrics import RunMetrics
+from .retry import CircuitBreaker
+from .router import ModelRouter
+
+EXPORT_BATCH_ROWS = 1000
+
+
+class Pipeline:
+    """
+    Reusable extraction pipeline: parsing, prompt rendering, extraction and export, with its
+    own configuration instead of the module globals used by the CLI.
+
+    A pipeline keeps its prompt template, response cache, rate limiter, circuit breaker and
+    router (with their latency and quota state) between calls, and litellm keeps its HTTP
+    clients, so a long-lived process such as `damon serve` pays for setup once. A pipeline
+    can be used from several threads at once. The keyword arguments have the meaning they
+    have for process_documents; prompt_template defaults to DAMON_PROMPT.md in the working
+    directory, or the built-in template.
+    """
+
+    def __init__(self, litellm_model_name: str, num_qa_pairs: int = None, chunk_tokens: int = None, chunk_overlap: int = 0,
+                 prompt_template: str = None, router: ModelRouter = None, concurrency: int = 1,
+                 requests_per_minute: int = None, tokens_per_minute: int = None, cache_path: str = None,
+                 refresh_cache: bool = False, cache_max_entries: int = None, cache_max_age: float = None,
+                 stream: bool = False):
+        self.litellm_model_name = litellm_model_name
+        self.num_qa_pairs = num_qa_pairs
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.prompt_template = prompt_template if prompt_template is not None else read_prompt_template()
+        self.router = router
+        self.concurrency = concurrency
+        self.stream = stream
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute) if requests_per_minute or tokens_per_minute else None
+        self.cache = ResponseCache(cache_path, cache_max_entries, cache_max_age, refresh=refresh_cache) if cache_path else None
+        self.circuit_breaker = CircuitBreaker()
+        self.metrics = RunMetrics()
+
+    def warm_up(self):
+        """Imports litellm ahead of the first request, so that it does not pay for the import."""
+        import litellm  # noqa: F401
+
+    def parse(self, file_path: str) -> dict:
+        """Parses and chunks a file (see parse_file)."""
+        document = parse_file(file_path, self.chunk_tokens, self.chunk_overlap)
+        self.metrics.record_parse(file_path, document["parse_seconds"], document["chars"], len(document["chunks"]),
+                                  error=document["error"] is not None)
+        return document
+
+    def render_prompt(self, text_content: str, current_filename_without_ext: str, num_qa_pairs: int = None) -> str:
+        """Renders the pipeline's prompt template for the given text."""
+        return render_prompt(text_content, current_filename_without_ext, num_qa_pairs, self.prompt_template)
+
+    def run_task(self, task: dict) -> list[dict]:
+        """Extracts the Q&A pairs of one task (see run_task); errors are recorded under the task's "error" key."""
+        return run_task(task, self.litellm_model_name, self.rate_limiter, self.cache, self.metrics, self.circuit_breaker,
+                        self.router, self.prompt_template, self.stream)
+
+    def iter_rows(self, file_path: str, num_qa_pairs: int = None, errors: list = None):
+        """
+        Yields the Q&A rows of a file as its chunks are extracted, in order, with up to
+        concurrency chunks in flight. Extraction stops once num_qa_pairs rows (default: the
+        pipeline's) were yielded. A file that cannot be parsed raises ValueError; failed
+        chunks are logged, skipped and appended to errors, if given.
+        """
+        num_qa_pairs = num_qa_pairs if num_qa_pairs is not None else self.num_qa_pairs
+        document = self.parse(file_path)
+        if document["error"] is not None:
+            raise ValueError(f"Failed to parse {os.path.basename(file_path)}: {document['error']}")
+        tasks = list(iter_document_tasks(document, num_qa_pairs))
+        results = map_ordered(self.run_task, tasks, self.concurrency)
+        yielded = 0
+        try:
+            for task, rows in zip(tasks, results):
+                if "error" in task and errors is not None:
+                    errors.append(f"{os.path.basename(file_path)} (chunk {task['chunk']['chunk_index']}): {task['error']}")
+                for row in truncate_qa_pairs(rows, task["num_qa_pairs"]):
+                    yield row
+                    yielded += 1
+                    if num_qa_pairs is not None and yielded >= num_qa_pairs:
+                        return
+        finally:
+            # Stops queueing chunks and cancels the ones not yet started
+            results.close()
+
+    def extract_file(self, file_path: str, num_qa_pairs: int = None) -> list[dict]:
+        """Returns the Q&A rows of a file."""
+        return list(self.iter_rows(file_path, num_qa_pairs))
+
+    def iter_path_rows(self, input_path: str, input_format: str = 'auto', num_qa_pairs: int = None, errors: list = None):
+        """Yields the Q&A rows of every supported file at input_path (a file or a directory), file by file."""
+        for file_path in discover_files(input_path, input_format):
+            try:
+                yield from self.iter_rows(file_path, num_qa_pairs, errors)
+            except ValueError as e:
+                logger.error(str(e))
+                if errors is not None:
+                    errors.append(str(e))
+
+    def export(self, rows, output_path: str, export_format: str) -> str:
+        """Writes rows (any iterable) to a timestamped file for output_path and returns its path."""
+        path = build_output_path(output_path, export_format)
+        rows = iter(rows)
+        with open_writer(path, export_format, QA_SCHEMA + METADATA_FIELDS) as writer:
+            while batch := list(itertools.islice(rows, EXPORT_BATCH_ROWS)):
+                writer.write(batch)
+        logger.info(f"Exported {writer.rows_written} Q&A entries to {path}")
+        return path
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+
+from loguru import logger
+
+from .chunking import estimate_tokens
+from .metrics import _atomic_write
+
+# Completion size assumed per request: the model's output cannot be counted before the run
+COMPLETION_TOKENS_PER_QA = 200
+DEFAULT_COMPLETION_TOKENS = 2000
+# Request latency assumed for the ETA unless seconds_per_request is given
+BASE_LATENCY_SECONDS = 2.0
+OUTPUT_TOKENS_PER_SECOND = 60.0
+
+
+def load_litellm_offline():
+    """
+    Imports litellm without network access: the bundled model price map is used instead of
+    the remote one and token counting falls back to the bundled tiktoken encodings instead
+    of downloading Hugging Face tokenizers.
+    """
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    import litellm
+    litellm.disable_hf_tokenizer_download = True
+    return litellm
+
+
+def model_limits(model_name: str) -> dict:
+    """
+    Returns the context window and per-token prices of a litellm model from the bundled
+    price map. Values that are unknown (e.g. for custom deployments) are None.
+    """
+    limits = {"max_input_tokens": None, "max_output_tokens": None, "input_cost_per_token": None, "output_cost_per_token": None}
+    try:
+        info = load_litellm_offline().get_model_info(model_name)
+    except Exception:
+        return limits
+    for key in limits:
+        limits[key] = info.get(key)
+    return limits
+
+
+def expected_completion_tokens(num_qa_pairs: int = None) -> int:
+    """The completion tokens assumed for a request asking for num_qa_pairs pairs."""
+    return DEFAULT_COMPLETION_TOKENS if num_qa_pairs is None else num_qa_pairs * COMPLETION_TOKENS_PER_QA
+
+
+class RunPlan:
+    """
+    Dry-run estimate of a run: the prompts that would be sent, counted with the model's
+    tokenizer, requests that overflow the context window, the estimated cost and the ETA
+    under the run's concurrency and rate limits.
+
+    models is a list of (model, weight) the requests are spread over; prices are averaged
+    by weight and the smallest context window applies. Prompts are tokenized for the first.
+    """
+
+    def __init__(self, models: list[tuple], concurrency: int = 1, requests_per_minute: int = None,
+                 tokens_per_minute: int = None, seconds_per_request: float = None):
+        self._lock = threading.Lock()
+        self.models = models
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.seconds_per_request = seconds_per_request
+        self.files = {}
+        self.overflows = []
+        self.requests = 0
+        self.request_seconds = 0.0
+        # Tokens as estimated by the rate limiter, which paces the run
+        self.limiter_tokens = 0
+        self._limits = [(model_limits(model), weight) for model, weight in models]
+        self._token_counter = None
+
+    def _file(self, file_path: str) -> dict:
+        return self.files.setdefault(file_path, {
+            "chunks": 0, "requests": 0, "cached_chunks": 0, "duplicate_chunks": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "overflows": 0, "error": None,
+        })
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the prompt tokens of text locally, falling back to the character estimate."""
+        if self._token_counter is None:
+            model = self.models[0][0]
+            try:
+                litellm = load_litellm_offline()
+                litellm.token_counter(model=model, text="")
+                self._token_counter = lambda t: litellm.token_counter(model=model, messages=[{"role": "user", "content": t}])
+            except Exception as e:
+                logger.warning(f"No local tokenizer for {model} ({e}); estimating tokens from characters.")
+                self._token_counter = estimate_tokens
+        return self._token_counter(text)
+
+    @property
+    def context_window(self):
+        windows = [limits["max_input_tokens"] for limits, _ in self._limits if limits["max_input_tokens"]]
+        return min(windows) if windows else None
+
+    def _price(self, key: str):
+        priced = [(limits[key], weight) for limits, weight in self._limits if limits[key] is not None]
+        if not priced:
+            return None
+        return sum(price * weight for price, weight in priced) / sum(weight for _, weight in priced)
+
+    def record_file(self, file_path: str, error: str = None):
+        """Lists a file in the plan, with its parse error if it could not be read."""
+        with self._lock:
+            stats = self._file(file_path)
+            if error is not None:
+                stats["error"] = error
+
+    def record_skipped_chunk(self, file_path: str, reason: str):
+        """Counts a chunk that would not be sent: "cached" or "duplicate"."""
+        with self._lock:
+            stats = self._file(file_path)
+            stats["chunks"] += 1
+            stats[f"{reason}_chunks"] += 1
+
+    def record_request(self, sources: list[tuple], prompt: str, completion_tokens: int):
+        """
+        Records one request that would be sent. sources lists (file_path, chunk) of the chunks
+        in the prompt; the tokens and cost are attributed to them by the length of their text.
+        """
+        prompt_tokens = self.count_tokens(prompt)
+        limiter_tokens = estimate_tokens(prompt)
+        input_price, output_price = self._price("input_cost_per_token"), self._price("output_cost_per_token")
+        cost = prompt_tokens * (input_price or 0.0) + completion_tokens * (output_price or 0.0)
+        if self.seconds_per_request is not None:
+            seconds = self.seconds_per_request
+        else:
+            seconds = BASE_LATENCY_SECONDS + completion_tokens / OUTPUT_TOKENS_PER_SECOND
+        context_window = self.context_window
+        overflow = context_window is not None and prompt_tokens > context_window
+        total_chars = sum(len(chunk["text"]) for _, chunk in sources) or 1
+        with self._lock:
+            self.requests += 1
+            self.request_seconds += seconds
+            self.limiter_tokens += limiter_tokens
+            for file_path, chunk in sources:
+                share = len(chunk["text"]) / total_chars
+                stats = self._file(file_path)
+                stats["chunks"] += 1
+                stats["requests"] += 1
+                stats["prompt_tokens"] += round(prompt_tokens * share)
+                stats["completion_tokens"] += round(completion_tokens * share)
+                stats["cost"] += cost * share
+                if overflow:
+                    stats["overflows"] += 1
+                    self.overflows.append({"file": file_path, "chunk_index": chunk["chunk_index"],
+                                           "page_number": chunk.get("page_number"), "slide_index": chunk.get("slide_index"),
+                                           "prompt_tokens": prompt_tokens, "context_window": context_window})
+
+    def eta(self) -> dict:
+        """
+        Returns the estimated duration in seconds under each constraint of the run and the
+        overall ETA, which is set by the tightest one.
+        """
+        bounds = {"latency": self.request_seconds / max(1, self.concurrency)}
+        if self.requests_per_minute:
+            bounds["rpm"] = self.requests * 60.0 / self.requests_per_minute
+        if self.tokens_per_minute:
+            bounds["tpm"] = self.limiter_tokens * 60.0 / self.tokens_per_minute
+        limited_by = max(bounds, key=bounds.get)
+        return {"seconds": bounds[limited_by], "limited_by": limited_by, "bounds": bounds}
+
+    def summary(self) -> dict:
+        """Returns the plan as a JSON-serializable dict."""
+        with self._lock:
+            files = {path: dict(stats) for path, stats in self.files.items()}
+            prices_known = all(limits["input_cost_per_token"] is not None for limits, _ in self._limits)
+            totals = {
+                "files": len(files),
+                "files_failed": sum(1 for f in files.values() if f["error"] is not None),
+                "chunks": sum(f["chunks"] for f in files.values()),
+                "cached_chunks": sum(f["cached_chunks"] for f in files.values()),
+                "duplicate_chunks": sum(f["duplicate_chunks"] for f in files.values()),
+                "requests": self.requests,
+                "prompt_tokens": sum(f["prompt_tokens"] for f in files.values()),
+                "completion_tokens": sum(f["completion_tokens"] for f in files.values()),
+                "estimated_cost": sum(f["cost"] for f in files.values()) if prices_known else None,
+                "overflows": len(self.overflows),
+            }
+            overflows = list(self.overflows)
+        return {
+            "models": [{"model": model, "weight": weight, **limits} for (model, weight), (limits, _) in zip(self.models, self._limits)],
+            "context_window": self.context_window,
+            "concurrency": self.concurrency,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "totals": totals,
+            "eta": self.eta(),
+            "overflows": overflows,
+            "files": files,
+        }
+
+    def write_json(self, path: str):
+        """Writes the plan to path as JSON."""
+        _atomic_write(path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+        logger.info(f"Wrote run plan to {path}")
+
+    def log_summary(self, max_files: int = 20):
+        """Logs the largest files, the context-window overflows and the totals."""
+        summary = self.summary()
+        totals = summary["totals"]
+        largest = sorted(summary["files"].items(), key=lambda item: item[1]["prompt_tokens"], reverse=True)
+        for file_path, stats in largest[:max_files]:
+            note = f" (error: {stats['error']})" if stats["error"] else ""
+            note += f", {stats['overflows']} over the context window" if stats["overflows"] else ""
+            logger.info(f"  {file_path}: {stats['chunks']} chunks, {stats['prompt_tokens']} prompt tokens{note}")
+        if len(largest) > max_files:
+            logger.info(f"  ... and {len(largest) - max_files} more files (see --plan-json for all).")
+        for overflow in summary["overflows"]:
+            logger.warning(f"{overflow['file']} (chunk {overflow['chunk_index']}) needs {overflow['prompt_tokens']} prompt tokens, "
+                           f"more than the context window of {overflow['context_window']}. Use --chunk-tokens to split it.")
+        if summary["context_window"] is None:
+            logger.warning("Context window unknown for this model; overflows were not checked.")
+        cost = f"${totals['estimated_cost']:.4f}" if totals["estimated_cost"] is not None else "unknown (no price information)"
+        eta = summary["eta"]
+        logger.info(
+            f"Plan: {totals['files']} files ({totals['files_failed']} unreadable), {totals['chunks']} chunks "
+            f"({totals['cached_chunks']} cached, {totals['duplicate_chunks']} duplicates), {totals['requests']} LLM requests, "
+            f"{totals['prompt_tokens']} prompt tokens + ~{totals['completion_tokens']} completion tokens, "
+            f"estimated cost {cost}, ETA {_format_seconds(eta['seconds'])} (limited by {eta['limited_by']})"
+        )
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
@@ -0,0 +1,243 @@
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from loguru import logger
+
+from .batch import MANIFEST_SUFFIX, default_manifest_path
+from .dedup import DUPLICATES_SUFFIX
+from .exporters import ParquetWriter
+from .journal import JOURNAL_SUFFIX
+from .watch import INDEX_SUFFIX
+
+DATA_EXTENSIONS = (".parquet", ".jsonl", ".csv")
+# Files written next to the outputs that are not part of the dataset
+SIDECAR_SUFFIXES = (JOURNAL_SUFFIX, DUPLICATES_SUFFIX, MANIFEST_SUFFIX, INDEX_SUFFIX)
+DEFAULT_MAX_SHARD_SIZE = "500MB"
+BATCH_ROWS = 10000
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?I?B)?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"B": 1, "KB": 10 ** 3, "MB": 10 ** 6, "GB": 10 ** 9, "TB": 10 ** 12,
+               "KIB": 2 ** 10, "MIB": 2 ** 20, "GIB": 2 ** 30, "TIB": 2 ** 40}
+
+
+def parse_size(size) -> int:
+    """Converts a size such as 500MB, 1GiB or 1048576 to bytes."""
+    if isinstance(size, int):
+        return size
+    match = _SIZE_RE.match(str(size))
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * _SIZE_UNITS[(match.group(2) or "B").upper()])
+
+
+def collect_data_files(input_path: str) -> list[str]:
+    """
+    Returns the data files to publish: input_path itself, or the JSONL, CSV or Parquet run
+    outputs in a directory (journals, duplicates reports, watch indexes, batch requests files
+    and their manifests are left out). All files must have the same format.
+    """
+    if os.path.isfile(input_path):
+        files = [input_path]
+    else:
+        files = []
+        for root, _, names in os.walk(input_path):
+            for name in names:
+                path = os.path.join(root, name)
+                if not name.endswith(DATA_EXTENSIONS) or name.endswith(SIDECAR_SUFFIXES):
+                    continue
+                if os.path.exists(default_manifest_path(path)):
+                    logger.info(f"Skipping batch requests file {path}")
+                    continue
+                files.append(path)
+        files.sort()
+    extensions = {os.path.splitext(f)[1].lower() for f in files}
+    if not files:
+        raise ValueError(f"No JSONL, CSV or Parquet files found in {input_path}")
+    if len(extensions) > 1 or not extensions <= set(DATA_EXTENSIONS):
+        raise ValueError(f"Expected files of a single format ({', '.join(DATA_EXTENSIONS)}), found: {', '.join(sorted(extensions))}")
+    return files
+
+
+def _arrow_type(name: str):
+    import pyarrow as pa
+    if name in ParquetWriter.INTEGER_FIELDS:
+        return pa.int64()
+    if name in ParquetWriter.FLOAT_FIELDS:
+        return pa.float64()
+    return pa.string()
+
+
+def _iter_jsonl_batches(file_path: str, batch_rows: int):
+    # Parsed line by line, like the exporters write them, so that an answer that is a number
+    # in one row and text in another does not break Arrow's type inference.
+    import pyarrow as pa
+    schema = None
+    rows = []
+
+    def _batch():
+        return pa.RecordBatch.from_pylist(rows, schema=schema)
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if schema is None:
+                schema = pa.schema([pa.field(name, _arrow_type(name)) for name in row])
+            for name in schema.names:
+                value = row.get(name)
+                if value is not None and pa.types.is_string(schema.field(name).type) and not isinstance(value, str):
+                    row[name] = json.dumps(value, ensure_ascii=False)
+            rows.append(row)
+            if len(rows) >= batch_rows:
+                yield _batch()
+                rows = []
+    if rows:
+        yield _batch()
+
+
+def iter_record_batches(file_path: str, batch_rows: int = BATCH_ROWS):
+    """
+    Yields a data file as Arrow record batches without loading it whole. Parquet files are
+    memory-mapped; CSV and JSONL files are parsed in blocks.
+    """
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".parquet":
+        yield from pq.ParquetFile(file_path, memory_map=True).iter_batches(batch_size=batch_rows)
+    elif ext == ".csv":
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            header = next(csv.reader(f), [])
+        # Free text columns must stay text even if the first block looks numeric
+        column_types = {name: _arrow_type(name) for name in header}
+        reader = pa_csv.open_csv(file_path, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+        yield from reader
+    elif ext == ".jsonl":
+        yield from _iter_jsonl_batches(file_path, batch_rows)
+    else:
+        raise ValueError(f"Unsupported file format: {ext}")
+
+
+def _conform(batch, schema, file_path: str):
+    """
+    Casts a record batch of file_path to schema, filling missing columns with nulls. Raises
+    ValueError if the batch has columns that are not in schema, rather than dropping them.
+    """
+    import pyarrow as pa
+    if batch.schema.equals(schema):
+        return batch
+    extra = set(batch.schema.names) - set(schema.names)
+    if extra:
+        raise ValueError(f"{file_path} has columns that the first file does not have ({', '.join(sorted(extra))}); "
+                         f"its schema is incompatible with the rest of the dataset. Publish it separately.")
+    arrays = []
+    for field in schema:
+        if field.name in batch.schema.names:
+            arrays.append(batch.column(field.name).cast(field.type))
+        else:
+            arrays.append(pa.nulls(batch.num_rows, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_shards(files: list[str], staging_dir: str, split: str, max_shard_size=DEFAULT_MAX_SHARD_SIZE) -> list[str]:
+    """
+    Writes files as Parquet shards named <split>-NNNNN-of-NNNNN.parquet into staging_dir.
+    Parquet files up to max_shard_size are linked as they are (no copy, no conversion);
+    larger files and JSONL/CSV files are streamed into new shards of about max_shard_size
+    (uncompressed Arrow size). Returns the shard paths.
+    """
+    import pyarrow.parquet as pq
+    max_shard_bytes = parse_size(max_shard_size)
+    staged = []
+    schema = None
+    writer = None
+    shard_bytes = 0
+
+    def _next_path():
+        return os.path.join(staging_dir, f"shard-{len(staged):05d}.parquet")
+
+    for file_path in files:
+        if file_path.lower().endswith(".parquet") and os.path.getsize(file_path) <= max_shard_bytes:
+            file_schema = pq.read_schema(file_path)
+            if schema is None or file_schema.equals(schema):
+                schema = file_schema
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                path = _next_path()
+                os.symlink(os.path.abspath(file_path), path)
+                staged.append(path)
+                continue
+        logger.info(f"Converting {file_path} to Parquet shards.")
+        for batch in iter_record_batches(file_path):
+            if schema is None:
+                schema = batch.schema
+            batch = _conform(batch, schema, file_path)
+            if writer is None:
+                path = _next_path()
+                writer = pq.ParquetWriter(path, schema)
+                staged.append(path)
+                shard_bytes = 0
+            writer.write_batch(batch)
+            shard_bytes += batch.nbytes
+            if shard_bytes >= max_shard_bytes:
+                writer.close()
+                writer = None
+    if writer is not None:
+        writer.close()
+
+    shards = []
+    for i, path in enumerate(staged):
+        shard_path = os.path.join(staging_dir, f"{split}-{i:05d}-of-{len(staged):05d}.parquet")
+        os.rename(path, shard_path)
+        shards.append(shard_path)
+    return shards
+
+
+def upload_shards(staging_dir: str, repo_id: str, split: str, local_hub: str = None):
+    """
+    Uploads the shards in staging_dir to data/ in the dataset repository, replacing the
+    split's previous shards. With local_hub, the repository is a directory under local_hub
+    instead, which stands in for the Hub in tests and offline runs.
+    """
+    if local_hub:
+        data_dir = os.path.join(local_hub, repo_id, "data")
+        os.makedirs(data_dir, exist_ok=True)
+        for name in os.listdir(data_dir):
+            if name.startswith(f"{split}-") and name.endswith(".parquet"):
+                os.remove(os.path.join(data_dir, name))
+        for name in sorted(os.listdir(staging_dir)):
+            shutil.copyfile(os.path.join(staging_dir, name), os.path.join(data_dir, name))
+        logger.info(f"Wrote split '{split}' to local hub directory {os.path.join(local_hub, repo_id)}")
+        return
+
+    from huggingface_hub import HfApi
+    api = HfApi()
+    api.create_repo(repo_id, repo_type="dataset", exist_ok=True)
+    api.upload_folder(repo_id=repo_id, repo_type="dataset", folder_path=staging_dir, path_in_repo="data",
+                      delete_patterns=f"{split}-*.parquet", commit_message=f"Upload {split} split")
+    logger.info(f"Successfully pushed split '{split}' to {repo_id} on Hugging Face Hub.")
+
+
+def push_files_to_hub(input_path: str, repo_id: str, split: str = "train", max_shard_size=DEFAULT_MAX_SHARD_SIZE,
+                      local_hub: str = None) -> list[str]:
+    """
+    Publishes a data file, or a directory of run outputs, as one split of a Hub dataset.
+    Rows are streamed through Arrow into Parquet shards, so memory use does not grow with
+    the size of the data. Returns the names of the uploaded shards.
+    """
+    files = collect_data_files(input_path)
+    if not local_hub:
+        from huggingface_hub import get_token
+        if get_token() is None:
+            raise RuntimeError("You are not logged in to Hugging Face. Please run `huggingface-cli login` in your terminal.")
+    logger.info(f"Publishing {len(files)} file(s) as split '{split}' of {repo_id}")
+    with tempfile.TemporaryDirectory(prefix="damon-push-") as staging_dir:
+        shards = write_shards(files, staging_dir, split, max_shard_size)
+        upload_shards(staging_dir, repo_id, split, local_hub)
+        return [os.path.basename(shard) for shard in shards]
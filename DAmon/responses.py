@@ -0,0 +1,260 @@
+import json
+import re
+
+from loguru import logger
+
+QA_REQUIRED_KEYS = ["question", "thought", "answer"]
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+
+class InvalidResponseError(ValueError):
+    """The LLM response could not be parsed or repaired into a list of Q&A pairs."""
+
+
+class IncompleteStreamError(Exception):
+    """A streamed response broke off after some Q&A pairs had arrived; those are in qa_pairs."""
+
+    def __init__(self, message: str, qa_pairs: list[dict]):
+        super().__init__(message)
+        self.qa_pairs = qa_pairs
+
+
+def _close_truncated_array(text: str):
+    """
+    Cuts a truncated JSON array back to its last complete element and closes it.
+    Returns None if no complete element was found.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    last_complete = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            depth -= 1
+            if depth == 1:
+                last_complete = i
+    if last_complete is None:
+        return None
+    return text[:last_complete + 1] + "]"
+
+
+def _unwrap(data) -> list:
+    """Accepts a list of pairs, a single pair, or an object wrapping the list (e.g. {"qa_pairs": [...]})."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if all(key in data for key in QA_REQUIRED_KEYS):
+            return [data]
+        lists = [value for value in data.values() if isinstance(value, list)]
+        if len(lists) == 1:
+            return lists[0]
+    raise InvalidResponseError(f"Unexpected JSON structure in LLM response: {type(data).__name__}")
+
+
+def parse_qa_json(content: str) -> list:
+    """
+    Parses the LLM's JSON answer, repairing common defects locally before giving up:
+    markdown code fences, prose around the JSON, and arrays truncated mid-element
+    (e.g. by the max token limit). Raises InvalidResponseError if nothing usable remains.
+    """
+    if content is None:
+        raise InvalidResponseError("Empty LLM response")
+    try:
+        return _unwrap(json.loads(content))
+    except json.JSONDecodeError:
+        pass
+
+    candidate = content.strip()
+    fenced = _FENCE_RE.search(candidate)
+    if fenced:
+        candidate = fenced.group(1).strip()
+    starts = [i for i in (candidate.find("["), candidate.find("{")) if i != -1]
+    if starts:
+        candidate = candidate[min(starts):]
+
+    attempts = [candidate, candidate[:candidate.rfind("]") + 1], candidate[:candidate.rfind("}") + 1]]
+    if candidate.startswith("["):
+        attempts.append(_close_truncated_array(candidate))
+    elif candidate.startswith("{"):
+        # An object wrapping a truncated array: repair the array inside it
+        inner_start = candidate.find("[")
+        if inner_start != -1:
+            attempts.append(_close_truncated_array(candidate[inner_start:]))
+    for attempt in attempts:
+        if not attempt:
+            continue
+        try:
+            data = _unwrap(json.loads(attempt))
+        except (json.JSONDecodeError, InvalidResponseError):
+            continue
+        logger.warning("Repaired malformed JSON in LLM response locally instead of re-generating it.")
+        return data
+    raise InvalidResponseError("Invalid JSON response from LLM")
+
+
+def validate_qa_pairs(qa_pairs: list, model_name: str) -> list[dict]:
+    """Keeps the well-formed Q&A pairs and tags each with the model name."""
+    validated_qa_pairs = []
+    for qa in qa_pairs:
+        if isinstance(qa, dict) and all(key in qa for key in QA_REQUIRED_KEYS):
+            qa["model"] = model_name
+            validated_qa_pairs.append(qa)
+        else:
+            logger.warning(f"Skipping malformed QA pair from LLM: {qa}")
+    return validated_qa_pairs
+
+
+class IncrementalQAParser:
+    """
+    Parses a JSON answer as it streams in. feed() returns the elements of the answer's array
+    of Q&A pairs (a top-level array, or an array wrapped in an object) as soon as each one
+    is complete, so they can be used before the rest of the answer has been generated.
+
+    An array inside the top-level object is only taken as the wrapper of the pairs if its
+    key is not a Q&A key and no Q&A key came before it; otherwise the object is a single
+    pair (whose fields may hold arrays), which is left to parse_qa_json.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._element_start = None
+        self._string_start = None
+        self._last_string = None
+        self._keys = set()  # keys of the top-level object
+        self._wrapper_seen = False
+        self._in_wrapper = False
+
+    def _at_element_level(self) -> bool:
+        return self._stack == ["["] or (self._stack == ["{", "["] and self._in_wrapper)
+
+    def _opens_wrapper(self) -> bool:
+        return (self._stack == ["{"] and not self._wrapper_seen and self._last_string not in QA_REQUIRED_KEYS
+                and not self._keys.intersection(QA_REQUIRED_KEYS))
+
+    def feed(self, delta: str) -> list:
+        """Adds the next piece of the answer and returns the array elements it completed."""
+        elements = []
+        start = len(self.text)
+        self.text += delta
+        for i in range(start, len(self.text)):
+            ch = self.text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_start is not None:
+                        try:
+                            self._last_string = json.loads(self.text[self._string_start:i + 1])
+                        except json.JSONDecodeError:
+                            self._last_string = None
+                        self._string_start = None
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._stack == ["{"]:
+                    self._string_start = i
+            elif ch == ":" and self._stack == ["{"]:
+                self._keys.add(self._last_string)
+            elif ch in "[{":
+                if ch == "{" and self._at_element_level():
+                    self._element_start = i
+                elif ch == "[" and self._opens_wrapper():
+                    self._wrapper_seen = self._in_wrapper = True
+                self._stack.append(ch)
+            elif ch in "]}":
+                if ch == "]" and self._in_wrapper and self._stack == ["{", "["]:
+                    self._in_wrapper = False
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._element_start is not None and self._at_element_level():
+                    try:
+                        elements.append(json.loads(self.text[self._element_start:i + 1]))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping unparsable element in streamed LLM response: {self.text[self._element_start:i + 1][:200]}")
+                    self._element_start = None
+        return elements
+
+
+def _delta_text(chunk) -> str:
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    delta = getattr(choices[0], "delta", None)
+    return getattr(delta, "content", None) or ""
+
+
+class QAStream:
+    """
+    Iterates over the validated Q&A pairs of a streamed litellm completion as each one is
+    complete. Once max_pairs pairs have arrived, the stream is closed, which cancels the
+    rest of the generation (stopped_early). If the stream breaks off after some pairs,
+    iteration ends with those and broken is set, so that callers can tell the answer is
+    incomplete. Answers that are not an array (e.g. a single pair) are parsed when the
+    stream ends. The received chunks and text are kept in chunks and content.
+    """
+
+    def __init__(self, stream, model_name: str, max_pairs: int = None):
+        self._stream = stream
+        self.model_name = model_name
+        self.max_pairs = max_pairs
+        self.chunks = []
+        self.content = ""
+        self.stopped_early = False
+        self.broken = False
+
+    def close(self):
+        """Closes the underlying HTTP stream."""
+        for source in (getattr(self._stream, "completion_stream", None), self._stream):
+            close = getattr(source, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.debug(f"Error closing LLM stream: {e}")
+                return
+
+    def __iter__(self):
+        parser = IncrementalQAParser()
+        received = 0
+        try:
+            for chunk in self._stream:
+                self.chunks.append(chunk)
+                delta = _delta_text(chunk)
+                if not delta:
+                    continue
+                for qa in validate_qa_pairs(parser.feed(delta), self.model_name):
+                    yield qa
+                    received += 1
+                    if self.max_pairs is not None and received >= self.max_pairs:
+                        self.stopped_early = True
+                        return
+        except Exception as e:
+            if not received:
+                raise
+            logger.warning(f"Stream from {self.model_name} broke off after {received} Q&A pairs ({e}).")
+            self.broken = True
+            return
+        finally:
+            self.content = parser.text
+            self.close()
+        if not received:
+            yield from validate_qa_pairs(parse_qa_json(parser.text), self.model_name)
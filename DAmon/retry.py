@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from loguru import logger
+
+from .responses import IncompleteStreamError, InvalidResponseError
+
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# HTTP statuses worth retrying: timeouts, conflicts, throttling and server-side failures
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# Statuses that mean the provider is saturated and every worker should back off
+SATURATION_STATUS_CODES = {429, 503, 529}
+# Exception types that indicate a bug or a hopeless request rather than a transient failure
+NON_RETRYABLE_EXCEPTIONS = (TypeError, KeyError, AttributeError, NotImplementedError)
+
+
+def status_code_of(exc: BaseException):
+    """Returns the HTTP status code carried by a litellm/openai/httpx exception, if any."""
+    for candidate in (exc, getattr(exc, "response", None)):
+        code = getattr(candidate, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Decides whether a failed LLM call is worth another attempt. Authentication, permission,
+    bad-request (including context window overflows) and not-found errors are final.
+    """
+    if isinstance(exc, IncompleteStreamError):
+        # The pairs that did arrive are kept rather than paid for again
+        return False
+    if isinstance(exc, InvalidResponseError):
+        # Local repair already failed; a fresh generation may still succeed
+        return True
+    if isinstance(exc, NON_RETRYABLE_EXCEPTIONS):
+        return False
+    code = status_code_of(exc)
+    if code is None:
+        # Connection resets, DNS failures and timeouts surface without a status
+        return True
+    return code in RETRYABLE_STATUS_CODES
+
+
+def is_saturation(exc: BaseException) -> bool:
+    """True if the provider signalled it is rate limiting or overloaded."""
+    return status_code_of(exc) in SATURATION_STATUS_CODES
+
+
+def retry_after_seconds(exc: BaseException):
+    """Reads a Retry-After (or retry-after-ms) hint from the exception's response headers."""
+    headers = None
+    for source in (getattr(exc, "response", None), exc):
+        headers = getattr(source, "headers", None) or getattr(source, "litellm_response_headers", None)
+        if headers:
+            break
+    if not headers:
+        return None
+    try:
+        headers = {str(key).lower(): value for key, value in dict(headers).items()}
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def wait_adaptive(retry_state) -> float:
+    """
+    Tenacity wait strategy: honours Retry-After when the provider sends it, otherwise
+    exponential backoff with full jitter so that concurrent workers do not retry in lockstep.
+    """
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    hinted = retry_after_seconds(exc) if exc is not None else None
+    if hinted is not None:
+        return min(hinted, BACKOFF_MAX)
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (retry_state.attempt_number - 1))
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Shared pause switch for all workers talking to one provider.
+
+    When any request is throttled (429) or the provider is overloaded (503/529), the breaker
+    opens for the Retry-After period, or for a cooldown that doubles with each consecutive
+    trip. Every worker waits for it to close before sending its next request. A successful
+    request resets the cooldown.
+
+    The cooldown escalates at most once per open period: the other failures of a burst of
+    concurrent requests (those that fail while the breaker is open, or that were sent before
+    it opened) only extend the pause to their Retry-After, if they carry a longer one.
+    """
+
+    def __init__(self, base_cooldown: float = 2.0, max_cooldown: float = 120.0):
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._open_until = 0.0
+        self._opened_at = float("-inf")
+        self._consecutive_trips = 0
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """Returns the seconds until the breaker closes (0 when closed)."""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def wait(self):
+        """Blocks while the breaker is open."""
+        while True:
+            remaining = self.remaining()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def trip(self, retry_after: float = None, reason: str = "Provider saturated", sent_at: float = None):
+        """
+        Opens the breaker after a saturation signal. sent_at is the time.monotonic() at which
+        the failed request was sent, if known.
+        """
+        with self._lock:
+            now = time.monotonic()
+            same_burst = now < self._open_until or (sent_at is not None and sent_at < self._opened_at)
+            if same_burst:
+                if retry_after is None:
+                    return
+            else:
+                self._consecutive_trips += 1
+                if retry_after is None:
+                    retry_after = self.base_cooldown * 2 ** (self._consecutive_trips - 1)
+            retry_after = min(retry_after, self.max_cooldown)
+            until = now + retry_after
+            if until > self._open_until:
+                if now >= self._open_until:
+                    self._opened_at = now
+                self._open_until = until
+                logger.warning(f"{reason}; pausing LLM requests for {retry_after:.1f}s.")
+
+    def record_success(self):
+        """Resets the cooldown after a successful request."""
+        with self._lock:
+            self._consecutive_trips = 0
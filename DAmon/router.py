@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import threading
+import time
+
+from loguru import logger
+
+from .concurrency import RateLimiter
+from .responses import InvalidResponseError
+from .retry import MAX_ATTEMPTS, CircuitBreaker, is_retryable, is_saturation, retry_after_seconds, status_code_of
+
+# Statuses that mean the deployment itself is unusable (bad key, no access, unknown deployment)
+# rather than the request; the router fails over instead of giving up.
+DEPLOYMENT_DOWN_STATUS_CODES = {401, 403, 404}
+# Statuses with which a deployment rejects one request that another deployment may accept
+# (e.g. litellm's ContextWindowExceededError or UnsupportedParamsError for one provider)
+REQUEST_REJECTED_STATUS_CODES = {400}
+DOWN_COOLDOWN = 120.0
+LATENCY_SMOOTHING = 0.3
+
+
+def _resolve_env(params: dict) -> dict:
+    """Replaces "os.environ/NAME" values with the environment variable, as litellm's router does."""
+    resolved = {}
+    for key, value in (params or {}).items():
+        if isinstance(value, str) and value.startswith("os.environ/"):
+            value = os.environ.get(value[len("os.environ/"):])
+        resolved[key] = value
+    return resolved
+
+
+def _header_value(headers: dict, name: str):
+    for key in (name, f"llm_provider-{name}"):
+        if key in headers:
+            try:
+                return float(headers[key])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def remaining_quota_fraction(response):
+    """Returns the remaining fraction of the provider's rate limit from the response headers, if reported."""
+    hidden_params = getattr(response, "_hidden_params", None) or {}
+    headers = hidden_params.get("additional_headers") or {}
+    fractions = []
+    for kind in ("requests", "tokens"):
+        remaining = _header_value(headers, f"x-ratelimit-remaining-{kind}")
+        limit = _header_value(headers, f"x-ratelimit-limit-{kind}")
+        if remaining is not None and limit:
+            fractions.append(remaining / limit)
+    return min(fractions) if fractions else None
+
+
+class Deployment:
+    """One litellm model/deployment in a pool, with its routing state."""
+
+    def __init__(self, model: str, weight: float = 1.0, name: str = None, fallback: bool = False,
+                 litellm_params: dict = None, rpm: int = None, tpm: int = None):
+        self.model = model
+        self.weight = float(weight)
+        self.name = name or model
+        self.fallback = fallback
+        self.litellm_params = _resolve_env(litellm_params)
+        self.rate_limiter = RateLimiter(rpm, tpm) if rpm or tpm else None
+        self.breaker = CircuitBreaker()
+        self.latency = None  # exponentially weighted moving average, seconds
+        self.remaining_quota = None  # fraction reported by the provider
+        self.in_flight = 0
+
+    def score(self, default_latency: float) -> float:
+        quota = 1.0 if self.remaining_quota is None else self.remaining_quota
+        if self.rate_limiter is not None:
+            quota = min(quota, 1.0 - self.rate_limiter.usage())
+        latency = self.latency or default_latency
+        return self.weight * max(quota, 0.05) / (latency * (1 + self.in_flight))
+
+    def __repr__(self):
+        return f"Deployment({self.name!r}, weight={self.weight})"
+
+
+class ModelRouter:
+    """
+    Spreads extraction requests over a pool of deployments.
+
+    Each attempt goes to an available primary deployment, chosen at random in proportion to
+    its weight and remaining quota, divided by its recent latency and in-flight requests.
+    Throttled or failing deployments are cooled down and skipped. A deployment that rejects
+    a request (400, e.g. a context window overflow) is skipped for that request only.
+    Fallback deployments are only used while no primary deployment is available.
+    """
+
+    def __init__(self, deployments: list[Deployment], max_attempts: int = None):
+        if not deployments:
+            raise ValueError("A model pool needs at least one deployment")
+        self.primary = [d for d in deployments if not d.fallback] or list(deployments)
+        self.fallbacks = [d for d in deployments if d.fallback and d not in self.primary]
+        self.max_attempts = max_attempts or max(MAX_ATTEMPTS, len(deployments) + 1)
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    @property
+    def name(self) -> str:
+        """Label of the pool, used for cache keys and journals."""
+        return "+".join(d.name for d in self.primary)
+
+    @classmethod
+    def from_specs(cls, models: list[str], fallback_models: list[str] = ()) -> "ModelRouter":
+        """Builds a pool from "model" or "model=weight" strings."""
+        deployments = []
+        for spec, fallback in [(m, False) for m in models] + [(m, True) for m in fallback_models]:
+            model, weight = spec, 1.0
+            if "=" in spec:
+                head, tail = spec.rsplit("=", 1)
+                try:
+                    model, weight = head, float(tail)
+                except ValueError:
+                    pass
+            deployments.append(Deployment(model, weight, fallback=fallback))
+        return cls(deployments)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ModelRouter":
+        """
+        Builds a pool from a JSON file: either a list of deployments or {"deployments": [...]}.
+        Each deployment has "model" and optionally "name", "weight", "fallback", "rpm", "tpm"
+        and "litellm_params" (e.g. api_base, api_key; "os.environ/NAME" values are resolved).
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        entries = config["deployments"] if isinstance(config, dict) else config
+        return cls([Deployment(**entry) for entry in entries])
+
+    def _pick(self, candidates: list[Deployment]) -> Deployment:
+        known = [d.latency for d in candidates if d.latency]
+        default_latency = sum(known) / len(known) if known else 1.0
+        scores = [d.score(default_latency) for d in candidates]
+        return self._random.choices(candidates, weights=scores)[0]
+
+    def _acquire(self, tokens: int, exclude: set):
+        """Reserves the next deployment, waiting while all of them are cooling down or rate limited."""
+        while True:
+            waits = []
+            with self._lock:
+                for group in (self.primary, self.fallbacks):
+                    candidates = []
+                    for deployment in group:
+                        if deployment in exclude:
+                            continue
+                        remaining = deployment.breaker.remaining()
+                        if remaining > 0:
+                            waits.append(remaining)
+                        else:
+                            candidates.append(deployment)
+                    while candidates:
+                        deployment = self._pick(candidates)
+                        wait = deployment.rate_limiter.try_acquire(tokens) if deployment.rate_limiter else 0.0
+                        if wait <= 0:
+                            deployment.in_flight += 1
+                            return deployment
+                        waits.append(wait)
+                        candidates.remove(deployment)
+            if not waits:
+                return None
+            time.sleep(min(waits))
+
+    def _on_success(self, deployment: Deployment, seconds: float, response):
+        with self._lock:
+            deployment.in_flight -= 1
+            if deployment.latency is None:
+                deployment.latency = seconds
+            else:
+                deployment.latency += LATENCY_SMOOTHING * (seconds - deployment.latency)
+            quota = remaining_quota_fraction(response)
+            if quota is not None:
+                deployment.remaining_quota = quota
+        deployment.breaker.record_success()
+
+    def _on_failure(self, deployment: Deployment, exc: Exception, sent_at: float = None):
+        with self._lock:
+            deployment.in_flight -= 1
+        if isinstance(exc, InvalidResponseError):
+            return
+        if is_saturation(exc):
+            deployment.breaker.trip(retry_after_seconds(exc), f"Deployment {deployment.name} throttled", sent_at)
+        elif status_code_of(exc) in DEPLOYMENT_DOWN_STATUS_CODES:
+            deployment.breaker.trip(DOWN_COOLDOWN, f"Deployment {deployment.name} unavailable", sent_at)
+        elif is_retryable(exc):
+            deployment.breaker.trip(None, f"Deployment {deployment.name} failing", sent_at)
+
+    def run(self, attempt, tokens: int = 0, metrics=None):
+        """
+        Calls attempt(deployment) -> (result, response) on routed deployments until one succeeds.
+        A request that a deployment rejects is tried on the others; once every deployment has
+        rejected it, the last error is raised. Other errors that no deployment can fix are
+        raised immediately.
+        """
+        exclude = set()
+        last_error = None
+        for attempt_number in range(1, self.max_attempts + 1):
+            deployment = self._acquire(tokens, exclude)
+            if deployment is None:
+                break
+            sent_at = time.monotonic()
+            start = time.perf_counter()
+            try:
+                result, response = attempt(deployment)
+            except Exception as e:
+                last_error = e
+                self._on_failure(deployment, e, sent_at)
+                code = status_code_of(e)
+                excluded = code in DEPLOYMENT_DOWN_STATUS_CODES or code in REQUEST_REJECTED_STATUS_CODES
+                if not excluded and not is_retryable(e):
+                    raise
+                if excluded:
+                    exclude.add(deployment)
+                if metrics is not None and attempt_number < self.max_attempts:
+                    metrics.record_retry(deployment.name)
+                logger.debug(f"Attempt {attempt_number} on {deployment.name} failed ({e}); failing over.")
+                continue
+            self._on_success(deployment, time.perf_counter() - start, response)
+            return result
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("No model deployment is available")
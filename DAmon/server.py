@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from loguru import logger
+
+from .pipeline import Pipeline
+
+DEFAULT_MAX_UPLOAD_SIZE = "100MB"
+
+
+def parse_num_qa(value):
+    """Returns num_qa from a JSON body or query string as a positive int (None if absent), or raises ValueError."""
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f'"num_qa" must be a positive integer, got {json.dumps(value, ensure_ascii=False)}.')
+    return value
+
+
+class ExtractionServer(ThreadingHTTPServer):
+    """
+    HTTP server around a shared Pipeline. root is the directory whose files may be requested
+    by path; without it, documents can only be uploaded.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, pipeline: Pipeline, root: str = None, max_upload_bytes: int = None):
+        super().__init__(address, ExtractionHandler)
+        self.pipeline = pipeline
+        self.root = os.path.realpath(root) if root else None
+        self.max_upload_bytes = max_upload_bytes
+
+    def resolve_path(self, path: str) -> str:
+        """Returns path resolved inside root, or raises PermissionError."""
+        if self.root is None:
+            raise PermissionError("Requests by path are disabled; start the server with --root.")
+        resolved = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, resolved]) != self.root:
+            raise PermissionError(f"{path} is outside the server root.")
+        if not os.path.exists(resolved):
+            raise FileNotFoundError(f"{path} does not exist.")
+        return resolved
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health   -> {"status": "ok", "model": ...}
+    GET  /metrics  -> the pipeline's RunMetrics summary as JSON
+    POST /extract  -> Q&A rows as newline-delimited JSON, streamed as they are extracted
+
+    POST /extract takes either a JSON body {"path": ..., "num_qa": ...} naming a file or
+    directory under the server root, or the document itself as the body with its name in
+    the "filename" query parameter (e.g. /extract?filename=report.pdf&num_qa=5). Failures
+    after the response has started are sent as {"error": ...} lines.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "model": self.server.pipeline.litellm_model_name})
+        elif path == "/metrics":
+            self._send_json(200, self.server.pipeline.metrics.summary())
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            self._send_json(404, {"error": f"Unknown endpoint: {url.path}"})
+            return
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if self.server.max_upload_bytes is not None and length > self.server.max_upload_bytes:
+            self._send_json(413, {"error": f"Request body exceeds {self.server.max_upload_bytes} bytes."})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+        try:
+            if self.headers.get("Content-Type", "").split(";")[0].strip() == "application/json":
+                request = json.loads(body or b"{}")
+                if not isinstance(request, dict):
+                    raise ValueError('JSON requests must be an object, e.g. {"path": "report.pdf"}.')
+                num_qa_pairs = parse_num_qa(request.get("num_qa", query.get("num_qa")))
+                if not request.get("path"):
+                    raise ValueError('JSON requests need a "path".')
+                input_path = self.server.resolve_path(request["path"])
+                self._stream_rows(input_path, num_qa_pairs)
+            else:
+                filename = os.path.basename(query.get("filename", ""))
+                if not filename or "." not in filename:
+                    raise ValueError('Uploads need a "filename" query parameter with the file extension.')
+                num_qa_pairs = parse_num_qa(query.get("num_qa"))
+                with tempfile.TemporaryDirectory(prefix="damon-serve-") as upload_dir:
+                    upload_path = os.path.join(upload_dir, filename)
+                    with open(upload_path, 'wb') as f:
+                        f.write(body)
+                    self._stream_rows(upload_path, num_qa_pairs)
+        except PermissionError as e:
+            self._send_json(403, {"error": str(e)})
+        except FileNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _stream_rows(self, input_path: str, num_qa_pairs: int = None):
+        errors = []
+        rows = self.server.pipeline.iter_path_rows(input_path, num_qa_pairs=num_qa_pairs, errors=errors)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        count = 0
+        try:
+            for row in rows:
+                self._write_chunk((json.dumps(row, ensure_ascii=False) + "\n").encode('utf-8'))
+                count += 1
+            for error in errors:
+                self._write_chunk((json.dumps({"error": error}, ensure_ascii=False) + "\n").encode('utf-8'))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(f"Client disconnected after {count} rows; stopping extraction of {os.path.basename(input_path)}.")
+            self.close_connection = True
+        finally:
+            rows.close()
+        logger.info(f"Streamed {count} Q&A rows for {os.path.basename(input_path)}")
+
+
+def serve(pipeline: Pipeline, host: str = "127.0.0.1", port: int = 8000, root: str = None, max_upload_bytes: int = None):
+    """Serves pipeline over HTTP until interrupted."""
+    pipeline.warm_up()
+    server = ExtractionServer((host, port), pipeline, root, max_upload_bytes)
+    logger.info(f"Serving {pipeline.litellm_model_name} on http://{host}:{server.server_port}"
+                + (f" (files under {server.root})" if server.root else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping server.")
+    finally:
+        server.server_close()
+        pipeline.close()
@@ -0,0 +1,282 @@
+import json
+import os
+import time
+
+from loguru import logger
+
+INDEX_SUFFIX = ".index.jsonl"
+
+
+def default_index_path(output_path: str) -> str:
+    """Returns the watch index path that belongs to an output path (file or directory)."""
+    output_dir = os.path.dirname(output_path)
+    base_filename, _ = os.path.splitext(os.path.basename(output_path))
+    return os.path.join(output_dir, f"{base_filename or 'output'}{INDEX_SUFFIX}")
+
+
+class FileIndex:
+    """
+    Persisted index of the files that were processed, as (size, mtime) per absolute path,
+    and of the files that failed, with their number of failed attempts.
+
+    A failed file is retried after retry_backoff seconds, doubling with each failure, until
+    max_attempts attempts have failed; it is then left alone until its size or mtime changes.
+
+    Stored as an append-only JSONL log, so recording a file costs one short line; the log
+    is compacted to one line per file when it is opened.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, retry_backoff: float = 300.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._files = {}
+        self._failures = {}  # path -> (size, mtime, attempts, retry_at); retry_at is None once given up
+        index_dir = os.path.dirname(path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir, exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+            self._compact()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash; that file is simply processed again
+                    continue
+                self._apply(record)
+        logger.info(f"Loaded {len(self._files)} processed and {len(self._failures)} failed files from watch index {self.path}")
+
+    def _apply(self, record: dict):
+        path = record["path"]
+        if "failures" in record:
+            self._files.pop(path, None)
+            self._failures[path] = (record["size"], record["mtime"], record["failures"], record.get("retry_at"))
+        else:
+            self._failures.pop(path, None)
+            self._files[path] = (record["size"], record["mtime"])
+
+    @staticmethod
+    def _failure_record(path: str, size: int, mtime: float, attempts: int, retry_at) -> dict:
+        return {"path": path, "size": size, "mtime": mtime, "failures": attempts, "retry_at": retry_at}
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for path, (size, mtime) in self._files.items():
+                f.write(json.dumps({"path": path, "size": size, "mtime": mtime}, ensure_ascii=False) + "\n")
+            for path, failure in self._failures.items():
+                f.write(json.dumps(self._failure_record(path, *failure), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __len__(self):
+        return len(self._files)
+
+    def get(self, file_path: str):
+        """Returns the recorded (size, mtime) of file_path, or None."""
+        return self._files.get(os.path.abspath(file_path))
+
+    def is_settled(self, file_path: str, size: int, mtime: float, now: float = None) -> bool:
+        """
+        True if file_path needs no processing at this size and mtime: it was processed, or it
+        failed and is waiting for its next attempt or has used up its attempts.
+        """
+        abs_path = os.path.abspath(file_path)
+        if self._files.get(abs_path) == (size, mtime):
+            return True
+        failure = self._failures.get(abs_path)
+        if failure is None or failure[:2] != (size, mtime):
+            return False
+        retry_at = failure[3]
+        return retry_at is None or (now if now is not None else time.time()) < retry_at
+
+    def record(self, file_path: str, size: int, mtime: float):
+        """Records file_path as processed at the given size and mtime."""
+        abs_path = os.path.abspath(file_path)
+        self._files[abs_path] = (size, mtime)
+        self._failures.pop(abs_path, None)
+        self._append({"path": abs_path, "size": size, "mtime": mtime})
+
+    def record_failure(self, file_path: str, size: int, mtime: float) -> int:
+        """
+        Records a failed attempt at file_path at the given size and mtime and returns the
+        number of consecutive failed attempts at this version of the file.
+        """
+        abs_path = os.path.abspath(file_path)
+        failure = self._failures.get(abs_path)
+        attempts = failure[2] + 1 if failure is not None and failure[:2] == (size, mtime) else 1
+        if attempts >= self.max_attempts:
+            retry_at = None
+            logger.warning(f"Giving up on {file_path} after {attempts} failed attempts; it is retried once it changes.")
+        else:
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            retry_at = time.time() + delay
+            logger.warning(f"Attempt {attempts} at {file_path} failed; retrying in {delay:g}s at the earliest.")
+        self._files.pop(abs_path, None)
+        self._failures[abs_path] = (size, mtime, attempts, retry_at)
+        self._append(self._failure_record(abs_path, size, mtime, attempts, retry_at))
+        return attempts
+
+    def close(self):
+        self._file.close()
+
+
+class DirectoryWatcher:
+    """
+    Polls a directory tree for new or changed files.
+
+    Directories whose mtime is unchanged since the previous scan are not listed again (only
+    descended into), so a poll of a large, mostly static tree costs one stat per directory.
+    Files changed in place do not touch their directory's mtime; a full scan every
+    full_scan_interval seconds, and at startup, picks those up. A file is only reported once
+    its size and mtime have been stable for settle_seconds, so files still being copied
+    into the folder are not processed half-written. Files the index holds as settled
+    (processed, or failed and waiting for their next attempt) are not reported.
+    """
+
+    def __init__(self, root: str, is_supported, index: FileIndex, settle_seconds: float = 2.0,
+                 full_scan_interval: float = 60.0):
+        self.root = root
+        self.is_supported = is_supported
+        self.index = index
+        self.settle_seconds = settle_seconds
+        self.full_scan_interval = full_scan_interval
+        self._dirs = {}  # directory -> (mtime, subdirectories)
+        self._pending = {}  # path -> (size, mtime) seen at the previous poll
+        self._last_full_scan = None
+
+    def _scan_dir(self, directory: str, full: bool, found: list):
+        try:
+            mtime = os.stat(directory).st_mtime
+        except FileNotFoundError:
+            self._dirs.pop(directory, None)
+            return
+        known = self._dirs.get(directory)
+        if not full and known is not None and known[0] == mtime:
+            subdirs = known[1]
+        else:
+            subdirs = []
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, PermissionError) as e:
+                logger.warning(f"Cannot list {directory}: {e}")
+                return
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and self.is_supported(entry.name):
+                    found.append(entry.path)
+            self._dirs[directory] = (mtime, subdirs)
+        for subdir in subdirs:
+            self._scan_dir(subdir, full, found)
+
+    def poll(self) -> list[tuple]:
+        """Returns (path, size, mtime) of the new or changed files that are ready to process."""
+        now = time.time()
+        full = self._last_full_scan is None or now - self._last_full_scan >= self.full_scan_interval
+        if full:
+            self._last_full_scan = now
+        if os.path.isfile(self.root):
+            candidates = [self.root]
+        else:
+            candidates = []
+            self._scan_dir(self.root, full, candidates)
+
+        ready = []
+        for path in set(candidates) | set(self._pending):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._pending.pop(path, None)
+                continue
+            current = (stat.st_size, stat.st_mtime)
+            if self.index.is_settled(path, *current, now):
+                self._pending.pop(path, None)
+                continue
+            if self._pending.get(path) == current and now - stat.st_mtime >= self.settle_seconds:
+                del self._pending[path]
+                ready.append((path, *current))
+            else:
+                self._pending[path] = current
+        return sorted(ready)
+
+
+def watch_directory(input_path: str, input_format: str, output_path: str, export_format: str, index_path: str = None,
+                    interval: float = 2.0, settle_seconds: float = 2.0, full_scan_interval: float = 60.0,
+                    rotate_rows: int = None, rotate_seconds: float = None, max_files_per_batch: int = 100,
+                    max_attempts: int = 3, retry_backoff: float = 300.0, stop_event=None, **process_options):
+    """
+    Runs until interrupted (or stop_event is set), extracting new and changed files under
+    input_path as they arrive. Rows are appended to rolling output files named like the
+    output of `damon process`, rolled over after rotate_rows rows or rotate_seconds.
+    Processed files are recorded in a persisted index, so a restart does not redo them.
+    Failed files are recorded there too and retried after retry_backoff seconds (doubling),
+    up to max_attempts attempts per version of the file. process_options are passed on to process_documents. With dedup_chunks or dedup_qa,
+    near-duplicates are detected across all batches of the session and listed in one
+    duplicates report, <output>_<timestamp>.duplicates.jsonl; a restart starts afresh.
+    """
+    from .core import METADATA_FIELDS, QA_SCHEMA, ROW_RANGE_FIELDS, build_output_path, get_file_parser, process_documents
+    from .dedup import DEFAULT_THRESHOLD, DUPLICATE_FIELDS, DUPLICATES_SUFFIX, NearDuplicateIndex
+    from .exporters import JsonlWriter, RollingWriter
+
+    def _is_supported(name):
+        file_ext = name.split('.')[-1].lower()
+        return (input_format == 'auto' or file_ext == input_format) and get_file_parser(file_ext) is not None
+
+    def _make_path():
+        path = build_output_path(output_path, export_format)
+        base, ext = os.path.splitext(path)
+        part = 1
+        while os.path.exists(path):
+            path = f"{base}_{part}{ext}"
+            part += 1
+        return path
+
+    index = FileIndex(index_path or default_index_path(output_path), max_attempts, retry_backoff)
+    watcher = DirectoryWatcher(input_path, _is_supported, index, settle_seconds, full_scan_interval)
+    fields = QA_SCHEMA + METADATA_FIELDS + (ROW_RANGE_FIELDS if process_options.get("csv_batch_tokens") else [])
+    writer = RollingWriter(_make_path, export_format, fields, rotate_rows, rotate_seconds)
+    threshold = process_options.get("dedup_threshold", DEFAULT_THRESHOLD)
+    chunk_dedup = NearDuplicateIndex(threshold) if process_options.get("dedup_chunks") else None
+    qa_dedup = NearDuplicateIndex(threshold) if process_options.get("dedup_qa") else None
+    duplicates_writer = None
+    if chunk_dedup is not None or qa_dedup is not None:
+        duplicates_path = os.path.splitext(build_output_path(output_path, "jsonl"))[0] + DUPLICATES_SUFFIX
+        duplicates_writer = JsonlWriter(duplicates_path, DUPLICATE_FIELDS)
+    logger.info(f"Watching {input_path} every {interval:g}s (index: {index.path})")
+    try:
+        while stop_event is None or not stop_event.is_set():
+            ready = watcher.poll()
+            for start in range(0, len(ready), max_files_per_batch):
+                batch = ready[start:start + max_files_per_batch]
+                stats = {path: (size, mtime) for path, size, mtime in batch}
+                logger.info(f"Found {len(batch)} new or changed files.")
+                process_documents(input_path, input_format, output_path=output_path, export_format=export_format,
+                                  files=[path for path, _, _ in batch], writer=writer,
+                                  on_file_done=lambda path, rows: index.record(path, *stats[path]),
+                                  on_file_failed=lambda path: index.record_failure(path, *stats[path]),
+                                  chunk_dedup=chunk_dedup, qa_dedup=qa_dedup, duplicates_writer=duplicates_writer,
+                                  **process_options)
+            writer.maybe_roll_over()
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("Stopping watch.")
+    finally:
+        writer.close()
+        index.close()
+        if duplicates_writer is not None:
+            duplicates_writer.close()
+            if duplicates_writer.rows_written:
+                logger.info(f"Listed {duplicates_writer.rows_written} near-duplicates in {duplicates_writer.path}")
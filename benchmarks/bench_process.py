@@ -0,0 +1,155 @@
+"""
+End-to-end throughput benchmark for process_documents with a local fake LLM backend.
+
+Generates (or reuses) a synthetic corpus, replaces litellm completion with FakeCompletion
+and reports files/sec, per-stage latency percentiles and peak RSS. No provider is called.
+
+    python benchmarks/bench_process.py --files 200 --latency 0.5 --concurrency 16 --parse-workers 4
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # noqa: E402
+
+import DAmon.core as core  # noqa: E402
+from corpus import KINDS, generate_corpus  # noqa: E402
+from fake_llm import FakeCompletion  # noqa: E402
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+class TimedRunTask:
+    """Wraps core.run_task to time whole extraction tasks, including cache lookups and retries."""
+
+    def __init__(self, run_task):
+        self._run_task = run_task
+        self._lock = threading.Lock()
+        self.latencies = []
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._run_task(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Existing corpus directory. Default: generate one in a temporary directory.")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean fake LLM latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Standard deviation of the fake LLM latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake LLM calls that fail.")
+    parser.add_argument("--qa-per-call", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--parse-workers", type=int, default=1)
+    parser.add_argument("--chunk-tokens", type=int, default=None)
+    parser.add_argument("--export", default="jsonl", choices=["jsonl", "csv", "parquet"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path.")
+    parser.add_argument("--verbose", action="store_true", help="Show DAmon's own log output.")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+
+    with tempfile.TemporaryDirectory(prefix="damon-bench-") as tmp:
+        corpus_dir = args.corpus
+        if corpus_dir is None:
+            corpus_dir = os.path.join(tmp, "corpus")
+            start = time.perf_counter()
+            generate_corpus(corpus_dir, args.files, args.kinds.split(","), args.pages, args.seed)
+            print(f"Generated {args.files} documents in {time.perf_counter() - start:.1f} s")
+        files = len(core.discover_files(corpus_dir, "auto"))
+
+        # litellm is still used for cost estimation; import it up front, as a real run would
+        # on its first request, so its import time does not land in the measured stages.
+        os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+        import litellm  # noqa: F401
+
+        fake = FakeCompletion(args.latency, args.jitter, args.error_rate, args.qa_per_call, args.seed)
+        core.completion = fake
+        timed_run_task = TimedRunTask(core.run_task)
+        core.run_task = timed_run_task
+
+        start = time.perf_counter()
+        metrics = core.process_documents(
+            input_path=corpus_dir,
+            input_format="auto",
+            litellm_model_name="fake/benchmark",
+            output_path=os.path.join(tmp, "out", "bench"),
+            export_format=args.export,
+            concurrency=args.concurrency,
+            chunk_tokens=args.chunk_tokens,
+            parse_workers=args.parse_workers,
+        )
+        wall = time.perf_counter() - start
+
+    summary = metrics.summary()
+    stages = {
+        "parse": percentiles(metrics.parse_latencies),
+        "extract_task": percentiles(timed_run_task.latencies),
+        "llm": percentiles(metrics.llm_latencies),
+    }
+    report = {
+        "files": files,
+        "wall_seconds": wall,
+        "files_per_second": files / wall if wall else None,
+        "llm_calls": fake.calls,
+        "llm_errors": fake.errors,
+        "stages": stages,
+        "export_seconds": summary["stages"]["export"]["total_seconds"],
+        "tokens": {"prompt": summary["totals"]["prompt_tokens"], "completion": summary["totals"]["completion_tokens"]},
+        "peak_rss_mb": peak_rss_mb(),
+        "settings": vars(args),
+    }
+
+    print(f"files: {files}  wall: {wall:.2f} s  throughput: {report['files_per_second']:.2f} files/s")
+    print(f"llm calls: {fake.calls}  errors: {fake.errors}")
+    for stage, stats in report["stages"].items():
+        if not stats["count"]:
+            continue
+        print(f"{stage:<13} n={stats['count']:<6} p50={stats['p50'] * 1000:8.1f} ms  "
+              f"p90={stats['p90'] * 1000:8.1f} ms  p99={stats['p99'] * 1000:8.1f} ms  max={stats['max'] * 1000:8.1f} ms")
+    print(f"export        total={report['export_seconds'] * 1000:8.1f} ms")
+    print(f"peak RSS: {report['peak_rss_mb']['self']:.1f} MB (parse workers: {report['peak_rss_mb']['children']:.1f} MB)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
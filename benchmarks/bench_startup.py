@@ -0,0 +1,76 @@
+"""
+CLI startup-time benchmark.
+
+Runs `damon --help` and `damon --version` in fresh interpreters and reports the median
+wall time, then checks that importing the CLI does not pull in heavy dependencies.
+Exits with status 1 when the median exceeds --max-seconds or a heavy module is imported,
+so it can guard against regressions in CI.
+
+    python benchmarks/bench_startup.py --runs 10 --max-seconds 0.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported by the commands or parsers that use them
+HEAVY_MODULES = ["litellm", "pandas", "pyarrow", "datasets", "PyPDF2", "docx", "pptx"]
+
+COMMANDS = {
+    "--help": ["-m", "DAmon.cli", "--help"],
+    "--version": ["-m", "DAmon.cli", "--version"],
+    "process --help": ["-m", "DAmon.cli", "process", "--help"],
+}
+
+
+def time_command(args: list[str], runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=REPO_ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def imported_heavy_modules() -> list[str]:
+    code = (
+        "import sys, DAmon.cli; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    return [m for m in output.split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command.")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail if any command's median exceeds this.")
+    args = parser.parse_args()
+
+    failed = False
+    for name, command in COMMANDS.items():
+        timings = time_command(command, args.runs)
+        median = statistics.median(timings)
+        print(f"damon {name:<16} median {median * 1000:8.1f} ms  min {min(timings) * 1000:8.1f} ms  ({args.runs} runs)")
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f"  FAIL: median exceeds {args.max_seconds:.3f} s")
+            failed = True
+
+    heavy = imported_heavy_modules()
+    if heavy:
+        print(f"FAIL: importing DAmon.cli loads heavy modules: {', '.join(heavy)}")
+        failed = True
+    else:
+        print("OK: importing DAmon.cli loads no heavy modules")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Synthetic document corpora for the benchmarks.
+
+    python benchmarks/corpus.py --out /tmp/damon-corpus --files 200 --kinds csv,pdf,docx,pptx --pages 5
+"""
+import argparse
+import csv
+import os
+import random
+
+WORDS = (
+    "machine operator safety voltage cable maintenance filter pressure valve sensor "
+    "temperature calibration inspection manual warning procedure motor pump coolant "
+    "panel switch emergency stop lubrication schedule torque alarm reset module"
+).split()
+
+KINDS = ["csv", "pdf", "docx", "pptx"]
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def write_csv(path: str, rng: random.Random, pages: int):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "component", "description"])
+        for i in range(pages * 20):
+            writer.writerow([i, rng.choice(WORDS), _sentence(rng)])
+
+
+def write_pdf(path: str, rng: random.Random, pages: int):
+    """Writes a minimal text PDF by hand so that no PDF-writing dependency is needed."""
+    objects = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for _ in range(pages):
+        lines = [_sentence(rng, 10) for _ in range(30)]
+        text_ops = " ".join(f"({line}) Tj 0 -14 Td" for line in lines)
+        stream = f"BT /F1 10 Tf 50 780 Td {text_ops} ET".encode("latin-1")
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects.append((content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+        objects.append((page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode("latin-1")))
+        page_ids.append(page_id)
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects = [
+        (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("latin-1")),
+        (font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"),
+    ] + objects
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n" % obj_id + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in range(1, len(objects) + 1):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path: str, rng: random.Random, pages: int):
+    from docx import Document
+    document = Document()
+    for _ in range(pages * 4):
+        document.add_paragraph(_paragraph(rng))
+    document.save(path)
+
+
+def write_pptx(path: str, rng: random.Random, pages: int):
+    from pptx import Presentation
+    from pptx.util import Inches
+    presentation = Presentation()
+    for _ in range(pages):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = _sentence(rng, 5)
+        body = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(8), Inches(4))
+        body.text_frame.text = _paragraph(rng, 3)
+    presentation.save(path)
+
+
+WRITERS = {
+    "csv": write_csv,
+    "pdf": write_pdf,
+    "docx": write_docx,
+    "pptx": write_pptx,
+}
+
+
+def generate_corpus(out_dir: str, files: int, kinds=KINDS, pages: int = 3, seed: int = 0) -> list[str]:
+    """Writes `files` documents cycling through `kinds` and returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        path = os.path.join(out_dir, f"doc_{i:05d}.{kind}")
+        WRITERS[kind](path, rng, pages)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="Directory to write the corpus to.")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--kinds", default=",".join(KINDS), help="Comma-separated file kinds.")
+    parser.add_argument("--pages", type=int, default=3, help="Pages, slides or page-equivalents per document.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.out, args.files, args.kinds.split(","), args.pages, args.seed)
+    print(f"Wrote {len(paths)} documents to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Local stand-in for litellm.completion used by the benchmarks.
+
+FakeCompletion returns valid Q&A JSON after a configurable latency (with jitter) and fails
+a configurable fraction of calls with a rate-limit style error, without any network access.
+"""
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeRateLimitError(Exception):
+    """Error raised for simulated failures; looks like a provider 429."""
+
+    status_code = 429
+
+
+class FakeCompletion:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, error_rate: float = 0.0,
+                 qa_per_call: int = 3, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.qa_per_call = qa_per_call
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.latencies = []
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            fail = self._random.random() < self.error_rate
+        return delay, fail
+
+    def __call__(self, model=None, messages=None, **kwargs):
+        delay, fail = self._draw()
+        start = time.perf_counter()
+        time.sleep(delay)
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(time.perf_counter() - start)
+            if fail:
+                self.errors += 1
+        if fail:
+            raise FakeRateLimitError("Simulated rate limit from fake LLM backend")
+
+        prompt = messages[-1]["content"]
+        qa_pairs = [
+            {
+                "question": f"Synthetic question {i + 1}?",
+                "thought": f"Derived from a prompt of {len(prompt)} characters.",
+                "answer": f"Synthetic answer {i + 1}.",
+            }
+            for i in range(self.qa_per_call)
+        ]
+        content = json.dumps(qa_pairs, ensure_ascii=False)
+        usage = SimpleNamespace(
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=len(content) // 4,
+            total_tokens=len(prompt) // 4 + len(content) // 4,
+        )
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage=usage,
+        )
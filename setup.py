@@ -13,8 +13,9 @@ setup(
         'PyPDF2>=3.0.1,<4.0',
         'python-docx>=1.1.0,<2.0',
         'python-pptx>=0.6.23,<1.0',
-        'pandas>=2.2.2,<3.0',
-        
+        'pyarrow>=14.0.0',
+        'huggingface_hub>=0.20.0,<2.0',
+        'numpy>=1.22',
         'loguru>=0.7.2,<1.0',
         'tenacity>=8.2.3,<9.0',
         'tqdm>=4.66.4,<5.0',
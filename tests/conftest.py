@@ -0,0 +1,79 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# litellm is only used offline by the tests: no remote model price map
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DOCS_DIR = os.path.join(FIXTURES_DIR, "docs")
+
+
+def qa_pair(question: str, answer: str = "See the manual.") -> dict:
+    return {"question": question, "thought": f"The text answers: {question}", "answer": answer}
+
+
+class FakeStream:
+    """A streamed completion that sends content in chunks; sent counts the characters sent."""
+
+    def __init__(self, content: str, chunk_size: int, fail_after: int = None):
+        self.content = content
+        self.chunk_size = chunk_size
+        self.fail_after = fail_after
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        while self.sent < len(self.content) and not self.closed:
+            if self.fail_after is not None and self.sent >= self.fail_after:
+                raise ConnectionResetError("Connection reset by peer")
+            end = self.sent + self.chunk_size
+            if self.fail_after is not None and self.sent < self.fail_after:
+                end = min(end, self.fail_after)
+            delta = self.content[self.sent:end]
+            self.sent += len(delta)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_completion(monkeypatch):
+    """
+    Replaces the LLM call with a local stand-in. By default it answers every prompt with the
+    same two Q&A pairs; set its "answer" attribute to a function of the prompt that returns
+    the answer text instead. Usage is reported as a token per 4 characters. The prompts it
+    received are kept in its "prompts" attribute.
+
+    With stream=True, the answer is sent as chunks of "chunk_size" characters; if "fail_after"
+    is set, the stream raises ConnectionResetError once that many characters were sent. The
+    streams it returned are kept in its "streams" attribute.
+    """
+    import DAmon.core as core
+
+    prompts = []
+    streams = []
+
+    def _completion(model=None, messages=None, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        prompts.append(prompt)
+        if _completion.answer is not None:
+            content = _completion.answer(prompt)
+        else:
+            content = json.dumps([qa_pair("Who makes electrical connections?"), qa_pair("How often is the filter cleaned?")])
+        if stream:
+            streams.append(FakeStream(content, _completion.chunk_size, _completion.fail_after))
+            return streams[-1]
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+    _completion.prompts = prompts
+    _completion.streams = streams
+    _completion.answer = None
+    _completion.chunk_size = 8
+    _completion.fail_after = None
+    monkeypatch.setattr(core, "completion", _completion)
+    return _completion
@@ -0,0 +1,90 @@
+import glob
+import json
+import os
+
+from DAmon.batch import parse_batch_result, read_manifest
+from DAmon.core import ingest_batch_results, process_documents
+
+from conftest import DOCS_DIR, qa_pair
+
+MODEL = "openai/gpt-4o-mini"
+
+
+def _submit(tmp_path, batch_format="openai"):
+    requests_path = str(tmp_path / "batch" / "requests.jsonl")
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "out" / "qa"), "jsonl", num_qa_pairs=2,
+                      batch_submit_path=requests_path, batch_format=batch_format)
+    with open(requests_path, encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f]
+    return requests_path, requests, read_manifest(str(tmp_path / "batch" / "requests.manifest.jsonl"))
+
+
+def _openai_result(custom_id: str, content: str) -> dict:
+    return {
+        "custom_id": custom_id,
+        "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50},
+        }},
+        "error": None,
+    }
+
+
+def test_submit_writes_one_request_per_document(tmp_path):
+    requests_path, requests, manifest = _submit(tmp_path)
+
+    assert len(requests) == 2
+    assert all(request["body"]["model"] == "gpt-4o-mini" for request in requests)
+    assert [entry["custom_id"] for entry in manifest] == [request["custom_id"] for request in requests]
+    assert {os.path.basename(entry["file_path"]) for entry in manifest} == {"faq.csv", "manual.csv"}
+    # Nothing is exported by a batch submission
+    assert not os.path.exists(tmp_path / "out")
+
+
+def test_ingest_round_trip_repairs_fenced_and_truncated_results(tmp_path):
+    requests_path, requests, manifest = _submit(tmp_path)
+    by_file = {os.path.basename(entry["file_path"]): entry["custom_id"] for entry in manifest}
+    fenced = "```json\n" + json.dumps([qa_pair("Q1?"), qa_pair("Q2?"), qa_pair("Q3?")]) + "\n```"
+    truncated = json.dumps([qa_pair("Warranty?"), qa_pair("Spare parts?")])[:-40]
+    results_path = tmp_path / "batch" / "results.jsonl"
+    with open(results_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(_openai_result(by_file["manual.csv"], fenced)) + "\n")
+        f.write(json.dumps(_openai_result(by_file["faq.csv"], truncated)) + "\n")
+        f.write(json.dumps(_openai_result("damon-unknown", "[]")) + "\n")
+
+    metrics = ingest_batch_results(str(results_path), str(tmp_path / "batch" / "requests.manifest.jsonl"),
+                                   str(tmp_path / "out" / "qa"), "jsonl")
+
+    [output_path] = glob.glob(str(tmp_path / "out" / "qa_*.jsonl"))
+    with open(output_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    questions = {row["filename"]: [] for row in rows}
+    for row in rows:
+        questions[row["filename"]].append(row["question"])
+    # The fenced answer is truncated to --num-qa, the cut-off one keeps its complete pair
+    assert questions == {"manual.csv": ["Q1?", "Q2?"], "faq.csv": ["Warranty?"]}
+    assert all(row["model"] == MODEL for row in rows)
+    assert metrics.summary()["totals"]["llm_errors"] == 0
+
+
+def test_ingest_reports_failed_and_missing_results(tmp_path):
+    requests_path, requests, manifest = _submit(tmp_path)
+    results_path = tmp_path / "batch" / "results.jsonl"
+    with open(results_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"custom_id": manifest[0]["custom_id"], "response": {"status_code": 500, "body": {}},
+                            "error": None}) + "\n")
+
+    metrics = ingest_batch_results(str(results_path), str(tmp_path / "batch" / "requests.manifest.jsonl"),
+                                   str(tmp_path / "out" / "qa"), "jsonl")
+
+    assert metrics.summary()["totals"]["llm_errors"] == 2
+    assert glob.glob(str(tmp_path / "out" / "qa_*.jsonl")) == []
+
+
+def test_parse_anthropic_result():
+    record = {"custom_id": "damon-1", "result": {"type": "succeeded", "message": {
+        "content": [{"type": "text", "text": "[]"}], "usage": {"input_tokens": 7, "output_tokens": 3}}}}
+    assert parse_batch_result(record) == {"custom_id": "damon-1", "content": "[]", "prompt_tokens": 7,
+                                          "completion_tokens": 3, "error": None}
+    failed = parse_batch_result({"custom_id": "damon-2", "result": {"type": "expired"}})
+    assert failed["error"] == "expired"
@@ -0,0 +1,126 @@
+import csv
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from DAmon.exporters import RollingWriter, open_writer
+
+FIELDS = ["question", "answer", "page_number"]
+
+
+def _rows(n, start=0):
+    return [{"question": f"Q{i}?", "answer": f"A{i}.", "page_number": i} for i in range(start, start + n)]
+
+
+def _read(path, export_format):
+    if export_format == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    if export_format == "csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            return [{**row, "page_number": int(row["page_number"])} for row in csv.DictReader(f)]
+    return pq.read_table(path).to_pylist()
+
+
+@pytest.mark.parametrize("export_format", ["jsonl", "csv", "parquet"])
+def test_writer_appends_rows_across_writes(tmp_path, export_format):
+    path = tmp_path / "out" / f"qa.{export_format}"
+    with open_writer(str(path), export_format, FIELDS) as writer:
+        writer.write(_rows(2))
+        writer.write([])
+        writer.write(_rows(3, start=2))
+
+    assert writer.rows_written == 5
+    assert _read(str(path), export_format) == _rows(5)
+    assert writer.files_since(0) == [str(path)]
+    assert writer.files_since(5) == []
+
+
+@pytest.mark.parametrize("export_format", ["jsonl", "csv", "parquet"])
+def test_writer_without_rows_leaves_no_file(tmp_path, export_format):
+    path = tmp_path / f"qa.{export_format}"
+    with open_writer(str(path), export_format, FIELDS) as writer:
+        writer.write([])
+    assert not path.exists()
+
+
+def test_parquet_writer_stores_unexpected_types_as_text(tmp_path):
+    path = tmp_path / "qa.parquet"
+    with open_writer(str(path), "parquet", FIELDS) as writer:
+        writer.write([{"question": "Q?", "answer": ["a", "b"], "page_number": None, "extra": 1}])
+    assert pq.read_table(str(path)).to_pylist() == [{"question": "Q?", "answer": '["a", "b"]', "page_number": None}]
+
+
+def test_unknown_export_format():
+    with pytest.raises(ValueError):
+        open_writer("qa.xml", "xml", FIELDS)
+
+
+@pytest.fixture
+def make_path(tmp_path):
+    paths = []
+
+    def _make_path():
+        paths.append(str(tmp_path / f"qa_{len(paths)}.jsonl"))
+        return paths[-1]
+
+    _make_path.paths = paths
+    return _make_path
+
+
+def test_rolling_writer_splits_rows_at_max_rows(make_path):
+    writer = RollingWriter(make_path, "jsonl", FIELDS, max_rows=3)
+    writer.write(_rows(2))
+    writer.write(_rows(5, start=2))  # fills the first file, then one full file and one row
+    writer.close()
+
+    assert writer.rows_written == 7
+    assert writer.files_written == make_path.paths
+    assert [len(_read(path, "jsonl")) for path in make_path.paths] == [3, 3, 1]
+    assert [row for path in make_path.paths for row in _read(path, "jsonl")] == _rows(7)
+
+
+def test_rolling_writer_files_since(make_path):
+    writer = RollingWriter(make_path, "jsonl", FIELDS, max_rows=3)
+    writer.write(_rows(3))
+    assert writer.files_since(0) == make_path.paths[:1]
+    # The next row starts a new file only when it is written
+    assert writer.files_since(3) == []
+    writer.write(_rows(4, start=3))
+    writer.close()
+
+    assert writer.files_since(0) == make_path.paths
+    assert writer.files_since(2) == make_path.paths
+    assert writer.files_since(3) == make_path.paths[1:]
+    assert writer.files_since(6) == make_path.paths[2:]
+    assert writer.files_since(7) == []
+
+
+def test_rolling_writer_path_has_no_side_effects(make_path):
+    writer = RollingWriter(make_path, "jsonl", FIELDS, max_rows=2)
+    assert writer.path is None
+    assert make_path.paths == []
+    writer.write(_rows(2))
+    assert writer.path == make_path.paths[0]
+    writer.maybe_roll_over()
+    assert writer.path is None
+    writer.close()
+    assert make_path.paths == writer.files_written == [make_path.paths[0]]
+
+
+def test_rolling_writer_rolls_over_by_age(make_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("DAmon.exporters.time.monotonic", lambda: now[0])
+    writer = RollingWriter(make_path, "jsonl", FIELDS, max_seconds=60)
+    writer.write(_rows(1))
+    now[0] += 59
+    writer.maybe_roll_over()
+    assert writer.files_written == []
+    now[0] += 1
+    writer.maybe_roll_over()
+    assert writer.files_written == make_path.paths[:1]
+    # An empty file is never rolled over
+    writer.maybe_roll_over()
+    writer.close()
+    assert writer.files_written == make_path.paths[:1]
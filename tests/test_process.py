@@ -0,0 +1,191 @@
+import csv
+import glob
+import hashlib
+import json
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from DAmon.core import METADATA_FIELDS, QA_SCHEMA, iter_csv_batch_tasks, process_documents, spread_num_qa
+from DAmon.planning import RunPlan
+
+from conftest import DOCS_DIR, qa_pair
+
+MODEL = "openai/gpt-4o-mini"
+
+
+def _output(directory, name, export_format="jsonl"):
+    [path] = [p for p in glob.glob(os.path.join(str(directory), f"{name}_*.{export_format}"))
+              if not p.endswith(".duplicates.jsonl")]
+    return path
+
+
+def _jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _md5(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_parquet_export(tmp_path, fake_completion):
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "qa"), "parquet", num_qa_pairs=2)
+
+    table = pq.read_table(_output(tmp_path, "qa", "parquet"))
+    assert table.column_names == QA_SCHEMA + METADATA_FIELDS
+    assert table.column("filename").to_pylist() == ["faq.csv", "faq.csv", "manual.csv", "manual.csv"]
+    assert len(fake_completion.prompts) == 2
+
+
+def test_csv_export_with_concurrency(tmp_path, fake_completion):
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "qa"), "csv", num_qa_pairs=2, concurrency=4)
+
+    with open(_output(tmp_path, "qa", "csv"), encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    assert reader.fieldnames == QA_SCHEMA + METADATA_FIELDS
+    # Rows keep the input order whatever order the requests finish in
+    assert [row["filename"] for row in rows] == ["faq.csv", "faq.csv", "manual.csv", "manual.csv"]
+
+
+@pytest.mark.parametrize("num_qa_pairs, parts, shares", [
+    (6, 3, [2, 2, 2]),
+    (7, 3, [3, 2, 2]),
+    (2, 5, [1, 0, 1, 0, 0]),
+    (1, 4, [1, 0, 0, 0]),
+])
+def test_spread_num_qa(num_qa_pairs, parts, shares):
+    assert spread_num_qa(num_qa_pairs, parts) == shares
+
+
+def test_num_qa_is_spread_over_chunks(tmp_path, fake_completion):
+    metrics = process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "qa"), "jsonl", num_qa_pairs=1, chunk_tokens=20)
+
+    assert metrics.summary()["totals"]["chunks"] > 2
+    rows = _jsonl(_output(tmp_path, "qa"))
+    assert [row["filename"] for row in rows] == ["faq.csv", "manual.csv"]
+    # Only the first chunk of each file has a share of the single pair requested, so only it is sent
+    assert len(fake_completion.prompts) == 2
+
+
+def test_resume_skips_journaled_files(tmp_path, fake_completion):
+    journal_path = str(tmp_path / "qa.journal.jsonl")
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "first" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path)
+    first = _jsonl(_output(tmp_path / "first", "qa"))
+    assert len(fake_completion.prompts) == 2
+
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "resumed" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path, resume=True)
+    assert len(fake_completion.prompts) == 2
+    assert _jsonl(_output(tmp_path / "resumed", "qa")) == first
+
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "incremental" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path, incremental=True)
+    assert len(fake_completion.prompts) == 2
+    assert not os.path.exists(tmp_path / "incremental")
+
+
+def test_resume_reruns_files_after_settings_change(tmp_path, fake_completion):
+    journal_path = str(tmp_path / "qa.journal.jsonl")
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "first" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path)
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "resumed" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path, resume=True, prompt_template="Write {num_qa_str} pairs about {extracted_text}")
+    assert len(fake_completion.prompts) == 4
+
+
+def test_dry_run_writes_nothing(tmp_path, fake_completion):
+    journal_path = str(tmp_path / "qa.journal.jsonl")
+    cache_path = str(tmp_path / "cache.sqlite")
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "first" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path, cache_path=cache_path)
+    before = sorted(os.listdir(tmp_path)), _md5(journal_path), _md5(cache_path)
+
+    plan = RunPlan([(MODEL, 1.0)])
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "planned" / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=journal_path, cache_path=cache_path, chunk_tokens=20, plan=plan)
+
+    assert (sorted(os.listdir(tmp_path)), _md5(journal_path), _md5(cache_path)) == before
+    assert len(fake_completion.prompts) == 2
+    totals = plan.summary()["totals"]
+    assert totals["files"] == 2
+    assert totals["requests"] == totals["chunks"] > 2
+    assert totals["prompt_tokens"] > 0
+
+
+def test_dry_run_counts_cached_chunks(tmp_path, fake_completion):
+    cache_path = str(tmp_path / "cache.sqlite")
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "first" / "qa"), "jsonl", num_qa_pairs=2,
+                      cache_path=cache_path)
+
+    plan = RunPlan([(MODEL, 1.0)])
+    process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "planned" / "qa"), "jsonl", num_qa_pairs=2,
+                      cache_path=cache_path, plan=plan)
+    totals = plan.summary()["totals"]
+    assert (totals["requests"], totals["cached_chunks"]) == (0, 2)
+
+
+def test_dry_run_and_batch_submit_are_exclusive(tmp_path):
+    with pytest.raises(ValueError):
+        process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "qa"), "jsonl", plan=RunPlan([(MODEL, 1.0)]),
+                          batch_submit_path=str(tmp_path / "requests.jsonl"))
+
+
+def test_packed_usage_is_attributed_to_source_files(tmp_path, fake_completion):
+    fake_completion.answer = lambda prompt: json.dumps([{**qa_pair("Q1?"), "source": 1}, {**qa_pair("Q2?"), "source": 2}])
+    metrics = process_documents(DOCS_DIR, "auto", MODEL, str(tmp_path / "qa"), "jsonl", num_qa_pairs=1, pack_tokens=2000)
+
+    assert len(fake_completion.prompts) == 1
+    summary = metrics.summary()
+    files = {os.path.basename(path): stats for path, stats in summary["files"].items()}
+    assert all(files[name]["llm_calls"] == 1 for name in ("faq.csv", "manual.csv"))
+    assert 0 < files["faq.csv"]["prompt_tokens"] < files["manual.csv"]["prompt_tokens"]
+    total = summary["totals"]["prompt_tokens"]
+    assert total == len(fake_completion.prompts[0]) // 4
+    assert abs(files["faq.csv"]["prompt_tokens"] + files["manual.csv"]["prompt_tokens"] - total) <= 1
+
+
+def _write_large_csv(path, rows=2000):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "text"])
+        for i in range(1, rows + 1):
+            writer.writerow([i, f"Record {i}: the pump at station {i % 37} was inspected and its seals replaced."])
+
+
+def test_csv_batches_only_cost_the_requested_pairs(tmp_path, fake_completion):
+    _write_large_csv(tmp_path / "export.csv")
+    process_documents(str(tmp_path / "export.csv"), "auto", MODEL, str(tmp_path / "out" / "qa"), "jsonl", num_qa_pairs=2,
+                      csv_batch_tokens=200)
+
+    assert len(fake_completion.prompts) == 2
+    rows = _jsonl(_output(tmp_path / "out", "qa"))
+    assert len(rows) == 2
+    # The two pairs come from the start and the middle of the file, not both from the first batch
+    assert rows[0]["row_start"] == 1
+    assert rows[1]["row_start"] > 900
+
+
+def test_csv_batch_shares(tmp_path, monkeypatch):
+    _write_large_csv(tmp_path / "export.csv", rows=100)
+    path = str(tmp_path / "export.csv")
+
+    tasks = list(iter_csv_batch_tasks(path, 200))
+    assert all(task["num_qa_pairs"] is None for task in tasks)
+    assert [task["is_last"] for task in tasks] == [False] * (len(tasks) - 1) + [True]
+    batches = len(tasks)
+
+    tasks = list(iter_csv_batch_tasks(path, 200, num_qa_pairs=batches * 3))
+    assert len(tasks) == batches
+    assert sum(task["num_qa_pairs"] for task in tasks) == batches * 3
+
+    # The file has fewer batches than the size suggests: the last batch gets the rest of the quota
+    monkeypatch.setattr("DAmon.core.os.path.getsize", lambda _: 100 * 800 * batches)
+    tasks = list(iter_csv_batch_tasks(path, 200, num_qa_pairs=batches * 3))
+    assert sum(task["num_qa_pairs"] for task in tasks) == batches * 3
+    assert tasks[-1]["is_last"] and tasks[-1]["chunk"]["row_end"] == 100
+    assert all(task["num_qa_pairs"] > 0 for task in tasks)
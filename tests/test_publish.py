@@ -0,0 +1,76 @@
+import glob
+import json
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from DAmon.core import METADATA_FIELDS, QA_SCHEMA, process_documents
+from DAmon.publish import collect_data_files, push_files_to_hub
+from DAmon.watch import FileIndex, default_index_path
+
+from conftest import DOCS_DIR
+
+MODEL = "openai/gpt-4o-mini"
+
+
+@pytest.fixture
+def output_dir(tmp_path, fake_completion):
+    """A run output directory with the sidecar files that sit next to the data files."""
+    out = tmp_path / "out"
+    process_documents(DOCS_DIR, "auto", MODEL, str(out / "qa"), "jsonl", num_qa_pairs=2,
+                      journal_path=str(out / "qa.journal.jsonl"), dedup_qa=True)
+    process_documents(DOCS_DIR, "auto", MODEL, str(out / "qa"), "jsonl", num_qa_pairs=2,
+                      batch_submit_path=str(out / "requests.jsonl"))
+    index = FileIndex(default_index_path(str(out / "qa")))
+    index.record(os.path.join(DOCS_DIR, "faq.csv"), 10, 0.0)
+    index.close()
+    return out
+
+
+def _rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_collect_skips_sidecars(output_dir):
+    [data_file] = [path for path in glob.glob(str(output_dir / "qa_*.jsonl")) if not path.endswith(".duplicates.jsonl")]
+    assert glob.glob(str(output_dir / "*.duplicates.jsonl"))
+    assert os.path.exists(output_dir / "qa.journal.jsonl")
+    assert os.path.exists(output_dir / "qa.index.jsonl")
+    assert os.path.exists(output_dir / "requests.manifest.jsonl")
+
+    assert collect_data_files(str(output_dir)) == [data_file]
+
+
+def test_local_hub_publish(output_dir, tmp_path):
+    [data_file] = collect_data_files(str(output_dir))
+    hub = tmp_path / "hub"
+
+    shards = push_files_to_hub(str(output_dir), "me/qa", local_hub=str(hub))
+
+    assert shards == sorted(os.listdir(hub / "me" / "qa" / "data"))
+    table = pq.read_table(str(hub / "me" / "qa" / "data"))
+    rows = _rows(data_file)
+    # Only the data file's columns: nothing from the journal, index, manifest or requests file
+    assert table.column_names == list(rows[0])
+    assert set(table.column_names) <= set(QA_SCHEMA + METADATA_FIELDS)
+    assert table.num_rows == len(rows)
+    assert set(table.column("model").to_pylist()) == {MODEL}
+
+
+def test_local_hub_publish_replaces_split(output_dir, tmp_path):
+    hub = tmp_path / "hub"
+    push_files_to_hub(str(output_dir), "me/qa", local_hub=str(hub))
+    push_files_to_hub(str(output_dir), "me/qa", local_hub=str(hub))
+
+    table = pq.read_table(str(hub / "me" / "qa" / "data"))
+    assert table.num_rows == len(_rows(collect_data_files(str(output_dir))[0]))
+
+
+def test_incompatible_schema_is_rejected(output_dir, tmp_path):
+    with open(output_dir / "stray.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"question": "Q?", "score": 3}) + "\n")
+
+    with pytest.raises(ValueError, match="incompatible"):
+        push_files_to_hub(str(output_dir), "me/qa", local_hub=str(tmp_path / "hub"))
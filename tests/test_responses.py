@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from DAmon.core import request_qa_pairs
+from DAmon.responses import IncompleteStreamError, InvalidResponseError, QAStream, parse_qa_json
+
+from conftest import qa_pair
+
+MODEL = "openai/gpt-4o-mini"
+PAIRS = [qa_pair("Who makes electrical connections?"), qa_pair("How often is the filter cleaned?")]
+ARRAY = json.dumps(PAIRS)
+# Cut off in the middle of the second pair, as by the max token limit
+TRUNCATED = ARRAY[:ARRAY.index('"answer"', ARRAY.index("filter"))]
+
+
+@pytest.mark.parametrize("content, expected", [
+    (ARRAY, PAIRS),
+    (json.dumps(PAIRS[0]), PAIRS[:1]),
+    (json.dumps({"qa_pairs": PAIRS}), PAIRS),
+    (f"```json\n{ARRAY}\n```", PAIRS),
+    (f"```\n{ARRAY}\n```", PAIRS),
+    (f"```json\n{ARRAY}", PAIRS),
+    (f"Here are the pairs you asked for:\n{ARRAY}\nLet me know if you need more.", PAIRS),
+    (TRUNCATED, PAIRS[:1]),
+    (f"```json\n{TRUNCATED}", PAIRS[:1]),
+    ('{"qa_pairs": ' + TRUNCATED, PAIRS[:1]),
+    # Brackets and escaped quotes inside strings do not confuse the repair
+    (json.dumps([qa_pair('Is "[x]" a {placeholder}?'), qa_pair("Next?")])[:-30],
+     [qa_pair('Is "[x]" a {placeholder}?')]),
+], ids=["array", "single-pair", "wrapper", "fenced", "fenced-no-language", "unclosed-fence", "prose", "truncated",
+        "fenced-truncated", "wrapper-truncated", "brackets-in-strings"])
+def test_parse_qa_json(content, expected):
+    assert parse_qa_json(content) == expected
+
+
+@pytest.mark.parametrize("content", [
+    None,
+    "",
+    "I cannot answer that.",
+    '[{"question": "Cut off before any pair was complete',
+    '{"question": "Q?", "answer": "A."}',
+    '{"a": [1], "b": [2]}',
+    "42",
+], ids=["none", "empty", "prose-only", "no-complete-pair", "incomplete-pair", "ambiguous-wrapper", "scalar"])
+def test_parse_qa_json_rejects_unrepairable(content):
+    with pytest.raises(InvalidResponseError):
+        parse_qa_json(content)
+
+
+def _tagged(pairs):
+    return [dict(qa, model=MODEL) for qa in pairs]
+
+
+def _stream(fake_completion, content, chunk_size=8):
+    fake_completion.answer = lambda prompt: content
+    fake_completion.chunk_size = chunk_size
+    return QAStream(fake_completion(model=MODEL, messages=[{"role": "user", "content": "prompt"}], stream=True), MODEL)
+
+
+@pytest.mark.parametrize("content", [ARRAY, json.dumps({"qa_pairs": PAIRS})], ids=["array", "wrapper"])
+def test_stream_yields_each_pair_as_it_completes(fake_completion, content):
+    qa_stream = _stream(fake_completion, content)
+    pairs = iter(qa_stream)
+
+    assert next(pairs) == _tagged(PAIRS)[0]
+    # The first pair is used before the second has been generated
+    assert fake_completion.streams[-1].sent < len(content)
+    assert list(pairs) == _tagged(PAIRS)[1:]
+    assert qa_stream.content == content
+    assert not qa_stream.stopped_early and not qa_stream.broken
+
+
+@pytest.mark.parametrize("content", [
+    json.dumps(dict(qa_pair("Which parts are covered?"), sources=["manual.csv", "faq.csv"])),
+    json.dumps(dict(sources=[["manual.csv", 2]], **qa_pair("Which parts are covered?"))),
+], ids=["array-field-last", "array-field-first"])
+def test_stream_single_pair_with_array_fields(fake_completion, content):
+    qa_stream = _stream(fake_completion, content)
+
+    assert list(qa_stream) == [dict(json.loads(content), model=MODEL)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_stream_escaped_quotes_and_brackets_in_strings(fake_completion, chunk_size):
+    pairs = [qa_pair('Is "[x]" a {placeholder}?', 'Yes: "}]" and \\ are text.'), qa_pair("Next?")]
+    content = json.dumps({"qa_pairs": pairs})
+
+    assert list(_stream(fake_completion, content, chunk_size)) == _tagged(pairs)
+
+
+def test_stream_stops_at_max_pairs(fake_completion):
+    pairs = PAIRS + [qa_pair("Where is the warranty card?")]
+    fake_completion.answer = lambda prompt: json.dumps(pairs)
+
+    qa_pairs, _ = request_qa_pairs(MODEL, "prompt", stream=True, max_pairs=1)
+
+    assert qa_pairs == _tagged(pairs[:1])
+    stream = fake_completion.streams[-1]
+    assert stream.closed
+    assert stream.sent < len(stream.content)
+
+
+def test_stream_broken_after_some_pairs(fake_completion):
+    pairs = PAIRS + [qa_pair("Where is the warranty card?")]
+    fake_completion.answer = lambda prompt: json.dumps(pairs)
+    # The stream breaks off right after the second pair
+    fake_completion.fail_after = len(json.dumps(pairs[:2])) - 1
+
+    with pytest.raises(IncompleteStreamError) as raised:
+        request_qa_pairs(MODEL, "prompt", stream=True)
+
+    assert raised.value.qa_pairs == _tagged(pairs[:2])
+    assert fake_completion.streams[-1].closed
+
+
+def test_stream_broken_before_any_pair(fake_completion):
+    fake_completion.fail_after = ARRAY.index("thought")
+
+    with pytest.raises(ConnectionResetError):
+        request_qa_pairs(MODEL, "prompt", stream=True)
+
+    assert fake_completion.streams[-1].closed
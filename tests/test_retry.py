@@ -0,0 +1,116 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from DAmon.responses import IncompleteStreamError, InvalidResponseError
+from DAmon.retry import CircuitBreaker, is_retryable, is_saturation, retry_after_seconds
+
+
+class ProviderError(Exception):
+    """Stand-in for a litellm/httpx error: a status code and the response headers."""
+
+    def __init__(self, status_code=None, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("DAmon.retry.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_escalates_once_per_burst(clock):
+    breaker = CircuitBreaker(base_cooldown=2.0, max_cooldown=120.0)
+    sent_at = clock[0] - 0.5
+    # 16 requests in flight are throttled together
+    for _ in range(16):
+        breaker.trip(sent_at=sent_at)
+    assert breaker.remaining() == 2.0
+
+    # A request of the same burst that only fails after the pause does not escalate either
+    clock[0] += 3
+    breaker.trip(sent_at=sent_at)
+    assert breaker.remaining() == 0
+
+    # A request sent after the breaker closed is a new trip: the cooldown doubles
+    breaker.trip(sent_at=clock[0])
+    assert breaker.remaining() == 4.0
+
+
+def test_breaker_honours_longer_retry_after_while_open(clock):
+    breaker = CircuitBreaker(base_cooldown=2.0)
+    breaker.trip()
+    breaker.trip(retry_after=1.0)
+    assert breaker.remaining() == 2.0
+    breaker.trip(retry_after=10.0)
+    assert breaker.remaining() == 10.0
+    clock[0] += 10
+    # Neither explicit hint escalated the cooldown
+    breaker.trip()
+    assert breaker.remaining() == 4.0
+
+
+def test_breaker_cooldown_is_capped_and_reset_by_success(clock):
+    breaker = CircuitBreaker(base_cooldown=2.0, max_cooldown=5.0)
+    for expected in (2.0, 4.0, 5.0, 5.0):
+        breaker.trip()
+        assert breaker.remaining() == expected
+        clock[0] += expected
+    breaker.record_success()
+    breaker.trip()
+    assert breaker.remaining() == 2.0
+
+
+@pytest.mark.parametrize("exc, retryable", [
+    (ProviderError(429), True),
+    (ProviderError(500), True),
+    (ProviderError(502), True),
+    (ProviderError(503), True),
+    (ProviderError(529), True),
+    (ProviderError(408), True),
+    (ProviderError(400), False),
+    (ProviderError(401), False),
+    (ProviderError(403), False),
+    (ProviderError(404), False),
+    (ConnectionResetError("reset by peer"), True),
+    (InvalidResponseError("not JSON"), True),
+    (IncompleteStreamError("broke off", [{}]), False),
+    (KeyError("choices"), False),
+])
+def test_is_retryable(exc, retryable):
+    assert is_retryable(exc) is retryable
+
+
+@pytest.mark.parametrize("status_code, saturated", [(429, True), (503, True), (529, True), (500, False), (400, False)])
+def test_is_saturation(status_code, saturated):
+    assert is_saturation(ProviderError(status_code)) is saturated
+
+
+@pytest.mark.parametrize("headers, seconds", [
+    ({}, None),
+    ({"Retry-After": "7"}, 7.0),
+    ({"retry-after": "1.5"}, 1.5),
+    ({"retry-after-ms": "250"}, 0.25),
+    ({"retry-after-ms": "250", "retry-after": "7"}, 0.25),
+    ({"Retry-After": "-3"}, 0.0),
+    ({"Retry-After": "soon"}, None),
+])
+def test_retry_after_seconds(headers, seconds):
+    assert retry_after_seconds(ProviderError(429, headers)) == seconds
+
+
+def test_retry_after_http_date():
+    exc = ProviderError(503, {"Retry-After": formatdate(time.time() + 30, usegmt=True)})
+    assert 25 < retry_after_seconds(exc) <= 30
+
+
+def test_retry_after_from_litellm_headers():
+    exc = ProviderError(429)
+    exc.response = None
+    exc.litellm_response_headers = {"retry-after": "4"}
+    assert retry_after_seconds(exc) == 4.0
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+from DAmon.router import Deployment, ModelRouter
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _router():
+    return ModelRouter([Deployment("openai/gpt-4o-mini", name="small"), Deployment("gemini/gemini-2.5-flash", name="large")])
+
+
+def _attempt(failures: dict):
+    calls = []
+
+    def attempt(deployment):
+        calls.append(deployment.name)
+        if deployment.name in failures:
+            raise failures[deployment.name]
+        return [deployment.name], SimpleNamespace()
+
+    attempt.calls = calls
+    return attempt
+
+
+def test_rejected_request_fails_over_to_another_deployment():
+    router = _router()
+    attempt = _attempt({"small": ProviderError(400)})
+    for _ in range(5):
+        assert router.run(attempt) == ["large"]
+    # The rejection is about the request, so the deployment is not cooled down
+    assert router.primary[0].breaker.remaining() == 0
+    assert attempt.calls.count("small") <= 5
+
+
+def test_request_rejected_everywhere_raises_after_each_deployment_tried_once():
+    attempt = _attempt({"small": ProviderError(400), "large": ProviderError(400)})
+    with pytest.raises(ProviderError):
+        _router().run(attempt)
+    assert sorted(attempt.calls) == ["large", "small"]
+
+
+def test_unavailable_deployment_fails_over():
+    router = _router()
+    attempt = _attempt({"large": ProviderError(401)})
+    assert router.run(attempt) == ["small"]
+
+
+def test_errors_no_deployment_can_fix_are_raised_immediately():
+    attempt = _attempt({"small": KeyError("choices"), "large": KeyError("choices")})
+    with pytest.raises(KeyError):
+        _router().run(attempt)
+    assert len(attempt.calls) == 1
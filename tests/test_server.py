@@ -0,0 +1,69 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from DAmon.pipeline import Pipeline
+from DAmon.server import ExtractionServer, parse_num_qa
+
+from conftest import DOCS_DIR
+
+MODEL = "openai/gpt-4o-mini"
+
+
+@pytest.fixture
+def server(fake_completion):
+    server = ExtractionServer(("127.0.0.1", 0), Pipeline(MODEL, prompt_template="{num_qa_str}\n{extracted_text}"),
+                              root=DOCS_DIR)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, body, path="/extract"):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=30)
+    try:
+        connection.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, [json.loads(line) for line in response.read().decode("utf-8").splitlines()]
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), (3, 3), ("3", 3), (" 2 ", 2),
+])
+def test_parse_num_qa(value, expected):
+    assert parse_num_qa(value) == expected
+
+
+@pytest.mark.parametrize("value", [0, -1, True, 1.5, [1], {}, "", "abc", "-1", "0"])
+def test_parse_num_qa_rejects(value):
+    with pytest.raises(ValueError, match="num_qa"):
+        parse_num_qa(value)
+
+
+@pytest.mark.parametrize("num_qa", [[1], {}, 0, -1, "two"])
+def test_invalid_num_qa_is_a_bad_request(server, fake_completion, num_qa):
+    status, [body] = _post(server, {"path": "faq.csv", "num_qa": num_qa})
+
+    assert status == 400
+    assert "num_qa" in body["error"]
+    assert fake_completion.prompts == []
+
+
+def test_invalid_num_qa_in_query_is_a_bad_request(server):
+    status, [body] = _post(server, {"path": "faq.csv"}, path="/extract?num_qa=0")
+
+    assert status == 400
+
+
+def test_extract_streams_num_qa_rows(server):
+    status, rows = _post(server, {"path": "faq.csv", "num_qa": 1})
+
+    assert status == 200
+    assert len(rows) == 1
+    assert rows[0]["filename"] == "faq.csv"
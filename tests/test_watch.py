@@ -0,0 +1,90 @@
+import json
+import shutil
+import threading
+import time
+
+from DAmon.watch import FileIndex, watch_directory
+
+from conftest import DOCS_DIR, qa_pair
+
+MODEL = "openai/gpt-4o-mini"
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def test_failed_file_backs_off_then_gives_up(tmp_path):
+    index = FileIndex(str(tmp_path / "qa.index.jsonl"), max_attempts=3, retry_backoff=10.0)
+    now = time.time()
+
+    assert index.record_failure("a.pdf", 100, 1.0) == 1
+    assert index.is_settled("a.pdf", 100, 1.0, now)
+    assert not index.is_settled("a.pdf", 100, 1.0, now + 11)
+    # The backoff doubles
+    assert index.record_failure("a.pdf", 100, 1.0) == 2
+    assert index.is_settled("a.pdf", 100, 1.0, now + 19)
+    assert not index.is_settled("a.pdf", 100, 1.0, now + 21)
+    assert index.record_failure("a.pdf", 100, 1.0) == 3
+    # Out of attempts: left alone for good, until the file changes
+    assert index.is_settled("a.pdf", 100, 1.0, now + 10 ** 6)
+    assert not index.is_settled("a.pdf", 120, 2.0, now)
+    assert index.record_failure("a.pdf", 120, 2.0) == 1
+    index.close()
+
+
+def test_index_persists_failures_and_successes(tmp_path):
+    path = str(tmp_path / "qa.index.jsonl")
+    index = FileIndex(path, max_attempts=1)
+    index.record_failure("a.pdf", 100, 1.0)
+    index.record("b.pdf", 200, 2.0)
+    index.record_failure("c.pdf", 300, 3.0)
+    index.record("c.pdf", 300, 3.0)
+    index.close()
+
+    index = FileIndex(path, max_attempts=1)
+    assert index.is_settled("a.pdf", 100, 1.0)
+    assert index.get("a.pdf") is None
+    assert index.get("b.pdf") == (200, 2.0)
+    assert index.is_settled("c.pdf", 300, 3.0)
+    index.close()
+    # Compacted to one line per file
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+
+def test_watch_stops_paying_for_a_file_that_always_fails(tmp_path, fake_completion):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    shutil.copy(f"{DOCS_DIR}/faq.csv", inbox / "faq.csv")
+    shutil.copy(f"{DOCS_DIR}/manual.csv", inbox / "manual.csv")
+
+    def _answer(prompt):
+        if "dielectric" in prompt:
+            raise BadRequest("the model rejects this document")
+        return json.dumps([qa_pair("Q?")])
+
+    fake_completion.answer = _answer
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_directory, args=(str(inbox), "auto", str(tmp_path / "out" / "qa"), "jsonl"),
+                               kwargs={"interval": 0.05, "settle_seconds": 0, "full_scan_interval": 0, "max_attempts": 2,
+                                       "retry_backoff": 0, "stop_event": stop, "litellm_model_name": MODEL})
+    watcher.start()
+
+    def _failing():
+        return [prompt for prompt in fake_completion.prompts if "dielectric" in prompt]
+
+    deadline = time.monotonic() + 30
+    while len(_failing()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # Many more polls and full scans, which must not pick the file up again
+    time.sleep(1)
+    stop.set()
+    watcher.join(10)
+
+    assert len(_failing()) == 2
+    assert len(fake_completion.prompts) == 3
+    with open(tmp_path / "out" / "qa.index.jsonl", encoding="utf-8") as f:
+        records = {json.loads(line)["path"].rsplit("/", 1)[-1]: json.loads(line) for line in f}
+    assert records["manual.csv"]["failures"] == 2 and records["manual.csv"]["retry_at"] is None
+    assert "failures" not in records["faq.csv"]